@@ -0,0 +1,492 @@
+"""
+答案等价判定 - 规范化 + 符号化简 + 随机取点数值验证
+
+标准答案每次运行只解析一次（get_checker 按标准答案缓存 AnswerChecker），
+模型答案按规范化后的字符串缓存判定结果，同一道题的多次求解中重复出现的答案不再重复计算
+
+判定结果：True（等价）/ False（不等价）/ None（无法判定，如证明题、文字叙述）
+"""
+import re
+import ast
+import math
+import random
+import threading
+import unicodedata
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+try:
+    import sympy
+    SYMPY_AVAILABLE = True
+except ImportError:
+    SYMPY_AVAILABLE = False
+
+try:
+    import numpy
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+NUMERIC_SAMPLES = 24  # 随机取点数
+MIN_VALID_SAMPLES = 6  # 有效取点（不越出定义域）少于该数时无法判定
+REL_TOLERANCE = 1e-6  # 含小数的答案（如 1.5707963 与 π/2）按该相对误差比较
+EXACT_TOLERANCE = 1e-12  # 两边都是精确写法时只容许浮点舍入误差
+DECIMAL_LITERAL = re.compile(r"\d*\.\d|\d[eE]\d")
+SYMPY_MAX_LENGTH = 200  # 超过该长度的表达式不做符号化简（避免个别输入化简过慢）
+SYMPY_MAX_OPS = 80  # 两式之差的运算数超过该值时不做 simplify，改用数值比较
+MAX_EXPONENT = 1000  # 常数指数（含嵌套乘方累积）的上限，如 10^{10^{8}} 直接视为无法解析
+
+SUPERSCRIPTS = {"⁰": "0", "¹": "1", "²": "2", "³": "3", "⁴": "4", "⁵": "5", "⁶": "6", "⁷": "7", "⁸": "8", "⁹": "9"}
+
+# LaTeX 命令 / 符号 → 表达式写法
+LATEX_REPLACEMENTS = [
+    (r"\left", ""), (r"\right", ""), (r"\displaystyle", ""),
+    (r"\cdot", "*"), (r"\times", "*"), (r"\div", "/"), (r"\pi", "pi"), (r"\infty", "oo"),
+    (r"\ln", "log"), (r"\log", "log"), (r"\exp", "exp"), (r"\arcsin", "asin"), (r"\arccos", "acos"),
+    (r"\arctan", "atan"), (r"\sin", "sin"), (r"\cos", "cos"), (r"\tan", "tan"),
+    (r"\,", ""), (r"\;", ""), (r"\!", ""), (r"\quad", ""), ("×", "*"), ("·", "*"), ("÷", "/"), ("π", "pi"),
+    ("∞", "oo"), ("√", "sqrt"), ("−", "-"),
+]
+
+FUNCTIONS = {"sin", "cos", "tan", "asin", "acos", "atan", "sqrt", "log", "exp", "abs"}
+CONSTANTS = {"pi", "e"}
+
+# 多个答案之间的分隔（顶层逗号、分号、“或”、“和”）
+ANSWER_SEPARATOR = re.compile(r"[,;]|或|和|且")
+CHOICE_PATTERN = re.compile(r"^\(?([A-Ea-e]{1,5})\)?$")
+NUMBER_OR_NAME = re.compile(r"(?:\d+\.?\d*|\.\d+)[eE]\d+(?![A-Za-z])|\d+\.?\d*|\.\d+|[A-Za-z]+|\*\*|[-+*/()]")
+# 连写字母中按最长匹配识别的函数名 / 常数（如 logx → log x、2pir → 2 pi r）
+NAMED_TOKENS = sorted(FUNCTIONS | CONSTANTS | {"oo"}, key=len, reverse=True)
+
+
+# ==================== 规范化 ====================
+
+def extract_answer(text: str) -> str:
+    """从模型输出中取出最终答案：【答案：】标记 > 答案： > \\boxed{} > 原文"""
+    if "【答案：" in text:
+        return text.split("【答案：")[-1].split("】")[0].strip()
+    if "答案：" in text:
+        return text.split("答案：")[-1].strip().split("\n")[0].strip()
+    boxed = text.rfind(r"\boxed{")
+    if boxed >= 0:
+        content = _braced(text, boxed + len(r"\boxed"))
+        if content is not None:
+            return content[0]
+    return text.strip()
+
+
+def _braced(text: str, start: int):
+    """text[start] 为 { 时返回 (括号内内容, 右括号之后的位置)，括号不匹配时返回 None"""
+    if start >= len(text) or text[start] != "{":
+        return None
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == "{":
+            depth += 1
+        elif text[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start + 1:i], i + 1
+    return None
+
+
+def _replace_latex_command(text: str, command: str, render: Callable[[List[str]], str], nargs: int) -> str:
+    """把 \\command{a}{b} 替换为 render([a, b])（支持嵌套括号）"""
+    while True:
+        index = text.find(command + "{")
+        if index < 0:
+            return text
+        position = index + len(command)
+        args = []
+        for _ in range(nargs):
+            braced = _braced(text, position)
+            if braced is None:
+                return text
+            args.append(braced[0])
+            position = braced[1]
+        text = text[:index] + render(args) + text[position:]
+
+
+def normalize_answer(answer: str) -> str:
+    """规范化答案字符串：全角转半角、去掉 LaTeX 包装与空白、统一运算符写法"""
+    # 上标数字在 NFKC 下会变成普通数字（x² → x2），先改写为乘方
+    text = "".join("^" + SUPERSCRIPTS[ch] if ch in SUPERSCRIPTS else ch for ch in answer)
+    text = unicodedata.normalize("NFKC", text)
+    text = text.replace(r"\dfrac", r"\frac").replace(r"\tfrac", r"\frac")
+    text = text.replace("$", "").replace(r"\(", "").replace(r"\)", "").replace(r"\[", "").replace(r"\]", "")
+    for command in (r"\boxed", r"\text", r"\mathrm", r"\mathbf", r"\operatorname"):
+        text = _replace_latex_command(text, command, lambda args: args[0], 1)
+    text = _replace_latex_command(text, r"\frac", lambda args: f"(({args[0]})/({args[1]}))", 2)
+    text = re.sub(r"\\sqrt\[([^\]]+)\]\{", lambda m: "\\root" + "{" + m.group(1) + "}{", text)
+    text = _replace_latex_command(text, r"\root", lambda args: f"(({args[1]})**(1/({args[0]})))", 2)
+    text = _replace_latex_command(text, r"\sqrt", lambda args: f"sqrt({args[0]})", 1)
+    for source, target in LATEX_REPLACEMENTS:
+        text = text.replace(source, target)
+    text = re.sub(r"(?<![A-Za-z])ln", "log", text)
+    text = text.replace("{", "(").replace("}", ")").replace("^", "**")
+    text = re.sub(r"\s+", "", text)
+    return text.rstrip("。.")
+
+
+# ==================== 解析与数值求值 ====================
+
+def _to_python_expression(text: str) -> Optional[str]:
+    """
+    把规范化后的答案转换为只含数字、白名单函数/常量、单字母变量和运算符的 Python 表达式
+    （补全省略的乘号，如 2x → 2*x、xy → x*y、(a)(b) → (a)*(b)）；含其他字符时返回 None
+    """
+    if not text or len(NUMBER_OR_NAME.sub("", text)) > 0:
+        return None
+    tokens = []
+    for token in NUMBER_OR_NAME.findall(text):
+        if token.isalpha():
+            tokens.extend(_split_names(token))
+        else:
+            tokens.append(token)
+
+    output = []
+    pending_call = False
+    for token in tokens:
+        if pending_call:
+            # 省略括号的函数调用（如 \ln 2、\sin x）只作用于紧随的一个数字或变量
+            output.extend(["(", token, ")"] if token != "(" else [token])
+            pending_call = False
+            continue
+        if output:
+            previous = output[-1]
+            ends_operand = previous == ")" or previous[0].isdigit() or previous[0] == "." or (
+                previous.isalpha() and previous not in FUNCTIONS
+            )
+            starts_operand = token == "(" or token[0].isdigit() or token[0] == "." or token.isalpha()
+            if ends_operand and starts_operand:
+                output.append("*")
+        output.append(token)
+        pending_call = token in FUNCTIONS
+    expression = "".join(output)
+    try:
+        _validate(ast.parse(expression, mode="eval").body)
+    except (SyntaxError, ValueError):
+        return None
+    return expression
+
+
+def _split_names(run: str) -> List[str]:
+    """连写的字母拆分为函数名 / 常数 / 单字母变量（其余字母视为多个变量相乘）"""
+    names, index = [], 0
+    while index < len(run):
+        name = next((name for name in NAMED_TOKENS if run.startswith(name, index)), run[index])
+        names.append(name)
+        index += len(name)
+    return names
+
+
+def _constant_value(node) -> Optional[float]:
+    """不含名称和函数的常数子式的浮点值（子式中已无乘方）；含名称或无法计算时返回 None"""
+    if isinstance(node, ast.Constant):
+        return float(node.value)
+    if isinstance(node, ast.UnaryOp):
+        value = _constant_value(node.operand)
+        return None if value is None else (-value if isinstance(node.op, ast.USub) else value)
+    if isinstance(node, ast.BinOp):
+        left, right = _constant_value(node.left), _constant_value(node.right)
+        if left is None or right is None:
+            return None
+        try:
+            if isinstance(node.op, ast.Add):
+                return left + right
+            if isinstance(node.op, ast.Sub):
+                return left - right
+            if isinstance(node.op, ast.Mult):
+                return left * right
+            return left / right
+        except (ZeroDivisionError, OverflowError):
+            return None
+    return None
+
+
+def _contains_pow(node) -> bool:
+    return any(isinstance(child, ast.BinOp) and isinstance(child.op, ast.Pow) for child in ast.walk(node))
+
+
+def _validate(node, scale: float = 1.0):
+    """
+    只允许四则运算、乘方、白名单函数调用、数字和名称
+
+    乘方的指数中不能再有乘方，常数指数按嵌套累积（(a^m)^n 计为 m*n）不超过 MAX_EXPONENT，
+    避免 10^{10^{8}} 之类的答案在 sympy / 整数运算中长时间计算
+    """
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+        if _contains_pow(node.right):
+            raise ValueError("指数中不支持乘方")
+        exponent = _constant_value(node.right)
+        if exponent is not None:
+            scale *= max(1.0, abs(exponent))
+            if scale > MAX_EXPONENT:
+                raise ValueError(f"指数过大: {exponent}")
+        _validate(node.left, scale)
+        _validate(node.right)
+    elif isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.Div)):
+        _validate(node.left, scale)
+        _validate(node.right, scale)
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        _validate(node.operand, scale)
+    elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS \
+            and len(node.args) == 1 and not node.keywords:
+        _validate(node.args[0], scale)
+    elif isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        pass
+    elif isinstance(node, ast.Name):
+        pass
+    else:
+        raise ValueError(f"不支持的表达式: {ast.dump(node)}")
+
+
+class _FloatConstants(ast.NodeTransformer):
+    """整数常数改为浮点数：数值求值只做浮点运算，溢出时抛出 OverflowError 而不是计算大整数"""
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, int):
+            return ast.copy_location(ast.Constant(float(node.value)), node)
+        return node
+
+
+def _variables(expression: str) -> List[str]:
+    names = {node.id for node in ast.walk(ast.parse(expression, mode="eval")) if isinstance(node, ast.Name)}
+    return sorted(names - FUNCTIONS - CONSTANTS - {"oo"})
+
+
+def _numeric_namespace():
+    if NUMPY_AVAILABLE:
+        namespace = {name: getattr(numpy, name) for name in ("sin", "cos", "tan", "sqrt", "log", "exp")}
+        namespace.update(asin=numpy.arcsin, acos=numpy.arccos, atan=numpy.arctan, abs=numpy.abs)
+        namespace.update(pi=numpy.pi, e=numpy.e, oo=numpy.inf)
+    else:
+        namespace = {name: getattr(math, name) for name in ("sin", "cos", "tan", "asin", "acos", "atan", "sqrt", "log", "exp")}
+        namespace.update(abs=abs, pi=math.pi, e=math.e, oo=math.inf)
+    return namespace
+
+
+class ParsedAnswer:
+    """解析后的单个答案：Python 表达式、变量、sympy 规范形式（可用时）"""
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.variables = _variables(expression)
+        self.has_decimal = bool(DECIMAL_LITERAL.search(expression))
+        tree = _FloatConstants().visit(ast.parse(expression, mode="eval"))
+        self._code = compile(ast.fix_missing_locations(tree), "<answer>", "eval")
+        self._symbolic = None
+        self._symbolic_parsed = False
+
+    @property
+    def symbolic(self):
+        """sympy 表达式（sympy 不可用、过长或解析失败时为 None）"""
+        if not self._symbolic_parsed:
+            self._symbolic_parsed = True
+            if SYMPY_AVAILABLE and len(self.expression) <= SYMPY_MAX_LENGTH:
+                try:
+                    # 表达式已经过白名单校验，可以安全交给 sympify
+                    self._symbolic = sympy.sympify(self.expression, locals={"e": sympy.E, "oo": sympy.oo})
+                except Exception:
+                    self._symbolic = None
+        return self._symbolic
+
+    def evaluate(self, points: Dict[str, object]):
+        """在取点处求值（numpy 可用时 points 为数组，一次求值全部点）"""
+        namespace = _numeric_namespace()
+        namespace.update(points)
+        return eval(self._code, {"__builtins__": {}}, namespace)
+
+
+def parse_answer(text: str) -> Optional[ParsedAnswer]:
+    """解析规范化后的单个答案；去掉 x= / y= / f(x)= 之类的左侧；无法解析时返回 None"""
+    if text.count("=") == 1:
+        left, right = text.split("=")
+        if re.fullmatch(r"[A-Za-z](\([A-Za-z]\))?", left):
+            text = right
+        else:
+            return None
+    elif "=" in text:
+        return None
+    expression = _to_python_expression(text)
+    return ParsedAnswer(expression) if expression else None
+
+
+def _close(a: float, b: float, tolerance: float = REL_TOLERANCE) -> bool:
+    if math.isinf(a) or math.isinf(b):
+        return a == b
+    return abs(a - b) <= tolerance * max(1.0, abs(a), abs(b))
+
+
+def _tolerance(a: "ParsedAnswer", b: "ParsedAnswer") -> float:
+    """任一边含小数时按 REL_TOLERANCE 比较，否则视为精确值（1000001 与 1000000 不等价）"""
+    return REL_TOLERANCE if a.has_decimal or b.has_decimal else EXACT_TOLERANCE
+
+
+def numeric_equivalent(a: ParsedAnswer, b: ParsedAnswer) -> Optional[bool]:
+    """在随机点上比较两个表达式的值；有效点不足时返回 None"""
+    variables = sorted(set(a.variables) | set(b.variables))
+    # 取正数区间，减少 sqrt / log 越出定义域
+    rng = random.Random(a.expression + "|" + b.expression)
+    samples = {v: [rng.uniform(0.5, 2.5) for _ in range(NUMERIC_SAMPLES)] for v in variables}
+
+    pairs = []
+    if NUMPY_AVAILABLE:
+        with numpy.errstate(all="ignore"):
+            try:
+                points = {v: numpy.array(values) for v, values in samples.items()}
+                left = numpy.broadcast_to(numpy.asarray(a.evaluate(points), dtype=complex), (NUMERIC_SAMPLES,))
+                right = numpy.broadcast_to(numpy.asarray(b.evaluate(points), dtype=complex), (NUMERIC_SAMPLES,))
+            except (TypeError, ValueError, OverflowError, ZeroDivisionError):
+                return None
+        for x, y in zip(left, right):
+            if numpy.isfinite(x) and numpy.isfinite(y) and abs(x.imag) < 1e-12 and abs(y.imag) < 1e-12:
+                pairs.append((float(x.real), float(y.real)))
+            elif numpy.isinf(x.real) and numpy.isinf(y.real):
+                pairs.append((float(x.real), float(y.real)))
+    else:
+        for i in range(NUMERIC_SAMPLES if variables else 1):
+            point = {v: values[i] for v, values in samples.items()}
+            try:
+                x, y = a.evaluate(point), b.evaluate(point)
+            except (ValueError, OverflowError, ZeroDivisionError, TypeError):
+                continue
+            if isinstance(x, complex) or isinstance(y, complex):
+                continue
+            pairs.append((float(x), float(y)))
+
+    needed = MIN_VALID_SAMPLES if variables else 1
+    if len(pairs) < needed:
+        return None
+    tolerance = _tolerance(a, b)
+    return all(_close(x, y, tolerance) for x, y in pairs)
+
+
+def expressions_equivalent(a: ParsedAnswer, b: ParsedAnswer) -> Optional[bool]:
+    """先比较 sympy 规范形式（差化简为 0 即等价），再以随机取点数值比较兜底"""
+    if a.expression == b.expression:
+        return True
+    if a.symbolic is not None and b.symbolic is not None:
+        try:
+            difference = a.symbolic - b.symbolic
+            # 运算数过多的差不做化简（simplify 可能很慢），直接数值比较
+            if sympy.count_ops(difference) <= SYMPY_MAX_OPS:
+                difference = sympy.simplify(difference)
+                if difference == 0:
+                    return True
+                if difference.is_number and difference.is_finite:
+                    # 差为非零常数：两边都是精确写法时不等价；含小数时按相对误差比较（小数近似视为等价）
+                    if not (a.has_decimal or b.has_decimal):
+                        return False
+                    if a.symbolic.is_number and b.symbolic.is_number:
+                        return _close(float(a.symbolic), float(b.symbolic))
+                    return _close(float(difference), 0.0)
+        except Exception:
+            pass
+    return numeric_equivalent(a, b)
+
+
+# ==================== 判定 ====================
+
+def _split_answers(text: str) -> List[str]:
+    """按顶层分隔符拆分多个答案（括号内的逗号不拆）"""
+    parts, depth, current = [], 0, ""
+    index = 0
+    while index < len(text):
+        ch = text[index]
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        match = ANSWER_SEPARATOR.match(text, index) if depth == 0 else None
+        if match:
+            parts.append(current)
+            current = ""
+            index = match.end()
+            continue
+        current += ch
+        index += 1
+    parts.append(current)
+    return [part for part in parts if part]
+
+
+class AnswerChecker:
+    """
+    针对一个标准答案的判定器：标准答案只解析一次，判定结果按规范化后的模型答案缓存（线程安全）
+    """
+
+    def __init__(self, gold: str):
+        self.gold = gold
+        self.normalized = normalize_answer(extract_answer(gold))
+        self.choices = self._choices(self.normalized)
+        self.parts = [(part, parse_answer(part)) for part in _split_answers(self.normalized)]
+        self._cache: Dict[str, Optional[bool]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _choices(text: str) -> Optional[set]:
+        match = CHOICE_PATTERN.match(text.replace("选", ""))
+        return set(match.group(1).upper()) if match else None
+
+    def check(self, model_answer: str) -> Optional[bool]:
+        """判定模型输出（完整输出或已提取的答案均可）是否与标准答案等价"""
+        normalized = normalize_answer(extract_answer(model_answer))
+        with self._lock:
+            if normalized in self._cache:
+                return self._cache[normalized]
+        verdict = self._judge(normalized)
+        with self._lock:
+            self._cache[normalized] = verdict
+        return verdict
+
+    def _judge(self, normalized: str) -> Optional[bool]:
+        if not normalized:
+            return False
+        if normalized.casefold() == self.normalized.casefold():
+            return True
+        if self.choices is not None:
+            choices = self._choices(normalized)
+            return choices == self.choices if choices is not None else None
+
+        parts = _split_answers(normalized)
+        if len(parts) != len(self.parts):
+            # 个数不同：两边都能解析时判为不等价，否则无法判定
+            all_parsed = all(parsed for _, parsed in self.parts) and all(parse_answer(p) for p in parts)
+            return False if all_parsed else None
+
+        # 多个答案按集合比较（顺序无关）
+        verdict = True
+        unmatched = list(self.parts)
+        for part in parts:
+            parsed = parse_answer(part)
+            found, undecided = None, False
+            for candidate in unmatched:
+                gold_text, gold_parsed = candidate
+                if part.casefold() == gold_text.casefold():
+                    result = True
+                elif parsed is None or gold_parsed is None:
+                    result = None
+                else:
+                    result = expressions_equivalent(parsed, gold_parsed)
+                if result:
+                    found = candidate
+                    break
+                undecided = undecided or result is None
+            if found is not None:
+                unmatched.remove(found)
+            elif undecided:
+                verdict = None
+            else:
+                return False
+        return verdict
+
+
+@lru_cache(maxsize=1024)
+def get_checker(gold: str) -> AnswerChecker:
+    """按标准答案复用判定器（同一次运行中每个标准答案只解析一次）"""
+    return AnswerChecker(gold)
+
+
+def check_answer(model_answer: str, gold: str) -> Optional[bool]:
+    """判定模型答案与标准答案是否等价：True / False / None（无法判定）"""
+    return get_checker(gold).check(model_answer)
@@ -0,0 +1,152 @@
+"""
+答案评判 - 本地等价判定（answer_equivalence.py）无法确定时的 LLM 评判兜底
+
+一次运行中所有无法判定的求解合并为一次评判调用（超过 ANSWER_JUDGE_MAX_ITEMS 时分批），
+评判结果按 (标准答案哈希, 提取后答案哈希) 缓存到磁盘：同一个答案无论出现多少次、重跑多少次都只评判一次，
+评判成本随不同答案的个数增长，而不是随求解次数增长
+
+默认关闭，设置 ANSWER_JUDGE_ENABLED=true 后生效；未开启或评判失败时，无法判定的答案按答错处理
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from answer_equivalence import extract_answer, normalize_answer
+from jsonl_io import BufferedJsonlWriter, iter_jsonl
+from llm_gateway import get_client, gateway
+from llm_telemetry import record_llm_call
+from prompts import ANSWER_JUDGE_PROMPT
+
+load_dotenv()
+
+JUDGE_ENABLED = os.getenv("ANSWER_JUDGE_ENABLED", "false").lower() == "true"
+JUDGE_MODEL = os.getenv("ANSWER_JUDGE_MODEL", os.getenv("OPENAI_MODEL", "gpt-5.1-chat-latest"))
+JUDGE_CACHE_FILE = os.getenv("ANSWER_JUDGE_CACHE_FILE", "answer_judge_cache.jsonl")
+JUDGE_MAX_ITEMS = int(os.getenv("ANSWER_JUDGE_MAX_ITEMS", "50"))  # 单次评判调用最多包含的答案数
+JUDGE_ANSWER_CHARS = 2000  # 每个答案最多发送的字符数（无答案标记的证明题取末尾）
+JUDGE_PROBLEM_CHARS = 4000
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+
+class AnswerJudge:
+    """批量 LLM 评判 + 磁盘缓存（线程安全）"""
+
+    def __init__(self, api_key: str, model: str = JUDGE_MODEL, cache_path: str = JUDGE_CACHE_FILE,
+                 max_items: int = JUDGE_MAX_ITEMS):
+        self.api_key = api_key
+        self.model = model
+        self.max_items = max(1, max_items)
+        self.calls = 0
+        self.cache_hits = 0
+        self._verdicts: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+        for item in iter_jsonl(cache_path):
+            self._verdicts[item['key']] = item['correct']
+        self._writer = BufferedJsonlWriter(cache_path, flush_every=self.max_items)
+
+    @classmethod
+    def from_env(cls) -> Optional["AnswerJudge"]:
+        """ANSWER_JUDGE_ENABLED 未开启或缺少 OPENAI_API_KEY 时返回 None"""
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not JUDGE_ENABLED or not api_key:
+            return None
+        return cls(api_key)
+
+    @staticmethod
+    def cache_key(correct_answer: str, model_answer: str) -> str:
+        """(标准答案哈希, 提取后答案哈希)：按规范化后的文本计算，格式差异不影响复用"""
+        gold = normalize_answer(extract_answer(correct_answer))
+        answer = normalize_answer(extract_answer(model_answer))
+        return f"{_digest(gold)}:{_digest(answer)}"
+
+    def judge(self, items: List[Tuple[str, str, str]]) -> List[Optional[bool]]:
+        """
+        批量评判
+
+        Args:
+            items: [(题目, 标准答案, 模型输出), ...]，可以来自多道题
+
+        Returns:
+            与 items 一一对应的评判结果，评判失败或模型未给出结论的为 None
+        """
+        keys = [self.cache_key(gold, answer) for _, gold, answer in items]
+        pending = {}  # key -> item，相同答案只评判一次
+        with self._lock:
+            for key, item in zip(keys, items):
+                if key in self._verdicts:
+                    self.cache_hits += 1
+                elif key not in pending:
+                    pending[key] = item
+
+        pending_keys = list(pending)
+        for start in range(0, len(pending_keys), self.max_items):
+            batch = pending_keys[start:start + self.max_items]
+            try:
+                verdicts = self._call([pending[key] for key in batch])
+            except Exception as e:
+                print(f"⚠️  答案评判失败: {str(e)}")
+                continue
+            with self._lock:
+                for key, verdict in zip(batch, verdicts):
+                    if verdict is not None:
+                        self._verdicts[key] = verdict
+                        self._writer.write({"key": key, "correct": verdict})
+        if pending_keys:
+            self._writer.flush()
+
+        with self._lock:
+            return [self._verdicts.get(key) for key in keys]
+
+    def _call(self, items: List[Tuple[str, str, str]]) -> List[Optional[bool]]:
+        """一次评判调用：同一道题的答案归在一组，题目和标准答案只发送一次"""
+        groups: Dict[Tuple[str, str], List[int]] = {}
+        for index, (problem_text, gold, _) in enumerate(items):
+            groups.setdefault((problem_text, gold), []).append(index)
+
+        sections = []
+        for number, ((problem_text, gold), indices) in enumerate(groups.items(), 1):
+            lines = [f"## Problem {number}", problem_text[:JUDGE_PROBLEM_CHARS], f"Reference answer: {gold}"]
+            for index in indices:
+                answer = extract_answer(items[index][2])[-JUDGE_ANSWER_CHARS:]
+                lines.append(f"- Candidate id {index + 1}: {answer}")
+            sections.append("\n".join(lines))
+        prompt = ANSWER_JUDGE_PROMPT + "\n\n".join(sections)
+
+        client = get_client(self.api_key)
+
+        def call():
+            return client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                response_format={"type": "json_object"}
+            )
+
+        start_time = time.time()
+        try:
+            response = gateway.call(self.model, call, hedge=False)
+        except Exception:
+            record_llm_call("openai", self.model, time.time() - start_time, success=False, stage="judge")
+            raise
+        record_llm_call("openai", self.model, time.time() - start_time, usage=response.usage, stage="judge",
+                        judged=len(items))
+        self.calls += 1
+
+        verdicts: List[Optional[bool]] = [None] * len(items)
+        for entry in json.loads(response.choices[0].message.content).get("verdicts", []):
+            try:
+                index = int(entry["id"]) - 1
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 0 <= index < len(items) and isinstance(entry.get("correct"), bool):
+                verdicts[index] = entry["correct"]
+        return verdicts
+
+
+# 全局实例（未开启时为 None）
+answer_judge = AnswerJudge.from_env()
@@ -4,12 +4,97 @@
 """
 import json
 import sys
+import time
+import queue
+import argparse
+import threading
+import itertools
 from database import db
+from jsonl_io import iter_records
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def import_problems_from_json(json_file_path, teacher_name="导入", category="未分类"):
+# 导入流水线配置
+CHUNK_SIZE = 200  # 每次批量插入的行数
+INSERT_WORKERS = 4  # 并发插入线程数
+QUEUE_DEPTH = 8  # 读取与插入之间最多缓冲的批次数（限制内存占用）
+
+# 自动检测字段时依次尝试的键名
+FIELD_CANDIDATES = {
+    "problem_text": ['problem', 'question', 'problem_text', 'text', 'content'],
+    "answer": ['answer', 'solution', 'result'],
+    "solution": ['explanation', 'solution', 'analysis', '解析'],
+    "difficulty": ['difficulty', 'level'],
+    "tags": ['tags', 'tag'],
+}
+
+# 合并模式下可以用导入数据补全的字段（只补题库中为空的字段）
+MERGE_FIELDS = ["answer", "solution", "difficulty", "tags"]
+
+
+def detect_field_mapping(first_problem):
+    """根据第一条记录自动检测字段映射"""
+    field_mapping = {}
+    for field, candidates in FIELD_CANDIDATES.items():
+        for key in candidates:
+            if key in first_problem:
+                # 答案和解析不映射到同一个键
+                if field == "solution" and key == field_mapping.get("answer"):
+                    continue
+                field_mapping[field] = key
+                break
+    return field_mapping
+
+
+def load_mapping_file(path):
+    """
+    读取字段映射文件（JSON）
+    
+    格式示例:
+        {"problem_text": "question", "answer": "answer", "solution": "explanation",
+         "teacher_name": "张老师", "category": "代数"}
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def prompt_field_mapping(first_problem):
+    """交互式询问字段映射（未填写的字段自动检测）"""
+    print("🔧 字段映射配置")
+    print("请告诉我 JSON 中各字段对应的键名（如果没有该字段，直接按回车跳过）:\n")
+    
+    field_mapping = {}
+    field_mapping['problem_text'] = input(f"题目内容的字段名 [{', '.join([k for k in first_problem.keys() if 'problem' in k.lower() or 'question' in k.lower() or 'text' in k.lower()][:3])}]: ").strip()
+    field_mapping['answer'] = input(f"答案的字段名 [{', '.join([k for k in first_problem.keys() if 'answer' in k.lower()][:3])}]: ").strip()
+    field_mapping['solution'] = input(f"解析的字段名 [{', '.join([k for k in first_problem.keys() if 'solution' in k.lower() or 'explanation' in k.lower()][:3])}]: ").strip()
+    field_mapping['id'] = input(f"题目ID的字段名 [{', '.join([k for k in first_problem.keys() if 'id' in k.lower()][:3])}]: ").strip()
+    
+    # 可选字段
+    print("\n可选字段（可以直接按回车跳过）:")
+    field_mapping['difficulty'] = input("难度字段名: ").strip()
+    field_mapping['tags'] = input("标签字段名: ").strip()
+    
+    print()
+    
+    # 如果字段为空，尝试自动检测
+    detected = detect_field_mapping(first_problem)
+    for field in ['problem_text', 'answer', 'solution']:
+        if not field_mapping[field] and detected.get(field):
+            field_mapping[field] = detected[field]
+            print(f"✅ 自动检测到{field}字段: {detected[field]}")
+    
+    return field_mapping
+
+
+def import_problems_from_json(
+    json_file_path,
+    teacher_name="导入",
+    category="未分类",
+    field_mapping=None,
+    interactive=True,
+    on_duplicate="skip"
+):
     """
     从 JSON 文件批量导入题目
     
@@ -17,202 +102,307 @@ def import_problems_from_json(json_file_path, teacher_name="导入", category="
         json_file_path: JSON 文件路径
         teacher_name: 默认出题老师名称
         category: 默认类别
+        field_mapping: 字段映射（None 时交互询问或自动检测）
+        interactive: 是否交互式询问映射、默认值并确认
+        on_duplicate: 题库中已存在相同题目时的处理方式（skip / merge / insert）
+    
+    Returns:
+        Dict: 导入统计，失败时为 None
     """
     
     if not db.enabled:
         print("❌ 数据库未连接，请检查 Supabase 配置")
-        return
+        return None
     
     print(f"\n{'='*60}")
     print(f"📚 批量导入题目工具")
     print(f"{'='*60}\n")
     
-    # 读取 JSON 文件
+    # 流式读取 JSON 文件（支持 JSON 数组 / JSONL / gzip，不一次性载入内存）
     try:
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            # 尝试读取为 JSON 数组
-            content = f.read().strip()
-            
-            # 支持两种格式：JSON 数组 或 JSONL（每行一个 JSON）
-            if content.startswith('['):
-                problems_data = json.loads(content)
-            else:
-                # JSONL 格式
-                problems_data = [json.loads(line) for line in content.split('\n') if line.strip()]
-        
-        print(f"✅ 成功读取文件: {json_file_path}")
-        print(f"📊 共找到 {len(problems_data)} 道题目\n")
-    
+        records = iter_records(json_file_path)
+        first_problem = next(records, None)
+        print(f"✅ 成功打开文件: {json_file_path}")
     except FileNotFoundError:
         print(f"❌ 文件不存在: {json_file_path}")
-        return
+        return None
     except json.JSONDecodeError as e:
         print(f"❌ JSON 格式错误: {e}")
-        return
+        return None
     except Exception as e:
         print(f"❌ 读取文件失败: {e}")
-        return
-    
-    # 显示数据格式示例
-    if problems_data:
-        print("📋 数据格式示例（第一题）:")
-        first_problem = problems_data[0]
-        print(f"  可用字段: {list(first_problem.keys())}")
-        print()
-    
-    # 询问字段映射
-    print("🔧 字段映射配置")
-    print("请告诉我 JSON 中各字段对应的键名（如果没有该字段，直接按回车跳过）:\n")
-    
-    field_mapping = {}
-    field_mapping['problem_text'] = input(f"题目内容的字段名 [{', '.join([k for k in first_problem.keys() if 'problem' in k.lower() or 'question' in k.lower() or 'text' in k.lower()][:3])}]: ").strip()
-    field_mapping['answer'] = input(f"答案的字段名 [{', '.join([k for k in first_problem.keys() if 'answer' in k.lower()][:3])}]: ").strip()
-    field_mapping['solution'] = input(f"解析的字段名 [{', '.join([k for k in first_problem.keys() if 'solution' in k.lower() or 'explanation' in k.lower()][:3])}]: ").strip()
-    field_mapping['id'] = input(f"题目ID的字段名 [{', '.join([k for k in first_problem.keys() if 'id' in k.lower()][:3])}]: ").strip()
+        return None
     
-    # 可选字段
-    print("\n可选字段（可以直接按回车跳过）:")
-    field_mapping['difficulty'] = input("难度字段名: ").strip()
-    field_mapping['tags'] = input("标签字段名: ").strip()
+    if first_problem is None:
+        print("📭 文件中没有题目")
+        return None
     
+    # 显示数据格式示例
+    print("📋 数据格式示例（第一题）:")
+    print(f"  可用字段: {list(first_problem.keys())}")
     print()
     
-    # 如果字段为空，尝试自动检测
-    if not field_mapping['problem_text']:
-        for key in ['problem', 'question', 'problem_text', 'text', 'content']:
-            if key in first_problem:
-                field_mapping['problem_text'] = key
-                print(f"✅ 自动检测到题目字段: {key}")
-                break
-    
-    if not field_mapping['answer']:
-        for key in ['answer', 'solution', 'result']:
-            if key in first_problem:
-                field_mapping['answer'] = key
-                print(f"✅ 自动检测到答案字段: {key}")
-                break
-    
-    if not field_mapping['solution']:
-        for key in ['explanation', 'solution', 'analysis', '解析']:
-            if key in first_problem:
-                field_mapping['solution'] = key
-                print(f"✅ 自动检测到解析字段: {key}")
-                break
+    # 字段映射：映射文件 > 交互询问 > 自动检测
+    if field_mapping is None:
+        if interactive:
+            field_mapping = prompt_field_mapping(first_problem)
+        else:
+            field_mapping = detect_field_mapping(first_problem)
+            print(f"✅ 自动检测字段映射: {field_mapping}")
     
     # 确认必填字段
-    if not field_mapping['problem_text']:
+    if not field_mapping.get('problem_text'):
         print("\n❌ 错误：必须指定题目内容字段")
-        return
+        return None
     
     # 询问默认值
-    print(f"\n📝 默认值设置:")
-    teacher_name = input(f"出题老师名称 [默认: {teacher_name}]: ").strip() or teacher_name
-    category = input(f"题目类别 [默认: {category}]: ").strip() or category
+    if interactive:
+        print(f"\n📝 默认值设置:")
+        teacher_name = input(f"出题老师名称 [默认: {teacher_name}]: ").strip() or teacher_name
+        category = input(f"题目类别 [默认: {category}]: ").strip() or category
     
     # 确认导入
     print(f"\n{'='*60}")
     print("📋 导入配置确认:")
-    print(f"  • 题目数量: {len(problems_data)}")
+    print(f"  • 题目数量: 流式读取，边读边导入")
     print(f"  • 出题老师: {teacher_name}")
     print(f"  • 默认类别: {category}")
     print(f"  • 题目字段: {field_mapping['problem_text']}")
-    print(f"  • 答案字段: {field_mapping.get('answer', '无')}")
-    print(f"  • 解析字段: {field_mapping.get('solution', '无')}")
+    print(f"  • 答案字段: {field_mapping.get('answer') or '无'}")
+    print(f"  • 解析字段: {field_mapping.get('solution') or '无'}")
+    print(f"  • 重复题目: {on_duplicate}")
     print(f"{'='*60}\n")
     
-    confirm = input("确认开始导入？(y/n): ").strip().lower()
-    if confirm != 'y':
-        print("❌ 已取消导入")
-        return
+    if interactive:
+        confirm = input("确认开始导入？(y/n): ").strip().lower()
+        if confirm != 'y':
+            print("❌ 已取消导入")
+            return None
     
     # 开始导入
     print(f"\n{'='*60}")
     print("🚀 开始导入...")
     print(f"{'='*60}\n")
     
-    success_count = 0
-    error_count = 0
-    
-    for idx, problem_data in enumerate(problems_data, 1):
-        try:
-            # 提取数据
-            problem_text = problem_data.get(field_mapping['problem_text'], '')
-            
-            if not problem_text:
-                print(f"⚠️  题目 {idx}: 跳过（题目内容为空）")
-                error_count += 1
-                continue
-            
-            answer = problem_data.get(field_mapping.get('answer', ''), None) if field_mapping.get('answer') else None
-            solution = problem_data.get(field_mapping.get('solution', ''), None) if field_mapping.get('solution') else None
-            difficulty = problem_data.get(field_mapping.get('difficulty', ''), None) if field_mapping.get('difficulty') else None
-            
-            # 处理标签
-            tags = None
-            if field_mapping.get('tags'):
-                tags_data = problem_data.get(field_mapping['tags'])
-                if isinstance(tags_data, list):
-                    tags = tags_data
-                elif isinstance(tags_data, str):
-                    tags = [tags_data]
-            
-            # 添加到数据库
-            problem_id = db.add_problem(
-                problem_text=problem_text,
-                teacher_name=teacher_name,
-                answer=answer,
-                solution=solution,
-                category=category,
-                difficulty=difficulty,
-                tags=tags
-            )
-            
-            if problem_id:
-                print(f"✅ 题目 {idx}/{len(problems_data)}: 导入成功 (ID: {problem_id[:8]}...)")
-                success_count += 1
-            else:
-                print(f"❌ 题目 {idx}/{len(problems_data)}: 导入失败")
-                error_count += 1
-        
-        except Exception as e:
-            print(f"❌ 题目 {idx}/{len(problems_data)}: 导入失败 - {e}")
-            error_count += 1
+    stats = run_import_pipeline(
+        itertools.chain([first_problem], records),
+        field_mapping,
+        teacher_name,
+        category,
+        on_duplicate
+    )
     
     # 导入总结
+    total = sum(stats[key] for key in ("success", "merged", "skipped", "error"))
     print(f"\n{'='*60}")
     print("📊 导入完成！")
     print(f"{'='*60}")
-    print(f"✅ 成功: {success_count} 道题目")
-    print(f"❌ 失败: {error_count} 道题目")
-    print(f"📈 成功率: {success_count/len(problems_data)*100:.1f}%")
+    print(f"✅ 新增: {stats['success']} 道题目")
+    print(f"🔀 合并: {stats['merged']} 道题目")
+    print(f"⏭️  跳过（已存在）: {stats['skipped']} 道题目")
+    print(f"❌ 失败: {stats['error']} 道题目")
+    if total:
+        print(f"📈 成功率: {(total - stats['error'])/total*100:.1f}%")
+    print(f"⏱️  耗时: {stats['elapsed']:.1f} 秒（{stats['rows_per_second']:.0f} 行/秒）")
     print(f"{'='*60}\n")
+    
+    return stats
 
-def main():
-    """主函数"""
-    if len(sys.argv) < 2:
-        print("""
-📚 批量导入题目工具
+def map_problem(problem_data, field_mapping, teacher_name, category):
+    """按字段映射把一条原始记录转换为数据库行；题目内容为空时返回 None"""
+    problem_text = problem_data.get(field_mapping['problem_text'], '')
+    if not problem_text:
+        return None
+    
+    answer = problem_data.get(field_mapping.get('answer', ''), None) if field_mapping.get('answer') else None
+    solution = problem_data.get(field_mapping.get('solution', ''), None) if field_mapping.get('solution') else None
+    difficulty = problem_data.get(field_mapping.get('difficulty', ''), None) if field_mapping.get('difficulty') else None
+    
+    # 处理标签
+    tags = None
+    if field_mapping.get('tags'):
+        tags_data = problem_data.get(field_mapping['tags'])
+        if isinstance(tags_data, list):
+            tags = tags_data
+        elif isinstance(tags_data, str):
+            tags = [tags_data]
+    
+    return {
+        "problem_text": problem_text,
+        "teacher_name": teacher_name,
+        "answer": answer,
+        "solution": solution,
+        "category": category,
+        "difficulty": difficulty,
+        "tags": tags,
+        "problem_hash": db._calculate_hash(problem_text)
+    }
 
-使用方法:
-    python batch_import_problems.py <json_file_path> [teacher_name] [category]
+def merge_updates(existing, row):
+    """计算合并更新：只用导入数据补全题库中为空的字段"""
+    return {
+        field: row[field]
+        for field in MERGE_FIELDS
+        if row.get(field) and not existing.get(field)
+    }
 
-参数说明:
-    json_file_path  - JSON 文件路径（必需）
-    teacher_name    - 出题老师名称（可选，默认: "导入"）
-    category        - 题目类别（可选，默认: "未分类"）
+def run_import_pipeline(records, field_mapping, teacher_name, category, on_duplicate="skip"):
+    """
+    读取与插入并行的导入流水线：主线程流式读取并分块，插入线程批量写库
+    有界队列保证内存占用与文件大小无关
+    
+    每个分块先按哈希一次性查询题库，已存在的题目按 on_duplicate 跳过或合并，
+    同一文件内的重复题目只导入第一条
+    
+    Returns:
+        Dict: success / merged / skipped / error 计数及吞吐量
+    """
+    chunks = queue.Queue(maxsize=QUEUE_DEPTH)
+    stats = {"success": 0, "merged": 0, "skipped": 0, "error": 0}
+    lock = threading.Lock()
+    start_time = time.time()
+    
+    def insert_worker():
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+    
+            to_insert = chunk
+            merged = skipped = failed = 0
+            if on_duplicate != "insert":
+                existing = db.get_problems_by_hashes([row["problem_hash"] for row in chunk])
+                to_insert = []
+                if existing is None:
+                    # 查询失败时无法去重：整块计为失败，不插入，避免产生重复题目
+                    print(f"❌ 本批 {len(chunk)} 道题目查重失败，已跳过（未写入）")
+                    failed = len(chunk)
+                    chunk = []
+                for row in chunk:
+                    found = existing.get(row["problem_hash"])
+                    if not found:
+                        to_insert.append(row)
+                        continue
+                    updates = merge_updates(found, row) if on_duplicate == "merge" else {}
+                    if not updates:
+                        skipped += 1
+                    elif db.update_problem(found["id"], updates):
+                        merged += 1
+                    else:
+                        failed += 1
+    
+            inserted = len(db.add_problems(to_insert))
+            if to_insert and not inserted:
+                # 整块插入失败（如块内某一行数据有误）：逐行重试，只有出错的行计为失败
+                print(f"⚠️  本批 {len(to_insert)} 道题目批量插入失败，改为逐行插入")
+                inserted = sum(
+                    1 for row in to_insert
+                    if db.add_problem(**{key: value for key, value in row.items() if key != "problem_hash"})
+                )
+            with lock:
+                stats["success"] += inserted
+                stats["merged"] += merged
+                stats["skipped"] += skipped
+                stats["error"] += failed + len(to_insert) - inserted
+                done = sum(stats.values())
+            elapsed = time.time() - start_time
+            print(f"✅ 已处理 {done} 道题目（本批新增 {inserted}，合并 {merged}，跳过 {skipped}，{done / elapsed:.0f} 行/秒）")
+    
+    workers = [threading.Thread(target=insert_worker, daemon=True) for _ in range(INSERT_WORKERS)]
+    for worker in workers:
+        worker.start()
+    
+    chunk = []
+    seen_hashes = set()
+    try:
+        for idx, problem_data in enumerate(records, 1):
+            try:
+                row = map_problem(problem_data, field_mapping, teacher_name, category)
+            except Exception as e:
+                print(f"❌ 题目 {idx}: 无法解析（{e}）")
+                with lock:
+                    stats["error"] += 1
+                continue
+            if row is None:
+                print(f"⚠️  题目 {idx}: 跳过（题目内容为空）")
+                with lock:
+                    stats["error"] += 1
+                continue
+            if on_duplicate != "insert":
+                if row["problem_hash"] in seen_hashes:
+                    with lock:
+                        stats["skipped"] += 1
+                    continue
+                seen_hashes.add(row["problem_hash"])
+            chunk.append(row)
+            if len(chunk) >= CHUNK_SIZE:
+                chunks.put(chunk)
+                chunk = []
+    except json.JSONDecodeError as e:
+        print(f"❌ JSON 格式错误，已停止读取: {e}")
+    finally:
+        if chunk:
+            chunks.put(chunk)
+        for _ in workers:
+            chunks.put(None)
+        for worker in workers:
+            worker.join()
+    
+    elapsed = time.time() - start_time
+    stats["elapsed"] = elapsed
+    stats["rows_per_second"] = sum(stats[key] for key in ("success", "merged", "skipped", "error")) / elapsed if elapsed else 0.0
+    return stats
 
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="📚 批量导入题目工具",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
 示例:
     python batch_import_problems.py problems.json "张老师" "代数"
     python batch_import_problems.py problems.jsonl
-        """)
-        return
+    python batch_import_problems.py problems.jsonl.gz --mapping mapping.json
+    python batch_import_problems.py problems.jsonl -y --on-duplicate merge
+        """
+    )
+    parser.add_argument("json_file", help="JSON / JSONL 文件路径（支持 .gz）")
+    parser.add_argument("teacher_name", nargs="?", default=None, help='出题老师名称（默认: "导入"）')
+    parser.add_argument("category", nargs="?", default=None, help='题目类别（默认: "未分类"）')
+    parser.add_argument("--mapping", help="字段映射文件（JSON），指定后不再交互询问")
+    parser.add_argument("-y", "--yes", action="store_true", help="非交互模式：自动检测字段映射并直接导入")
+    parser.add_argument("--on-duplicate", choices=["skip", "merge", "insert"], default="skip",
+                        help="题库中已有相同题目时：跳过 / 补全空字段 / 仍然插入（默认: skip）")
+    args = parser.parse_args()
     
-    json_file = sys.argv[1]
-    teacher_name = sys.argv[2] if len(sys.argv) > 2 else "导入"
-    category = sys.argv[3] if len(sys.argv) > 3 else "未分类"
+    field_mapping = None
+    teacher_name = args.teacher_name
+    category = args.category
+    if args.mapping:
+        try:
+            mapping = load_mapping_file(args.mapping)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"❌ 读取映射文件失败: {e}")
+            sys.exit(1)
+        # 映射文件中可以同时指定默认老师和类别，命令行参数优先
+        teacher_name = teacher_name or mapping.pop("teacher_name", None)
+        category = category or mapping.pop("category", None)
+        mapping.pop("teacher_name", None)
+        mapping.pop("category", None)
+        field_mapping = mapping
     
-    import_problems_from_json(json_file, teacher_name, category)
+    stats = import_problems_from_json(
+        args.json_file,
+        teacher_name or "导入",
+        category or "未分类",
+        field_mapping=field_mapping,
+        interactive=not (args.mapping or args.yes),
+        on_duplicate=args.on_duplicate
+    )
+    
+    # 供定时任务判断结果：无法导入或有失败记录时返回非零
+    if stats is None or stats["error"]:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
-
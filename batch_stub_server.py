@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+本地 Batch API 替身服务器
+实现 OpenAI Files / Batches / Chat Completions 接口的最小子集，用于离线验证 quality_review_gpt51.py
+
+用法:
+    python batch_stub_server.py [port]
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub python quality_review_gpt51.py --batch --poll-interval 1 -y
+"""
+import hashlib
+import json
+import sys
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILES = {}
+BATCHES = {}
+
+# 批次创建后多久完成（秒），用于模拟排队
+COMPLETE_AFTER = 2
+# 同步 chat.completions 接口的模拟延迟（秒）
+SYNC_LATENCY = 0.2
+
+
+def fake_review(custom_id):
+    """根据题目 ID 生成确定性的审核结果"""
+    score = int(hashlib.md5(custom_id.encode('utf-8')).hexdigest(), 16) % 11
+    if score >= 7:
+        recommendation = "ACCEPT"
+    elif score >= 5:
+        recommendation = "BORDERLINE"
+    else:
+        recommendation = "REJECT"
+    return {
+        "clarity_score": min(2, score // 5),
+        "rigor_score": min(2, score // 5),
+        "completeness_score": min(2, score // 5),
+        "solvability_score": min(2, score // 5),
+        "educational_value_score": min(2, score // 5),
+        "total_score": score,
+        "issues": [],
+        "reasoning": "stub review",
+        "recommendation": recommendation
+    }
+
+
+def fake_completion(request_body):
+    """构造一条 chat.completion 响应"""
+    custom_id = request_body["messages"][-1]["content"]
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request_body["model"],
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": json.dumps(fake_review(custom_id))}
+        }],
+        "usage": {"prompt_tokens": 600, "completion_tokens": 200, "total_tokens": 800}
+    }
+
+
+def run_batch(batch):
+    """处理批次输入文件，生成输出文件"""
+    lines = []
+    for line in FILES[batch["input_file_id"]]["content"].decode('utf-8').splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        body = fake_completion(request["body"])
+        lines.append(json.dumps({
+            "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+            "custom_id": request["custom_id"],
+            "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": body},
+            "error": None
+        }))
+
+    output_id = f"file-{uuid.uuid4().hex[:12]}"
+    FILES[output_id] = {"content": ("\n".join(lines) + "\n").encode('utf-8'), "purpose": "batch_output"}
+    batch.update({
+        "status": "completed",
+        "output_file_id": output_id,
+        "completed_at": int(time.time()),
+        "request_counts": {"total": len(lines), "completed": len(lines), "failed": 0}
+    })
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def _send_json(self, data, status=200):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        if self.path.rstrip("/") == "/v1/files":
+            raw = b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + self._read_body()
+            message = BytesParser(policy=default_policy).parsebytes(raw)
+            content, purpose = b"", "batch"
+            for part in message.iter_parts():
+                name = part.get_param("name", header="content-disposition")
+                if name == "file":
+                    content = part.get_payload(decode=True)
+                elif name == "purpose":
+                    purpose = part.get_content().strip()
+            file_id = f"file-{uuid.uuid4().hex[:12]}"
+            FILES[file_id] = {"content": content, "purpose": purpose}
+            self._send_json({
+                "id": file_id, "object": "file", "bytes": len(content),
+                "created_at": int(time.time()), "filename": "input.jsonl", "purpose": purpose, "status": "processed"
+            })
+        elif self.path.rstrip("/") == "/v1/chat/completions":
+            # 同步接口：模拟一次在线调用的延迟
+            request = json.loads(self._read_body())
+            time.sleep(SYNC_LATENCY)
+            self._send_json(fake_completion(request))
+        elif self.path.rstrip("/") == "/v1/batches":
+            request = json.loads(self._read_body())
+            batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+            total = len([l for l in FILES[request["input_file_id"]]["content"].splitlines() if l.strip()])
+            BATCHES[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": request["endpoint"],
+                "input_file_id": request["input_file_id"], "completion_window": request["completion_window"],
+                "status": "in_progress", "created_at": int(time.time()),
+                "output_file_id": None, "error_file_id": None,
+                "request_counts": {"total": total, "completed": 0, "failed": 0}
+            }
+            self._send_json(BATCHES[batch_id])
+        else:
+            self._send_json({"error": {"message": f"unknown path {self.path}"}}, 404)
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 3 and parts[:2] == ["v1", "batches"] and parts[2] in BATCHES:
+            batch = BATCHES[parts[2]]
+            if batch["status"] == "in_progress" and time.time() - batch["created_at"] >= COMPLETE_AFTER:
+                run_batch(batch)
+            self._send_json(batch)
+        elif len(parts) == 4 and parts[:2] == ["v1", "files"] and parts[3] == "content" and parts[2] in FILES:
+            content = FILES[parts[2]]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/jsonl")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            self._send_json({"error": {"message": f"unknown path {self.path}"}}, 404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    print(f"🧪 Batch API 替身服务器已启动: http://127.0.0.1:{port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
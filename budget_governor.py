@@ -0,0 +1,131 @@
+"""
+预算控制 - 批量任务的费用 / token 上限
+
+发请求前按本地计数的 prompt token 与预期输出预留额度，调用完成后以实际 usage 结算；
+接近上限时降低并发，预留会超出上限时拒绝新请求，让任务停在预算之内
+"""
+import os
+import time
+import threading
+from typing import Dict, Optional
+from llm_telemetry import add_call_listener, remove_call_listener, count_tokens, estimate_cost
+
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+class BudgetExceeded(Exception):
+    """预算不足以发起新的请求"""
+    pass
+
+
+class BudgetGovernor:
+    """
+    费用 / token 预算控制
+
+    Args:
+        max_cost: 费用上限（USD），None 表示不限
+        max_tokens: token 上限（输入 + 输出），None 表示不限
+        throttle_ratio: 用量超过上限的该比例后开始按剩余额度线性降低并发
+    """
+
+    def __init__(
+        self,
+        max_cost: Optional[float] = None,
+        max_tokens: Optional[float] = None,
+        throttle_ratio: float = 0.8
+    ):
+        self.max_cost = max_cost
+        self.max_tokens = max_tokens
+        self.throttle_ratio = throttle_ratio
+        self.spent = 0.0
+        self.tokens = 0
+        self.calls = 0
+        self.reserved_cost = 0.0
+        self.reserved_tokens = 0
+        self.start_time = time.time()
+        self._lock = threading.Lock()
+        add_call_listener(self._on_call)
+
+    @classmethod
+    def from_env(cls, max_cost: Optional[float] = None, max_tokens: Optional[float] = None) -> "BudgetGovernor":
+        """命令行参数优先，其次读取 LLM_BUDGET_USD / LLM_BUDGET_TOKENS / LLM_BUDGET_THROTTLE"""
+        return cls(
+            max_cost=max_cost if max_cost is not None else _env_float("LLM_BUDGET_USD"),
+            max_tokens=max_tokens if max_tokens is not None else _env_float("LLM_BUDGET_TOKENS"),
+            throttle_ratio=_env_float("LLM_BUDGET_THROTTLE") or 0.8
+        )
+
+    @property
+    def limited(self) -> bool:
+        return self.max_cost is not None or self.max_tokens is not None
+
+    def _on_call(self, record: Dict):
+        """以实际 usage 累计用量（由 record_llm_call 回调）"""
+        with self._lock:
+            self.spent += record["cost_usd"]
+            self.tokens += record["prompt_tokens"] + record["completion_tokens"]
+            self.calls += 1
+
+    def admit(self, model: str, prompt: str, expected_output_tokens: int, cost_multiplier: float = 1.0) -> Optional[Dict]:
+        """
+        为一次请求预留额度
+
+        Returns:
+            Dict: 预留凭据（调用结束后传给 settle），预算不足时返回 None
+        """
+        prompt_tokens = count_tokens(prompt, model)
+        cost = estimate_cost(model, prompt_tokens, expected_output_tokens, cost_multiplier)
+        tokens = prompt_tokens + expected_output_tokens
+        with self._lock:
+            if self.max_cost is not None and self.spent + self.reserved_cost + cost > self.max_cost:
+                return None
+            if self.max_tokens is not None and self.tokens + self.reserved_tokens + tokens > self.max_tokens:
+                return None
+            self.reserved_cost += cost
+            self.reserved_tokens += tokens
+        return {"cost": cost, "tokens": tokens, "prompt_tokens": prompt_tokens}
+
+    def settle(self, ticket: Optional[Dict]):
+        """释放预留额度（实际用量已由调用记录累计）"""
+        if not ticket:
+            return
+        with self._lock:
+            self.reserved_cost -= ticket["cost"]
+            self.reserved_tokens -= ticket["tokens"]
+
+    def usage_ratio(self) -> float:
+        """已用 + 预留占上限的比例（取费用与 token 中较高者）"""
+        with self._lock:
+            ratios = [0.0]
+            if self.max_cost:
+                ratios.append((self.spent + self.reserved_cost) / self.max_cost)
+            if self.max_tokens:
+                ratios.append((self.tokens + self.reserved_tokens) / self.max_tokens)
+        return max(ratios)
+
+    def exhausted(self) -> bool:
+        return self.usage_ratio() >= 1.0
+
+    def concurrency(self, workers: int) -> int:
+        """当前允许的并发数：超过 throttle_ratio 后按剩余额度线性降低，最低 1"""
+        ratio = self.usage_ratio()
+        if ratio <= self.throttle_ratio:
+            return workers
+        remaining = max(0.0, 1.0 - ratio) / (1.0 - self.throttle_ratio)
+        return max(1, int(workers * remaining))
+
+    def status_line(self, problems_done: int) -> str:
+        """实时费用与速率：$/题、tokens/秒"""
+        elapsed = time.time() - self.start_time
+        with self._lock:
+            spent, tokens = self.spent, self.tokens
+        limit = f"/${self.max_cost:.4f}" if self.max_cost is not None else ""
+        per_problem = spent / problems_done if problems_done else 0.0
+        rate = tokens / elapsed if elapsed else 0.0
+        return f"💰 ${spent:.4f}{limit} | ${per_problem:.5f}/题 | {rate:.0f} tokens/秒 | {tokens} tokens"
+
+    def close(self):
+        remove_call_listener(self._on_call)
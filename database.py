@@ -96,6 +96,59 @@ class Database:
             print(f"❌ 添加题目失败: {e}")
             return None
     
+    def add_problems(self, problems: List[Dict]) -> List[str]:
+        """
+        批量添加题目（一次请求插入多行）
+        
+        Args:
+            problems: 题目字典列表，字段同 add_problem 的参数
+        
+        Returns:
+            List[str]: 成功插入的题目ID列表
+        """
+        if not self.enabled or not problems:
+            return []
+        
+        try:
+            rows = []
+            for problem in problems:
+                row = dict(problem)
+                if not row.get("problem_hash"):
+                    row["problem_hash"] = self._calculate_hash(row["problem_text"])
+                rows.append(row)
+            
+            response = self.client.table("problems").insert(rows).execute()
+            return [item['id'] for item in response.data or []]
+            
+        except Exception as e:
+            print(f"❌ 批量添加题目失败: {e}")
+            return []
+    
+    def get_problems_by_hashes(self, hashes: List[str]) -> Optional[Dict[str, Dict]]:
+        """
+        按哈希批量查询已有题目（一次查询，用于批量导入前去重）
+        
+        Args:
+            hashes: 题目哈希列表
+        
+        Returns:
+            Optional[Dict[str, Dict]]: 哈希 -> 已有题目；查询失败时返回 None（与“都不存在”区分，避免重复导入）
+        """
+        if not self.enabled or not hashes:
+            return {}
+        
+        try:
+            response = self.client.table("problems")\
+                .select("id, problem_hash, answer, solution, difficulty, tags")\
+                .in_("problem_hash", list(set(hashes)))\
+                .execute()
+            
+            return {item['problem_hash']: item for item in response.data or []}
+            
+        except Exception as e:
+            print(f"❌ 批量查询题目哈希失败: {e}")
+            return None
+    
     def get_all_problems(
         self,
         teacher_name: Optional[str] = None,
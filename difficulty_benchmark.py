@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+批量难度测试 - 生成 final_benchmark_results.jsonl（quality_review_gpt51.py 的输入）
+
+每道题用 Doubao 求解 k 次并与标准答案比对（比对规则与难度测试页面相同），
+所有已配置的 Doubao 端点同时参与，单次求解为调度单位，每道题求解完立即写出一行
+
+用法:
+    python difficulty_benchmark.py --answers answers.jsonl
+    python difficulty_benchmark.py --problems original_problems_only.json --answers answers.json -k 10 --per-endpoint 24
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+from jsonl_io import BufferedJsonlWriter, iter_jsonl, iter_records
+from problem_store import ProblemStore
+from llm_telemetry import start_metrics_server, print_summary
+from difficulty_engine import (
+    EndpointPool, doubao_endpoints, solve_with_pool, local_verdict, judge_undecided, build_solver_messages
+)
+from budget_governor import BudgetGovernor
+
+load_dotenv()
+
+# ================= 配置区域 =================
+PROBLEMS_FILE = "original_problems_only.json"
+OUTPUT_FILE = "final_benchmark_results.jsonl"
+DEFAULT_ATTEMPTS = 10  # 每题求解次数
+DEFAULT_PER_ENDPOINT = 16  # 每个端点的并发数
+MAX_RETRIES = 5  # 单次求解遇到 429 时的重试次数
+BASE_WAIT_TIME = 10
+PROGRESS_INTERVAL = 10  # 进度输出间隔（秒）
+EXPECTED_OUTPUT_TOKENS = 3000  # 单次求解输出（含推理）的预估 token 数，用于预留预算
+# ===========================================
+
+
+def answer_of(record):
+    """标准答案字段：answer 或 ground_truth"""
+    if not record:
+        return None
+    answer = record.get('answer') or record.get('ground_truth')
+    return str(answer) if answer else None
+
+
+def solve_once(pool, problem_text):
+    """求解一次（换端点重试见 solve_with_pool），返回模型输出"""
+    return solve_with_pool(pool, problem_text, max_retries=MAX_RETRIES, base_wait=BASE_WAIT_TIME)["content"]
+
+
+def iter_pending(problems_file, answer_store, done_ids):
+    """流式读取题目并按 ID 从答案索引取标准答案，跳过已完成、缺少文本或缺少标准答案的题目"""
+    for item in iter_records(problems_file):
+        problem_id = str(item.get('id', ''))
+        if not problem_id or problem_id in done_ids:
+            continue
+        ground_truth = (answer_of(answer_store.get(problem_id)) if answer_store else None) or answer_of(item)
+        if not item.get('problem_text') or not ground_truth:
+            print(f"⚠️  题目 {problem_id} 缺少文本或标准答案，跳过")
+            continue
+        yield {
+            "id": problem_id,
+            "problem_text": item['problem_text'],
+            "difficulty": item.get('difficulty', 'Unknown'),
+            "ground_truth": ground_truth
+        }
+
+
+def admit_problem(governor, model_id, problem, attempts):
+    """为一道题的 k 次求解预留预算（要么全部预留，要么一个都不预留，避免只测了一部分的题目）"""
+    prompt = "\n".join(m["content"] for m in build_solver_messages(problem['problem_text']))
+    tickets = []
+    for _ in range(attempts):
+        ticket = governor.admit(model_id, prompt, EXPECTED_OUTPUT_TOKENS)
+        if ticket is None:
+            for acquired in tickets:
+                governor.settle(acquired)
+            return None
+        tickets.append(ticket)
+    return tickets
+
+
+def run_benchmark(problems, pool, attempts, writer, governor):
+    """
+    以单次求解为单位调度：提前提交的求解数不超过端点池总并发的 2 倍（接近预算上限时降低），
+    某道题的 k 次求解全部结束后立即写出结果（全部失败的题不写出，下次运行重试）
+
+    Returns:
+        Dict: written / failed / solves 计数
+    """
+    stats = {"written": 0, "failed": 0, "solves": 0}
+    window = pool.capacity * 2
+    tally = {}  # 题目ID -> {"problem", "correct", "errors", "undecided", "remaining"}
+    in_flight = {}
+    start_time = time.time()
+    last_print = start_time
+
+    def submit_problem(executor, problem, tickets):
+        tally[problem['id']] = {"problem": problem, "correct": 0, "errors": 0, "undecided": [], "remaining": attempts}
+        for ticket in tickets:
+            future = executor.submit(solve_once, pool, problem['problem_text'])
+            in_flight[future] = (problem['id'], ticket)
+
+    with ThreadPoolExecutor(max_workers=pool.capacity) as executor:
+        exhausted = False
+        while True:
+            limit = max(governor.concurrency(window), attempts)
+            while not exhausted and len(in_flight) + attempts <= limit:
+                problem = next(problems, None)
+                if problem is None:
+                    exhausted = True
+                    break
+                tickets = admit_problem(governor, pool.endpoints[0][2], problem, attempts)
+                if tickets is None:
+                    print(f"💸 预算已用尽，停止提交新题目（已用 ${governor.spent:.4f}，{governor.tokens} tokens）")
+                    exhausted = True
+                    break
+                submit_problem(executor, problem, tickets)
+
+            if not in_flight:
+                break
+
+            finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in finished:
+                problem_id, ticket = in_flight.pop(future)
+                governor.settle(ticket)
+                entry = tally[problem_id]
+                entry["remaining"] -= 1
+                stats["solves"] += 1
+                try:
+                    answer = future.result()
+                    verdict = local_verdict(answer, entry["problem"]["ground_truth"])
+                    if verdict is None:
+                        entry["undecided"].append(answer)
+                    elif verdict:
+                        entry["correct"] += 1
+                except Exception as e:
+                    entry["errors"] += 1
+
+                if entry["remaining"]:
+                    continue
+                del tally[problem_id]
+                if entry["errors"] == attempts:
+                    print(f"  ❌ {problem_id}: {attempts} 次求解全部失败")
+                    stats["failed"] += 1
+                    continue
+                # 失败的求解不计入正确率（与难度测试页面一致）：pass_rate = 正确次数 / valid_attempts
+                problem = entry["problem"]
+                # 本地无法判定的答案合并为一次评判调用（ANSWER_JUDGE_ENABLED 开启时，否则按答错计入）
+                entry["correct"] += sum(judge_undecided([
+                    (problem["problem_text"], problem["ground_truth"], answer) for answer in entry["undecided"]
+                ]))
+                writer.write({
+                    "id": problem_id,
+                    "difficulty": problem["difficulty"],
+                    "correct_count": entry["correct"],
+                    "pass_rate": f"{entry['correct'] / (attempts - entry['errors']) * 100:.0f}%",
+                    "ground_truth": problem["ground_truth"],
+                    "attempts": attempts,
+                    "valid_attempts": attempts - entry["errors"],
+                    "failed_attempts": entry["errors"],
+                    "judged_attempts": len(entry["undecided"])
+                })
+                stats["written"] += 1
+
+            now = time.time()
+            if now - last_print >= PROGRESS_INTERVAL:
+                last_print = now
+                elapsed = now - start_time
+                print(f"📊 已完成 {stats['written']} 题 | 求解 {stats['solves']} 次 | "
+                      f"{stats['written'] / elapsed * 3600:.0f} 题/小时 | {stats['solves'] / elapsed:.1f} 次/秒")
+                print(f"  {governor.status_line(stats['written'])}")
+
+    stats["elapsed"] = time.time() - start_time
+    return stats
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="批量难度测试，生成 final_benchmark_results.jsonl")
+    parser.add_argument("--problems", default=PROBLEMS_FILE, help=f"题目文件（默认 {PROBLEMS_FILE}）")
+    parser.add_argument("--answers", help="标准答案文件（JSON / JSONL，含 id 和 answer 或 ground_truth）；题目文件自带答案时可省略")
+    parser.add_argument("--output", default=OUTPUT_FILE, help=f"结果文件（默认 {OUTPUT_FILE}）")
+    parser.add_argument("-k", "--attempts", type=int, default=DEFAULT_ATTEMPTS,
+                        help=f"每题求解次数（默认 {DEFAULT_ATTEMPTS}）")
+    parser.add_argument("--per-endpoint", type=int, default=DEFAULT_PER_ENDPOINT,
+                        help=f"每个 Doubao 端点的并发数（默认 {DEFAULT_PER_ENDPOINT}）")
+    parser.add_argument("--flush-every", type=int, default=20, help="每攒够多少条结果写一次文件（默认 20）")
+    parser.add_argument("--max-cost", type=float, help="费用上限（USD），用尽后停止提交新题目（默认读取 LLM_BUDGET_USD）")
+    parser.add_argument("--max-tokens", type=float, help="token 上限（输入 + 输出，默认读取 LLM_BUDGET_TOKENS）")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    endpoints = doubao_endpoints()
+    if not endpoints:
+        print("❌ 错误：未配置任何 DOUBAO_API_KEY（DOUBAO_API_KEY_1 / DOUBAO_API_KEY_2）")
+        return
+
+    answer_store = ProblemStore(args.answers) if args.answers else None
+    done_ids = {str(item['id']) for item in iter_jsonl(args.output) if 'id' in item}
+    pool = EndpointPool(endpoints, args.per_endpoint)
+    governor = BudgetGovernor.from_env(args.max_cost, args.max_tokens)
+
+    start_metrics_server()
+    print("=" * 80)
+    print("🎯 批量难度测试 (Doubao Seed 1.6 Thinking)")
+    print("=" * 80)
+    print(f"题目: {args.problems} | 标准答案: {args.answers or '题目文件自带'}")
+    print(f"端点: {', '.join(e[0] for e in endpoints)}（每个 {args.per_endpoint} 并发，共 {pool.capacity}）")
+    print(f"每题求解: {args.attempts} 次")
+    if done_ids:
+        print(f"📖 检测到已有进度，跳过 {len(done_ids)} 题")
+    print("=" * 80)
+
+    problems = iter_pending(args.problems, answer_store, done_ids)
+    with BufferedJsonlWriter(args.output, flush_every=args.flush_every) as writer:
+        try:
+            stats = run_benchmark(problems, pool, args.attempts, writer, governor)
+        except KeyboardInterrupt:
+            print("\n⏸️  已中断，已完成的题目已写入结果文件，重新运行即可继续")
+            return
+
+    print("\n" + "=" * 80)
+    print("📊 难度测试完成")
+    print("=" * 80)
+    print(f"✅ 完成: {stats['written']} 题")
+    print(f"❌ 失败: {stats['failed']} 题")
+    if stats["elapsed"]:
+        print(f"⏱️  {stats['elapsed']:.0f} 秒 | {stats['written'] / stats['elapsed'] * 3600:.0f} 题/小时")
+    print(f"💾 结果已保存至: {args.output}")
+    print(governor.status_line(stats['written']))
+    print_summary()
+    print("=" * 80)
+    print("\n🎯 下一步: python3 quality_review_gpt51.py")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""
+难度测试引擎 - Doubao 求解与答案比对
+供难度测试页面、批量任务脚本共用（不依赖 Streamlit）
+"""
+import os
+import math
+import time
+import random
+import threading
+from statistics import NormalDist
+from typing import Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from llm_gateway import (
+    DOUBAO_BASE_URL, DOUBAO_MODEL_1, DOUBAO_MODEL_2,
+    AnyEvent, answer_marker_closed, stream_chat_completion, stream_chat_completion_n, gateway
+)
+from answer_equivalence import get_checker
+from answer_judge import answer_judge
+
+load_dotenv()
+
+SOLVER_SYSTEM_PROMPT = "你是一个专业的数学问题求解助手。请仔细阅读题目，深入思考，给出详细的解题步骤和最终答案。最终答案请用【答案：】标记。"
+SOLVER_TEMPERATURE = 0.7
+# 单次请求生成的样本数（chat.completions 的 n 参数）；设为 1 关闭，端点不支持时自动退回逐次请求
+SAMPLES_PER_REQUEST = max(1, int(os.getenv("DOUBAO_SAMPLES_PER_REQUEST", "4")))
+
+# 已确认不支持 n>1 的端点（请求报 400 或返回的样本数不足），进程内不再尝试
+_single_sample_endpoints = set()
+_single_sample_lock = threading.Lock()
+
+# 难度档位：(名称, 正确率下限)，按下限从高到低排列
+DIFFICULTY_BUCKETS = [("简单", 0.8), ("中等", 0.5), ("困难", 0.0)]
+
+
+def doubao_endpoints() -> List[Tuple[str, str, str]]:
+    """已配置的 Doubao 端点列表：(名称, API Key, 端点ID)"""
+    endpoints = []
+    if os.getenv("DOUBAO_API_KEY_1"):
+        endpoints.append(("Doubao 一号", os.getenv("DOUBAO_API_KEY_1"), DOUBAO_MODEL_1))
+    if os.getenv("DOUBAO_API_KEY_2"):
+        endpoints.append(("Doubao 二号", os.getenv("DOUBAO_API_KEY_2"), DOUBAO_MODEL_2))
+    return endpoints
+
+
+class EndpointPool:
+    """
+    多个 Doubao 端点的并发配额：每个端点最多 per_endpoint 个进行中的请求
+
+    acquire 选择进行中请求最少且未熔断的端点，全部占满时阻塞等待
+    """
+
+    def __init__(self, endpoints: List[Tuple[str, str, str]], per_endpoint: int):
+        self.endpoints = endpoints
+        self.per_endpoint = per_endpoint
+        self.in_flight = {endpoint[2]: 0 for endpoint in endpoints}
+        self._cond = threading.Condition()
+
+    @property
+    def capacity(self) -> int:
+        return self.per_endpoint * len(self.endpoints)
+
+    def acquire(self) -> Tuple[str, str, str]:
+        with self._cond:
+            while True:
+                available = [e for e in self.endpoints if self.in_flight[e[2]] < self.per_endpoint]
+                healthy = [e for e in available if not gateway.is_open(e[2])]
+                # 全部熔断时仍返回一个端点，由网关抛出 CircuitOpenError
+                candidates = healthy or available
+                if candidates:
+                    endpoint = min(candidates, key=lambda e: self.in_flight[e[2]])
+                    self.in_flight[endpoint[2]] += 1
+                    return endpoint
+                self._cond.wait()
+
+    def release(self, endpoint: Tuple[str, str, str]):
+        with self._cond:
+            self.in_flight[endpoint[2]] -= 1
+            self._cond.notify()
+
+
+class AttemptScheduler:
+    """
+    多道题的求解交错调度：按轮转顺序发放 (题目序号, 第几次求解)
+
+    每道题依次发放第 1 次、第 2 次……，各题的进度同步推进，不会出现一道题占满并发、其余题排队等待；
+    retire 之后的题目（如自适应采样已确定难度）不再发放（线程不安全，只在调度线程中调用）
+    """
+
+    def __init__(self, attempts: List[int]):
+        self.attempts = list(attempts)
+        self.issued = [0] * len(self.attempts)
+        self.retired = set()
+        self._cursor = 0
+
+    def next(self) -> Optional[Tuple[int, int]]:
+        """下一次求解 (题目序号, 第几次，从 1 开始)；全部发放完毕时返回 None"""
+        for _ in range(len(self.attempts)):
+            index = self._cursor
+            self._cursor = (self._cursor + 1) % len(self.attempts)
+            if index not in self.retired and self.issued[index] < self.attempts[index]:
+                self.issued[index] += 1
+                return index, self.issued[index]
+        return None
+
+    def next_batch(self, size: int) -> Optional[Tuple[int, List[int]]]:
+        """同一道题的下一批求解 (题目序号, [第几次, ...])，最多 size 次，供一次请求生成多个样本"""
+        scheduled = self.next()
+        if scheduled is None:
+            return None
+        index, first = scheduled
+        count = min(size, self.attempts[index] - self.issued[index] + 1)
+        self.issued[index] += count - 1
+        return index, list(range(first, first + count))
+
+    def retire(self, index: int):
+        self.retired.add(index)
+
+    @property
+    def remaining(self) -> int:
+        return sum(total - issued for i, (total, issued) in enumerate(zip(self.attempts, self.issued))
+                   if i not in self.retired)
+
+
+def build_solver_messages(problem_text: str) -> List[Dict]:
+    return [
+        {"role": "system", "content": SOLVER_SYSTEM_PROMPT},
+        {"role": "user", "content": f"请解答以下数学题目：\n\n{problem_text}"}
+    ]
+
+
+def solve_problem(
+    problem_text: str,
+    api_key: str,
+    model_id: str,
+    on_delta: Optional[Callable[[str, str], None]] = None,
+    cancel_event: Optional[threading.Event] = None
+) -> Dict:
+    """
+    使用 Doubao Seed 1.6 Thinking 求解一次（流式，答案输出完即停止）
+    经网关调用：慢请求自动对冲，端点持续失败时熔断（对冲副本不推送实时推理，先返回的一份胜出后另一份随即关闭）
+    cancel_event 被设置后尽快关闭流，返回结果的 cancelled 为 True
+
+    Returns:
+        Dict: stream_chat_completion 的结果（content / ttft / time_to_answer / elapsed_time ...）
+
+    Raises:
+        Exception: 调用失败或端点熔断
+    """
+    messages = build_solver_messages(problem_text)
+
+    def run(handler):
+        return lambda copy_cancel: stream_chat_completion(
+            api_key,
+            DOUBAO_BASE_URL,
+            model_id,
+            messages=messages,
+            on_delta=handler,
+            stop_when=answer_marker_closed,
+            cancel_event=AnyEvent(cancel_event, copy_cancel),
+            temperature=SOLVER_TEMPERATURE
+        )
+
+    return gateway.call(model_id, run(on_delta), hedge_fn=run(None), cancellable=True)
+
+
+def multi_sample_supported(model_id: str) -> bool:
+    """端点是否可以一次请求生成多个样本（未确认不支持前均视为支持）"""
+    with _single_sample_lock:
+        return SAMPLES_PER_REQUEST > 1 and model_id not in _single_sample_endpoints
+
+
+def _mark_single_sample(model_id: str):
+    with _single_sample_lock:
+        _single_sample_endpoints.add(model_id)
+
+
+def solve_problem_samples(
+    problem_text: str,
+    api_key: str,
+    model_id: str,
+    n: int,
+    on_delta: Optional[Callable[[int, str, str], None]] = None,
+    cancel_event: Optional[threading.Event] = None
+) -> List[Dict]:
+    """
+    一次请求生成 n 个样本（题目只发送一次）；n 为 1 或端点不支持时退回 solve_problem
+
+    端点对 n 参数报 400 或返回的样本数不足时记为不支持，返回实际得到的样本（可能为空），
+    差额由调用方改用逐次请求补足；多样本请求不对冲（副本会重复生成全部样本）
+
+    Args:
+        on_delta: 实时增量回调 (样本序号, kind, text)
+
+    Returns:
+        List[Dict]: solve_problem 格式的结果，另含生成方式 strategy（single / n=4 ...）
+
+    Raises:
+        Exception: 调用失败或端点熔断（400 除外）
+    """
+    if n <= 1 or not multi_sample_supported(model_id):
+        handler = (lambda kind, text: on_delta(0, kind, text)) if on_delta else None
+        result = solve_problem(problem_text, api_key, model_id, handler, cancel_event)
+        result["strategy"] = "single"
+        return [result]
+
+    try:
+        results = gateway.call(model_id, lambda: stream_chat_completion_n(
+            api_key,
+            DOUBAO_BASE_URL,
+            model_id,
+            messages=build_solver_messages(problem_text),
+            n=n,
+            on_delta=on_delta,
+            stop_when=answer_marker_closed,
+            cancel_event=cancel_event,
+            temperature=SOLVER_TEMPERATURE
+        ), hedge=False)
+    except Exception as e:
+        if getattr(e, "status_code", None) != 400:
+            raise
+        _mark_single_sample(model_id)
+        return []
+
+    if len(results) < n and not any(r["cancelled"] for r in results):
+        _mark_single_sample(model_id)
+    for result in results:
+        result["strategy"] = f"n={n}"
+    return results
+
+
+def solve_samples_with_pool(
+    pool: EndpointPool,
+    problem_text: str,
+    n: int,
+    on_delta: Optional[Callable[[int, str, str], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    max_retries: int = 5,
+    base_wait: float = 10
+) -> List[Dict]:
+    """
+    从端点池取最空闲的端点，一次请求生成最多 n 个样本（见 solve_problem_samples），
+    遇到速率限制时退避后换端点重试；所取端点不支持多样本时只生成 1 个，差额由调用方补足
+    并发只受各端点配额限制（按请求数计），调用方线程数与端点池总并发一致即可
+
+    Returns:
+        List[Dict]: solve_problem_samples 的结果，另含实际使用的端点ID（model）
+
+    Raises:
+        Exception: 重试耗尽或非速率限制错误
+    """
+    for attempt in range(max_retries):
+        endpoint = pool.acquire()
+        try:
+            results = solve_problem_samples(problem_text, endpoint[1], endpoint[2], n, on_delta, cancel_event)
+            for result in results:
+                result["model"] = endpoint[2]
+            return results
+        except Exception as e:
+            if attempt == max_retries - 1 or not ("429" in str(e) or "Rate limit" in str(e)):
+                raise
+        finally:
+            pool.release(endpoint)
+        wait_time = base_wait * (2 ** attempt) + random.uniform(1, 5)
+        if cancel_event is not None:
+            if cancel_event.wait(wait_time):
+                return [{"content": "", "cancelled": True, "elapsed_time": 0, "ttft": None, "time_to_answer": None}]
+        else:
+            time.sleep(wait_time)
+
+
+def solve_with_pool(
+    pool: EndpointPool,
+    problem_text: str,
+    on_delta: Optional[Callable[[str, str], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    max_retries: int = 5,
+    base_wait: float = 10
+) -> Dict:
+    """
+    从端点池取最空闲的端点求解一次，遇到速率限制时退避后换端点重试
+    并发只受各端点配额限制，调用方线程数与端点池总并发一致即可
+
+    Returns:
+        Dict: solve_problem 的结果，另含实际使用的端点ID（model）
+
+    Raises:
+        Exception: 重试耗尽或非速率限制错误
+    """
+    handler = (lambda index, kind, text: on_delta(kind, text)) if on_delta else None
+    return solve_samples_with_pool(pool, problem_text, 1, handler, cancel_event, max_retries, base_wait)[0]
+
+
+def local_verdict(model_answer, correct_answer) -> Optional[bool]:
+    """本地判定：API 错误为 False，符号 / 数值等价判定无法确定时为 None"""
+    try:
+        # 检查是否有API错误
+        if "❌" in model_answer and "求解失败" in model_answer:
+            return False
+        return get_checker(str(correct_answer)).check(model_answer)
+
+    except Exception as e:
+        return False
+
+
+def compare_answers(model_answer, correct_answer):
+    """判断模型答案是否与标准答案一致（本地等价判定，无法判定时按不一致处理）"""
+    return local_verdict(model_answer, correct_answer) is True
+
+
+def judge_undecided(items: List[Tuple[str, str, str]]) -> List[bool]:
+    """
+    对本地无法判定的答案批量调用评判模型（一次调用，按答案去重并缓存）
+
+    Args:
+        items: [(题目, 标准答案, 模型输出), ...]
+
+    Returns:
+        与 items 一一对应的结果；未开启 ANSWER_JUDGE_ENABLED 或评判失败时按答错处理
+    """
+    if not items or answer_judge is None:
+        return [False] * len(items)
+    return [verdict is True for verdict in answer_judge.judge(items)]
+
+
+def grade_answers(problem_text: str, correct_answer: str, model_answers: List[str]) -> List[bool]:
+    """判定一次运行的全部求解：先本地判定，无法判定的合并为一次评判调用"""
+    verdicts = [local_verdict(answer, correct_answer) for answer in model_answers]
+    undecided = [i for i, verdict in enumerate(verdicts) if verdict is None]
+    judged = judge_undecided([(problem_text, str(correct_answer), model_answers[i]) for i in undecided])
+    for i, verdict in zip(undecided, judged):
+        verdicts[i] = verdict
+    return verdicts
+
+
+def extract_final_answer(model_answer: str) -> str:
+    """提取【答案：】标记中的最终答案（无标记时返回末尾片段）"""
+    if "【答案：" in model_answer:
+        return model_answer.split("【答案：")[-1].split("】")[0].strip()
+    return model_answer.strip()[-200:]
+
+
+# ==================== 正确率区间与提前停止 ====================
+
+def difficulty_bucket(accuracy: float) -> str:
+    """正确率（0-1）对应的难度档位"""
+    for name, lower in DIFFICULTY_BUCKETS:
+        if accuracy >= lower:
+            return name
+    return DIFFICULTY_BUCKETS[-1][0]
+
+
+def scaled_correct_count(record: Dict) -> Optional[float]:
+    """
+    难度结果的正确次数折算到全部求解次数：correct_count × attempts / valid_attempts
+
+    失败的求解不计入正确率（valid_attempts = attempts - failed_attempts），折算后才能与按 attempts 设定的阈值比较；
+    没有 valid_attempts 的旧结果按原值；没有 correct_count 时返回 None
+    """
+    correct_count = record.get("correct_count")
+    if correct_count is None:
+        return None
+    attempts, valid_attempts = record.get("attempts"), record.get("valid_attempts")
+    if not attempts or not valid_attempts:
+        return correct_count
+    return correct_count * attempts / valid_attempts
+
+
+def wilson_interval(correct: int, total: int, confidence: float = 0.9) -> Tuple[float, float]:
+    """正确率的 Wilson 置信区间；total 为 0 时返回 (0, 1)"""
+    if total <= 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    p = correct / total
+    denominator = 1 + z * z / total
+    center = (p + z * z / (2 * total)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def decided_bucket(
+    correct: int,
+    valid: int,
+    remaining: int,
+    confidence: float = 0.9,
+    min_samples: int = 3
+) -> Optional[Tuple[str, str]]:
+    """
+    判断难度档位是否已经确定
+
+    Args:
+        correct: 正确次数
+        valid: 有效（未出错）的求解次数
+        remaining: 最多还会进行的求解次数
+        confidence: Wilson 区间的置信度
+        min_samples: 使用 Wilson 区间判断前至少需要的有效次数
+
+    Returns:
+        (档位, 原因)；尚未确定时返回 None
+    """
+    if valid <= 0:
+        return None
+    # 剩余求解无论对错（或出错不计入）都不会改变档位
+    lowest = correct / (valid + remaining)
+    highest = (correct + remaining) / (valid + remaining)
+    if difficulty_bucket(lowest) == difficulty_bucket(highest):
+        return difficulty_bucket(lowest), "剩余求解已无法改变结论"
+    if valid < min_samples:
+        return None
+    low, high = wilson_interval(correct, valid, confidence)
+    if difficulty_bucket(low) == difficulty_bucket(high):
+        return difficulty_bucket(low), f"{confidence:.0%} 置信区间 [{low:.0%}, {high:.0%}] 已落在同一档位"
+    return None
+
+
+def pass_at_k(n: int, c: int, k: int) -> float:
+    """pass@k 的无偏估计：n 次求解中 c 次正确时，任取 k 次至少一次正确的概率"""
+    if n - c < k:
+        return 1.0
+    return 1.0 - math.comb(n - c, k) / math.comb(n, k)
+
+
+def pass_at_k_interval(c: int, n: int, k: int, confidence: float = 0.95) -> Tuple[float, float]:
+    """pass@k 的近似置信区间：把 pass@1 的 Wilson 区间按 1 - (1 - p)^k 换算（假设各次求解独立）"""
+    low, high = wilson_interval(c, n, confidence)
+    return 1 - (1 - low) ** k, 1 - (1 - high) ** k
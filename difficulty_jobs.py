@@ -0,0 +1,440 @@
+"""
+难度测试后台任务 - 单题测试与批量队列在 job_manager 的后台线程中运行（不依赖 Streamlit）
+
+每次求解完成即追加一个 result 事件（含完整解答），评判结果追加 verdict 事件；
+页面按序号增量读取事件渲染结果，刷新或断线后可重新接上仍在运行的任务
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional, Tuple
+from answer_judge import answer_judge
+from difficulty_engine import (
+    SAMPLES_PER_REQUEST, EndpointPool, AttemptScheduler, doubao_endpoints, solve_problem_samples,
+    solve_samples_with_pool, multi_sample_supported, local_verdict, judge_undecided, decided_bucket
+)
+from difficulty_results import DifficultyResultWriter
+from job_manager import JobContext
+from sample_pool import sample_pool
+
+ADAPTIVE_WAVE_SIZE = 3  # 自适应采样每一轮发起的求解数
+SINGLE_MAX_WORKERS = 8  # 单个 API 求解时的最大并发
+
+
+def is_api_error(row: Dict) -> bool:
+    return "❌" in row["answer"] and "求解失败" in row["answer"]
+
+
+def attempt_result(attempt_number: int, result: Dict) -> Dict:
+    return {
+        "attempt": attempt_number,
+        "answer": result["content"],
+        "model": result.get("model"),
+        "success": True,
+        "cancelled": result["cancelled"],
+        "elapsed_time": result["elapsed_time"],
+        "ttft": result["ttft"],
+        "time_to_answer": result["time_to_answer"],
+        "strategy": result.get("strategy")
+    }
+
+
+def solve_attempts(problem_text: str, attempt_numbers: List[int], endpoint: Tuple[str, str, str],
+                   on_delta=None, cancel_event: Optional[threading.Event] = None) -> List[Dict]:
+    """
+    使用指定 API 求解一批（端点支持时一次请求生成全部样本，答案输出完即停止），异常转换为失败结果
+
+    端点不支持多样本时返回的结果少于 attempt_numbers，未覆盖的序号由调用方改用逐次请求补足
+
+    Args:
+        on_delta: 实时增量回调 (第几次, kind, text)
+    """
+    handler = (lambda index, kind, text: on_delta(attempt_numbers[index], kind, text)) if on_delta else None
+    try:
+        results = solve_problem_samples(
+            problem_text, endpoint[1], endpoint[2], len(attempt_numbers), handler, cancel_event
+        )
+        for result in results:
+            result["model"] = endpoint[2]
+    except Exception as e:
+        return [failed_attempt(attempt_number, e) for attempt_number in attempt_numbers]
+    return [attempt_result(attempt_number, result) for attempt_number, result in zip(attempt_numbers, results)]
+
+
+def solve_attempts_with_pool(pool: EndpointPool, problem_text: str, attempt_numbers: List[int],
+                             cancel_event: Optional[threading.Event] = None) -> List[Dict]:
+    """大规模测试的一批求解：从端点池取最空闲的 API，结果格式与 solve_attempts 相同"""
+    try:
+        results = solve_samples_with_pool(pool, problem_text, len(attempt_numbers), cancel_event=cancel_event)
+    except Exception as e:
+        return [failed_attempt(attempt_number, e) for attempt_number in attempt_numbers]
+    return [attempt_result(attempt_number, result) for attempt_number, result in zip(attempt_numbers, results)]
+
+
+def batch_size(models: List[str]) -> int:
+    """每次请求的样本数：任一端点仍可能支持多样本时按 SAMPLES_PER_REQUEST 分批"""
+    return SAMPLES_PER_REQUEST if any(multi_sample_supported(model) for model in models) else 1
+
+
+def count_request(requests: Dict, batch: List[Dict]):
+    """累计各生成方式的请求数与样本数：{strategy: [请求数, 样本数]}（调用失败的请求不计）"""
+    strategy = next((r["strategy"] for r in batch if r.get("strategy")), None)
+    if strategy:
+        entry = requests.setdefault(strategy, [0, 0])
+        entry[0] += 1
+        entry[1] += sum(1 for r in batch if not r["cancelled"])
+
+
+def failed_attempt(attempt_number: int, error: Exception) -> Dict:
+    return {
+        "attempt": attempt_number,
+        "answer": f"❌ 求解失败: {str(error)}",
+        "model": None,
+        "success": False,
+        "cancelled": False,
+        "elapsed_time": 0,
+        "ttft": None,
+        "time_to_answer": None,
+        "strategy": None
+    }
+
+
+def reused_result(attempt_number: int, sample: Dict) -> Dict:
+    """样本池中的历史样本转换为结果行（只保存了最终答案）"""
+    return {
+        "attempt": attempt_number,
+        "answer": f"【答案：{sample['final_answer']}】",
+        "model": sample["model"],
+        "correct": sample["correct"],
+        "elapsed_time": sample["elapsed_time"],
+        "ttft": None,
+        "time_to_answer": None,
+        "sample_id": sample["id"],
+        "reused": True
+    }
+
+
+def result_row(result: Dict, problem_text: str, correct_answer: str) -> Dict:
+    """新完成的求解转换为结果行：本地判定（无法判定时为 None），成功的求解存入样本池"""
+    row = {key: result[key] for key in ("attempt", "answer", "model", "elapsed_time", "ttft", "time_to_answer",
+                                        "strategy")}
+    if result["success"]:
+        row["correct"] = local_verdict(result["answer"], correct_answer)
+        row["sample_id"] = sample_pool.add(
+            problem_text, correct_answer, result["model"], result["answer"], row["correct"], result["elapsed_time"]
+        )
+    else:
+        row["correct"] = False
+    return row
+
+
+def pool_models(endpoints: List[Tuple[str, str, str]]) -> List[str]:
+    return [endpoint[2] for endpoint in endpoints]
+
+
+# ==================== 单题测试 ====================
+
+def run_difficulty_job(ctx: JobContext, params: Dict) -> Dict:
+    """
+    单题难度测试（job_manager 任务函数）
+
+    Args:
+        params: problem_text / correct_answer / test_count / adaptive / confidence / reuse_samples；
+            model 为所选端点ID，为 None 时所有端点共同求解（每个端点并发 per_endpoint）；
+            problem_id 不为空时结果增量写入题库
+
+    Returns:
+        Dict: 汇总状态（stop_decision / total_time / bank）
+    """
+    problem_text = params["problem_text"]
+    correct_answer = params["correct_answer"]
+    test_count = params["test_count"]
+    adaptive = params["adaptive"]
+    confidence = params["confidence"]
+    endpoints = doubao_endpoints()
+
+    fan_out = params.get("model") is None
+    if fan_out:
+        pool = EndpointPool(endpoints, params["per_endpoint"])
+        models = pool_models(endpoints)
+        wave_size = min(test_count, pool.capacity)
+        max_workers = pool.capacity
+    else:
+        matched = [endpoint for endpoint in endpoints if endpoint[2] == params["model"]]
+        if not matched:
+            raise ValueError(f"端点 {params['model']} 未配置 API Key")
+        endpoint = matched[0]
+        models = [endpoint[2]]
+        wave_size = ADAPTIVE_WAVE_SIZE
+        max_workers = min(test_count, SINGLE_MAX_WORKERS)
+
+    # 样本池：历史样本直接计入，只补足差额
+    reused = sample_pool.samples(problem_text, correct_answer, models) if params.get("reuse_samples") else []
+    dispatch_count = max(0, test_count - len(reused))
+    target = len(reused) + dispatch_count
+    writer = DifficultyResultWriter(params["problem_id"], correct_answer) if params.get("problem_id") else None
+    ctx.update_state(reused=len(reused), target=target, dispatch=dispatch_count)
+
+    results = []
+    requests = {}  # 生成方式 -> [请求数, 样本数]
+
+    def record(row):
+        results.append(row)
+        ctx.emit({"type": "result", **row})
+        if writer:
+            writer.add(row["attempt"], row["answer"], row["correct"], row["model"], row["elapsed_time"],
+                       error=is_api_error(row), strategy=row.get("strategy"))
+
+    for i, sample in enumerate(reused):
+        record(reused_result(i + 1, sample))
+    ctx.progress(len(results), target)
+
+    start_time = time.time()
+    stop_event = threading.Event()  # 难度已确定或任务被取消时关闭进行中的流
+    stop_decision = None  # 自适应采样提前停止时的 (档位, 原因)
+    futures = {}  # future -> 该请求负责的求解序号
+    pending = set()
+    issued = 0  # 已发放的求解数（不含样本池中的历史样本）
+
+    def on_delta(attempt, kind, text):
+        ctx.append_live(attempt, text)
+
+    def launch(count):
+        nonlocal issued
+        attempt_numbers = list(range(len(reused) + issued + 1, len(reused) + issued + count + 1))
+        issued += count
+        submit(attempt_numbers)
+
+    def submit(attempt_numbers):
+        # 端点支持时每个请求生成一批样本，否则逐次请求
+        size = batch_size(models)
+        for i in range(0, len(attempt_numbers), size):
+            batch = attempt_numbers[i:i + size]
+            if fan_out:
+                future = executor.submit(solve_attempts_with_pool, pool, problem_text, batch, stop_event)
+            else:
+                future = executor.submit(solve_attempts, problem_text, batch, endpoint, on_delta, stop_event)
+            futures[future] = batch
+            pending.add(future)
+
+    def adaptive_decision():
+        correct = sum(1 for r in results if r["correct"])
+        api_errors = sum(1 for r in results if is_api_error(r))
+        # 开启评判时待评判的答案对错未知，按尚未完成的求解处理
+        awaiting = sum(1 for r in results if r["correct"] is None) if answer_judge else 0
+        return decided_bucket(
+            correct, len(results) - api_errors - awaiting, target - len(results) + awaiting, confidence
+        )
+
+    # 样本池中的历史样本可能已经足以确定难度
+    if adaptive and reused:
+        stop_decision = adaptive_decision()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if stop_decision is None:
+            launch(min(wave_size, dispatch_count) if adaptive else dispatch_count)
+        ctx.update_state(running=sum(len(futures[future]) for future in pending))
+
+        while pending:
+            done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            pending.difference_update(done)
+            for future in done:
+                if future.cancelled():
+                    continue
+                batch = future.result()
+                count_request(requests, batch)
+                for result in batch:
+                    if not result["cancelled"]:
+                        record(result_row(result, problem_text, correct_answer))
+                # 端点不支持多样本时返回的样本不足，差额改用逐次请求补足
+                missing = futures[future][len(batch):]
+                if missing and not stop_event.is_set():
+                    submit(missing)
+            if done:
+                ctx.progress(len(results), target)
+
+            if ctx.cancelled:
+                stop_event.set()
+                for future in pending:
+                    future.cancel()
+            elif adaptive and stop_decision is None:
+                stop_decision = adaptive_decision()
+                if stop_decision:
+                    # 结论已确定：未开始的求解直接取消，进行中的流在下一段增量到达时关闭
+                    ctx.update_state(stop_decision=stop_decision)
+                    stop_event.set()
+                    for future in pending:
+                        future.cancel()
+                elif not pending and issued < dispatch_count:
+                    launch(min(wave_size, dispatch_count - issued))
+            if done:
+                ctx.update_state(running=sum(len(futures[future]) for future in pending), requests=requests)
+
+    # 本地无法判定的答案合并为一次评判调用（未开启 ANSWER_JUDGE_ENABLED 时按答错处理）
+    undecided = [r for r in results if r["correct"] is None]
+    if undecided:
+        ctx.update_state(judging=len(undecided) if answer_judge else 0)
+        verdicts = judge_undecided([(problem_text, correct_answer, r["answer"]) for r in undecided])
+        for r, verdict in zip(undecided, verdicts):
+            r["correct"] = verdict
+            r["judged"] = answer_judge is not None
+            ctx.emit({"type": "verdict", "attempt": r["attempt"], "correct": verdict, "judged": r["judged"]})
+            if writer:
+                writer.set_verdict(r["attempt"], verdict, judged=r["judged"])
+            # 未开启评判时样本保持未判定，下次开启评判后仍可补判
+            if r["judged"] and r.get("sample_id"):
+                sample_pool.set_verdict(r["sample_id"], verdict)
+
+    state = {"stop_decision": stop_decision, "total_time": time.time() - start_time, "judging": 0,
+             "requests": requests}
+    if writer:
+        state["bank"] = {"problem_id": writer.problem_id, "attempts": len(writer.attempts), "ok": writer.close()}
+    return state
+
+
+# ==================== 批量队列 ====================
+
+def run_queue_job(ctx: JobContext, params: Dict) -> Dict:
+    """
+    批量队列（job_manager 任务函数）：所有题目的求解按轮转顺序交错提交到所有端点组成的端点池
+
+    Args:
+        params: problems（problem_text / answer / id）/ test_count / adaptive / confidence / per_endpoint /
+            reuse_samples；problem_ids 为 {题目序号: 题库题目ID}，对应题目的结果增量写入题库
+
+    Returns:
+        Dict: 汇总状态（decisions / total_time / failed_writes）
+    """
+    problems = params["problems"]
+    test_count = params["test_count"]
+    confidence = params["confidence"]
+    endpoints = doubao_endpoints()
+    pool = EndpointPool(endpoints, params["per_endpoint"])
+    models = pool_models(endpoints)
+    reused = [
+        sample_pool.samples(problem["problem_text"], problem["answer"], models) if params.get("reuse_samples") else []
+        for problem in problems
+    ]
+    scheduler = AttemptScheduler([max(0, test_count - len(samples)) for samples in reused])
+    cancel_events = [threading.Event() for _ in problems]
+    stats = [{"correct": 0, "done": 0, "errors": 0, "running": 0, "undecided": []} for _ in problems]
+    decisions = {}  # 题目序号（字符串，JSON 键）-> (档位, 原因)
+    writers = {
+        int(index): DifficultyResultWriter(problem_id, problems[int(index)]["answer"])
+        for index, problem_id in (params.get("problem_ids") or {}).items()
+    }
+
+    def record(index, row):
+        entry = stats[index]
+        entry["done"] += 1
+        if is_api_error(row):
+            entry["errors"] += 1
+        if row["correct"] is None:
+            entry["undecided"].append(row)
+        elif row["correct"]:
+            entry["correct"] += 1
+        ctx.emit({"type": "result", "index": index, **row})
+        if index in writers:
+            writers[index].add(row["attempt"], row["answer"], row["correct"], row["model"], row["elapsed_time"],
+                               error=is_api_error(row), strategy=row.get("strategy"))
+
+    def decide(index):
+        """自适应采样：该题难度已确定时不再发放新的求解，进行中的流在下一段增量到达时关闭"""
+        entry = stats[index]
+        awaiting = len(entry["undecided"]) if answer_judge else 0
+        decision = decided_bucket(
+            entry["correct"], entry["done"] - entry["errors"] - awaiting,
+            max(0, test_count - entry["done"]) + awaiting, confidence
+        )
+        if decision:
+            decisions[str(index)] = decision
+            scheduler.retire(index)
+            cancel_events[index].set()
+
+    for index, samples in enumerate(reused):
+        for i, sample in enumerate(samples):
+            record(index, reused_result(i + 1, sample))
+        if params["adaptive"] and samples:
+            decide(index)
+    ctx.update_state(reused=[len(samples) for samples in reused], decisions=decisions,
+                     running=[0] * len(problems))
+
+    start_time = time.time()
+    in_flight = {}  # future -> (题目序号, 该请求负责的求解序号)
+    shortfall = []  # 端点不支持多样本时未生成的 (题目序号, 求解序号)，优先逐次补发
+    requests = {}  # 生成方式 -> [请求数, 样本数]
+    finished = 0
+
+    def fill(executor):
+        # 进行中的请求不超过端点池总并发，其余按轮转顺序留在调度器中；每个请求生成同一道题的一批样本
+        while len(in_flight) < pool.capacity and not ctx.cancelled:
+            if shortfall:
+                index, attempt_number = shortfall.pop(0)
+                if index in scheduler.retired:
+                    continue
+                attempt_numbers = [attempt_number]
+            else:
+                scheduled = scheduler.next_batch(batch_size(models))
+                if scheduled is None:
+                    return
+                index, attempts = scheduled
+                attempt_numbers = [len(reused[index]) + attempt for attempt in attempts]
+            future = executor.submit(
+                solve_attempts_with_pool, pool, problems[index]["problem_text"], attempt_numbers,
+                cancel_events[index]
+            )
+            in_flight[future] = (index, attempt_numbers)
+            stats[index]["running"] += len(attempt_numbers)
+
+    with ThreadPoolExecutor(max_workers=pool.capacity) as executor:
+        fill(executor)
+        while in_flight:
+            done, _ = wait(list(in_flight), timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, attempt_numbers = in_flight.pop(future)
+                stats[index]["running"] -= len(attempt_numbers)
+                batch = future.result()
+                count_request(requests, batch)
+                problem = problems[index]
+                for result in batch:
+                    if result["cancelled"]:
+                        continue
+                    finished += 1
+                    record(index, result_row(result, problem["problem_text"], problem["answer"]))
+                if not cancel_events[index].is_set():
+                    shortfall.extend((index, attempt_number) for attempt_number in attempt_numbers[len(batch):])
+                if params["adaptive"] and str(index) not in decisions:
+                    decide(index)
+
+            if ctx.cancelled:
+                for event in cancel_events:
+                    event.set()
+            fill(executor)
+            if done:
+                running = sum(entry["running"] for entry in stats)
+                queued = 0 if ctx.cancelled else scheduler.remaining + len(shortfall)
+                ctx.progress(finished, finished + running + queued)
+                ctx.update_state(decisions=decisions, running=[entry["running"] for entry in stats],
+                                 requests=requests)
+
+    # 所有题目中本地无法判定的答案合并为一次评判调用（未开启 ANSWER_JUDGE_ENABLED 时按答错处理）
+    undecided = [(index, r) for index, entry in enumerate(stats) for r in entry["undecided"]]
+    if undecided:
+        ctx.update_state(judging=len(undecided) if answer_judge else 0)
+        items = [(problems[index]["problem_text"], problems[index]["answer"], r["answer"]) for index, r in undecided]
+        for (index, r), verdict in zip(undecided, judge_undecided(items)):
+            judged = answer_judge is not None
+            ctx.emit({"type": "verdict", "index": index, "attempt": r["attempt"], "correct": verdict, "judged": judged})
+            if index in writers:
+                writers[index].set_verdict(r["attempt"], verdict, judged=judged)
+            if judged and r.get("sample_id"):
+                sample_pool.set_verdict(r["sample_id"], verdict)
+
+    return {
+        "decisions": decisions,
+        "running": [0] * len(problems),
+        "judging": 0,
+        "total_time": time.time() - start_time,
+        "requests": requests,
+        "failed_writes": sum(1 for writer in writers.values() if not writer.close())
+    }
@@ -0,0 +1,172 @@
+"""
+难度测试结果写入题库 - 每完成一次求解即记录，按批写回 problems 表
+
+test_result 保存截至目前的全部求解（JSONB），test_accuracy / difficulty / test_model 随之更新；
+页面中途中断时，已写入的求解仍保留在题库中，浏览题库和再次测试时可直接查看
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from database import db
+from answer_judge import answer_judge
+from difficulty_engine import (
+    EndpointPool, doubao_endpoints, solve_with_pool, local_verdict, judge_undecided, difficulty_bucket,
+    extract_final_answer
+)
+
+FLUSH_EVERY = 5  # 每攒够多少次求解写一次题库
+FLUSH_INTERVAL = 5.0  # 距离上次写入超过该秒数时也写一次
+FINAL_ANSWER_CHARS = 200  # 每次求解保存的最终答案字符数
+
+
+def summarize_attempts(attempts: List[Dict]) -> Dict:
+    """由逐次求解记录计算正确次数、有效次数与正确率（API 错误不计入有效次数）"""
+    valid = [a for a in attempts if not a.get("error")]
+    correct = sum(1 for a in valid if a.get("correct") is True)
+    return {
+        "total": len(attempts),
+        "valid": len(valid),
+        "correct": correct,
+        "api_errors": len(attempts) - len(valid),
+        "accuracy": correct / len(valid) if valid else None
+    }
+
+
+def find_problem_id(problem_text: str) -> Optional[str]:
+    """按题目内容哈希在题库中查找题目ID（不存在时返回 None）"""
+    problem_hash = db._calculate_hash(problem_text)
+    match = (db.get_problems_by_hashes([problem_hash]) or {}).get(problem_hash)
+    return match['id'] if match else None
+
+
+def find_problem_ids(problem_texts: List[str]) -> Dict[str, str]:
+    """批量查找（一次查询）：题目内容 -> 题目ID"""
+    hashes = {text: db._calculate_hash(text) for text in problem_texts}
+    matches = db.get_problems_by_hashes(list(hashes.values())) or {}
+    return {text: matches[h]['id'] for text, h in hashes.items() if h in matches}
+
+
+class DifficultyResultWriter:
+    """
+    一道题一次难度测试的增量写入器（线程安全）
+
+    add 记录一次求解，攒够 flush_every 次或超过 flush_interval 秒后调用一次 update_problem；
+    set_verdict 用于事后补充评判结果；close 写入剩余记录
+    """
+
+    def __init__(self, problem_id: str, answer: str, flush_every: int = FLUSH_EVERY,
+                 flush_interval: float = FLUSH_INTERVAL):
+        self.problem_id = problem_id
+        self.answer = answer
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.attempts: List[Dict] = []
+        self.flushes = 0
+        self._dirty = 0
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, attempt: int, model_answer: str, correct: Optional[bool], model: str,
+            elapsed_time: float = 0, error: bool = False, strategy: Optional[str] = None):
+        with self._lock:
+            record = {
+                "attempt": attempt,
+                "correct": correct,
+                "final_answer": extract_final_answer(model_answer)[:FINAL_ANSWER_CHARS],
+                "model": model,
+                "elapsed_time": round(elapsed_time, 2),
+                "error": error
+            }
+            if strategy:
+                record["strategy"] = strategy
+            self.attempts.append(record)
+            self._dirty += 1
+            due = self._dirty >= self.flush_every or time.time() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def set_verdict(self, attempt: int, correct: bool, judged: bool = True):
+        """更新某次求解的对错（如 LLM 评判结果），在下次 flush 时写入"""
+        with self._lock:
+            for record in self.attempts:
+                if record["attempt"] == attempt:
+                    record["correct"] = correct
+                    record["judged"] = judged
+                    self._dirty += 1
+
+    def build_updates(self) -> Dict:
+        """当前全部求解对应的 problems 表字段"""
+        summary = summarize_attempts(self.attempts)
+        models = sorted({a["model"] for a in self.attempts if a.get("model")})
+        updates = {
+            "test_model": ",".join(models)[:100] or None,
+            "test_result": {
+                "answer": self.answer,
+                **summary,
+                "attempts": [dict(a) for a in self.attempts],
+                "updated_at": datetime.now().isoformat(timespec="seconds")
+            },
+            "test_accuracy": round(summary["accuracy"] * 100, 2) if summary["accuracy"] is not None else None
+        }
+        if summary["accuracy"] is not None:
+            updates["difficulty"] = difficulty_bucket(summary["accuracy"])
+        return updates
+
+    def flush(self) -> bool:
+        with self._lock:
+            if not self._dirty:
+                return True
+            updates = self.build_updates()
+            self._dirty = 0
+            self._last_flush = time.time()
+        ok = db.update_problem(self.problem_id, updates)
+        if ok:
+            self.flushes += 1
+        return ok
+
+    def close(self) -> bool:
+        return self.flush()
+
+
+def run_and_record(
+    problem_id: str,
+    problem_text: str,
+    answer: str,
+    attempts: int,
+    per_endpoint: int = 8,
+    on_progress: Optional[Callable[[int, int], None]] = None
+) -> Dict:
+    """
+    对题库中的一道题做难度测试并增量写入（所有已配置的 Doubao 端点共同求解）
+
+    Args:
+        on_progress: 每完成一次求解回调 (已完成, 总次数)，在调用线程中执行
+
+    Returns:
+        Dict: 最终写入题库的字段
+    """
+    pool = EndpointPool(doubao_endpoints(), per_endpoint)
+    writer = DifficultyResultWriter(problem_id, answer)
+    undecided = []
+    with ThreadPoolExecutor(max_workers=max(1, min(attempts, pool.capacity))) as executor:
+        futures = {executor.submit(solve_with_pool, pool, problem_text): i + 1 for i in range(attempts)}
+        for done, future in enumerate(as_completed(futures), 1):
+            attempt = futures[future]
+            try:
+                result = future.result()
+                verdict = local_verdict(result["content"], answer)
+                writer.add(attempt, result["content"], verdict, result.get("model"), result["elapsed_time"])
+                if verdict is None:
+                    undecided.append((attempt, result["content"]))
+            except Exception as e:
+                writer.add(attempt, f"❌ 求解失败: {str(e)}", False, None, error=True)
+            if on_progress:
+                on_progress(done, attempts)
+
+    verdicts = judge_undecided([(problem_text, answer, content) for _, content in undecided])
+    for (attempt, _), verdict in zip(undecided, verdicts):
+        writer.set_verdict(attempt, verdict, judged=answer_judge is not None)
+    writer.close()
+    return writer.build_updates()
@@ -0,0 +1,280 @@
+"""
+后台任务管理 - 长时间运行的难度测试在后台线程中执行，进度和结果写入本地任务库
+
+Streamlit 页面每次交互、刷新或断线都会重新执行脚本，在脚本线程中运行的测试会随之中断、结果丢失；
+改为后台任务后，页面只按任务ID从任务库读取进度和结果（可增量读取新事件），重新打开页面即可继续查看
+
+任务库（SQLite）：
+    jobs        每个任务一行：状态、进度、汇总状态（JSON）
+    job_events  任务产生的事件（如每次求解的结果），按序号追加，页面按序号增量读取
+
+    JOB_STORE_FILE=jobs.db    # 默认位于当前目录
+
+进程退出时仍在运行的任务在下次启动时标记为 interrupted，已写入的事件保留
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import traceback
+from typing import Callable, Dict, List, Optional, Tuple
+
+JOB_STORE_FILE = os.getenv("JOB_STORE_FILE", "jobs.db")
+JOB_HISTORY_LIMIT = 20  # 任务列表默认显示的最近任务数
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        title TEXT NOT NULL,
+        params TEXT NOT NULL,
+        status TEXT NOT NULL,
+        done INTEGER NOT NULL DEFAULT 0,
+        total INTEGER NOT NULL DEFAULT 0,
+        state TEXT NOT NULL DEFAULT '{}',
+        error TEXT,
+        pid INTEGER,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        finished_at REAL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS job_events (
+        job_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        payload TEXT NOT NULL,
+        PRIMARY KEY (job_id, seq)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at)",
+]
+
+# 任务状态：running → done / failed / cancelled；进程退出时仍在运行的任务为 interrupted
+FINISHED_STATUSES = ("done", "failed", "cancelled", "interrupted")
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class JobContext:
+    """
+    传给任务函数的上下文（任务线程中使用）
+
+    emit 追加一个事件，progress / update_state 更新任务行；cancel_event 被设置后任务应尽快结束；
+    live 为只保存在内存中的实时数据（如推理过程），不写入任务库
+    """
+
+    def __init__(self, manager: "JobManager", job_id: str):
+        self.manager = manager
+        self.job_id = job_id
+        self.cancel_event = threading.Event()
+        self.live: Dict = {}
+        self.live_lock = threading.Lock()
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def emit(self, event: Dict) -> int:
+        """追加一个事件，返回序号（从 1 开始）"""
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self.manager._append_event(self.job_id, seq, event)
+        return seq
+
+    def progress(self, done: int, total: int):
+        self.manager._update(self.job_id, done=done, total=total)
+
+    def update_state(self, **state):
+        """合并更新任务的汇总状态（JSON 可序列化的值）"""
+        self.manager._merge_state(self.job_id, state)
+
+    def set_live(self, key, value):
+        with self.live_lock:
+            self.live[key] = value
+
+    def append_live(self, key, text: str):
+        with self.live_lock:
+            self.live[key] = self.live.get(key, "") + text
+
+
+class JobManager:
+    """后台任务管理（线程安全，进程内单例使用）"""
+
+    def __init__(self, path: str = JOB_STORE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._contexts: Dict[str, JobContext] = {}
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+        self._mark_interrupted()
+
+    def _mark_interrupted(self):
+        """上次进程退出时仍在运行的任务（其他存活进程中的任务不受影响）"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, pid FROM jobs WHERE status = 'running'").fetchall()
+            stale = [job_id for job_id, pid in rows if pid != os.getpid() and not _pid_alive(pid)]
+            with self._conn:
+                for job_id in stale:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'interrupted', finished_at = ?, updated_at = ? WHERE id = ?",
+                        (time.time(), time.time(), job_id)
+                    )
+
+    # ==================== 提交与取消 ====================
+
+    def submit(self, kind: str, title: str, params: Dict, target: Callable[[JobContext, Dict], Optional[Dict]]) -> str:
+        """
+        提交任务，在后台线程中执行 target(ctx, params)
+
+        Args:
+            kind: 任务类型（如 difficulty / difficulty_queue）
+            title: 任务列表中显示的标题
+            params: 任务参数（JSON 可序列化，写入任务库，不要包含 API Key）
+            target: 任务函数，返回值合并到汇总状态
+
+        Returns:
+            str: 任务ID
+        """
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO jobs (id, kind, title, params, status, pid, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 'running', ?, ?, ?)
+                """,
+                (job_id, kind, title[:200], json.dumps(params, ensure_ascii=False), os.getpid(), now, now)
+            )
+        ctx = JobContext(self, job_id)
+        self._contexts[job_id] = ctx
+        threading.Thread(target=self._run, args=(ctx, params, target), name=f"job-{job_id}", daemon=True).start()
+        return job_id
+
+    def _run(self, ctx: JobContext, params: Dict, target: Callable):
+        try:
+            state = target(ctx, params)
+            if state:
+                self._merge_state(ctx.job_id, state)
+            self._update(ctx.job_id, status="cancelled" if ctx.cancelled else "done", finished_at=time.time())
+        except Exception as e:
+            traceback.print_exc()
+            self._update(ctx.job_id, status="failed", error=str(e)[:2000], finished_at=time.time())
+        finally:
+            # 实时数据只在运行期间有意义，结束后释放
+            self._contexts.pop(ctx.job_id, None)
+
+    def cancel(self, job_id: str) -> bool:
+        """请求取消本进程中运行的任务（任务在下一个检查点结束）"""
+        ctx = self._contexts.get(job_id)
+        if ctx is None:
+            return False
+        ctx.cancel_event.set()
+        return True
+
+    # ==================== 任务库读写 ====================
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _merge_state(self, job_id: str, state: Dict):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            merged = {**json.loads(row[0]), **state} if row else state
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(merged, ensure_ascii=False), time.time(), job_id)
+            )
+
+    def _append_event(self, job_id: str, seq: int, event: Dict):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO job_events (job_id, seq, payload) VALUES (?, ?, ?)",
+                (job_id, seq, json.dumps(event, ensure_ascii=False))
+            )
+
+    @staticmethod
+    def _row_to_job(row) -> Dict:
+        keys = ("id", "kind", "title", "params", "status", "done", "total", "state", "error",
+                "created_at", "updated_at", "finished_at")
+        job = dict(zip(keys, row))
+        job["params"] = json.loads(job["params"])
+        job["state"] = json.loads(job["state"])
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """任务详情（params / state 已解析）；不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT id, kind, title, params, status, done, total, state, error, created_at, updated_at, finished_at
+                FROM jobs WHERE id = ?
+                """,
+                (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def events(self, job_id: str, after: int = 0) -> List[Tuple[int, Dict]]:
+        """序号大于 after 的事件：[(序号, 事件), ...]"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, payload FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after)
+            ).fetchall()
+        return [(seq, json.loads(payload)) for seq, payload in rows]
+
+    def list_jobs(self, kinds: Optional[List[str]] = None, limit: int = JOB_HISTORY_LIMIT) -> List[Dict]:
+        """最近的任务（新的在前）"""
+        sql = """
+            SELECT id, kind, title, params, status, done, total, state, error, created_at, updated_at, finished_at
+            FROM jobs
+        """
+        params: list = []
+        if kinds:
+            sql += f" WHERE kind IN ({', '.join('?' for _ in kinds)})"
+            params += kinds
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def live(self, job_id: str) -> Dict:
+        """本进程中运行的任务的实时数据快照（其他进程或已重启时为空）"""
+        ctx = self._contexts.get(job_id)
+        if ctx is None:
+            return {}
+        with ctx.live_lock:
+            return dict(ctx.live)
+
+    def is_running(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        return job is not None and job["status"] not in FINISHED_STATUSES
+
+
+# 全局实例（Streamlit 重新执行页面脚本时模块不会重新导入，后台任务跨重跑保留）
+job_manager = JobManager()
@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+"""
+统一批处理任务 - 对数据集运行 难度测试 / 质量审核 / 原创度检测 的任意组合
+
+每道题是一个小 DAG：difficulty → quality（只审正确次数 ≤ 阈值的题），originality 独立执行
+所有阶段共享：按服务商划分的并发预算、响应缓存、断点续传 journal、进度与 ETA 输出
+
+用法:
+    python job_runner.py dataset.json                                  # 全部阶段
+    python job_runner.py original_problems_only.json --answers answers.json --stages difficulty,quality
+    python job_runner.py dataset.json --stages originality --openai-concurrency 4
+    python job_runner.py dataset.json --finalize                       # 仅由 journal 重新生成结果文件
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+from jsonl_io import BufferedJsonlWriter, iter_jsonl, iter_records
+from llm_gateway import CircuitOpenError, get_client, gateway
+from llm_telemetry import record_llm_call, start_metrics_server, print_summary
+from difficulty_engine import (
+    SOLVER_SYSTEM_PROMPT, EndpointPool, doubao_endpoints, solve_problem, grade_answers, extract_final_answer,
+    build_solver_messages, scaled_correct_count
+)
+from prompts import REVIEW_PROMPT_TEMPLATE, ORIGINALITY_PROMPT
+from budget_governor import BudgetGovernor, BudgetExceeded
+from problem_store import ProblemStore
+
+load_dotenv()
+
+# ================= 配置区域 =================
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5.1-chat-latest")
+
+# 阶段及依赖（只在两个阶段都被选中时生效）
+STAGES = ("difficulty", "quality", "originality")
+STAGE_DEPENDENCIES = {"quality": ("difficulty",)}
+
+DEFAULT_OUTPUT = "pipeline_results.jsonl"
+CACHE_FILE = os.getenv("LLM_CACHE_FILE", "llm_response_cache.jsonl")
+
+DEFAULT_ATTEMPTS = 10  # 难度测试每题求解次数
+CORRECT_COUNT_THRESHOLD = 4  # 质量审核只审正确次数 ≤ 阈值的题目
+
+# 共享并发预算（同一服务商的所有阶段合计）
+DEFAULT_OPENAI_CONCURRENCY = 8
+DEFAULT_DOUBAO_CONCURRENCY = 16
+DEFAULT_MAX_IN_FLIGHT = 32  # 同时进行中的阶段任务数
+
+# 速率限制重试
+MAX_RETRIES = 5
+BASE_WAIT_TIME = 10
+
+# 各阶段单次调用输出（含推理）的预估 token 数，用于预留预算
+EXPECTED_OUTPUT_TOKENS = {"difficulty": 3000, "quality": 600, "originality": 1500}
+# ===========================================
+
+
+class ResponseCache:
+    """
+    磁盘响应缓存（JSONL 追加写）：相同请求只调用一次，重跑时与各阶段之间共享
+
+    只缓存解析成功的响应，解析失败的请求下次会重新发起
+    """
+
+    def __init__(self, path: str, enabled: bool = True):
+        self.enabled = enabled
+        self.hits = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._writer = BufferedJsonlWriter(path, flush_every=20) if enabled else None
+        if enabled:
+            for item in iter_jsonl(path):
+                self._entries[item['key']] = item['response']
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        if not self.enabled:
+            return None
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self.hits += 1
+            return response
+
+    def put(self, key: str, response):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = response
+        self._writer.write({"key": key, "response": response})
+
+    def flush(self):
+        if self._writer:
+            self._writer.flush()
+
+
+class Progress:
+    """进度与 ETA 输出（只在调度线程中调用）"""
+
+    def __init__(self, total: int, governor=None, interval: float = 5.0):
+        self.total = total
+        self.governor = governor
+        self.done = 0
+        self.failed = 0
+        self.interval = interval
+        self.start_time = time.time()
+        self._last_print = 0.0
+
+    def advance(self, failed: bool = False):
+        self.done += 1
+        if failed:
+            self.failed += 1
+        now = time.time()
+        if now - self._last_print >= self.interval or self.done == self.total:
+            self._last_print = now
+            self.print_status()
+
+    def print_status(self):
+        elapsed = time.time() - self.start_time
+        rate = self.done / elapsed if elapsed else 0.0
+        remaining = (self.total - self.done) / rate if rate else None
+        percent = self.done / self.total * 100 if self.total else 100.0
+        eta = format_duration(remaining) if remaining is not None else "-"
+        print(f"📊 [{self.done}/{self.total}] {percent:.1f}% | 失败 {self.failed} | "
+              f"{rate * 60:.1f} 任务/分钟 | 已用 {format_duration(elapsed)} | 预计剩余 {eta}")
+        if self.governor:
+            print(f"   {self.governor.status_line(self.done - self.failed)}")
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}小时{seconds % 3600 // 60}分"
+    if seconds >= 60:
+        return f"{seconds // 60}分{seconds % 60}秒"
+    return f"{seconds}秒"
+
+
+def is_rate_limited(error: Exception) -> bool:
+    error_str = str(error)
+    return "429" in error_str or "Rate limit" in error_str
+
+
+class RunContext:
+    """一次运行中各阶段共享的资源"""
+
+    def __init__(self, args):
+        self.cache = ResponseCache(CACHE_FILE, enabled=not args.no_cache)
+        self.openai_budget = threading.BoundedSemaphore(args.openai_concurrency)
+        # Doubao 并发预算按端点平分，每次求解选择最空闲的端点
+        endpoints = doubao_endpoints()
+        self.doubao_pool = EndpointPool(endpoints, max(1, args.doubao_concurrency // max(1, len(endpoints))))
+        self.attempts = args.attempts
+        self.review_all = args.review_all
+        self.governor = BudgetGovernor.from_env(args.max_cost, args.max_tokens)
+        # 难度测试的单次求解在独立线程池中执行，避免占满阶段任务线程
+        self.attempt_pool = ThreadPoolExecutor(max_workers=args.doubao_concurrency)
+
+    def admit(self, model, prompt, stage):
+        """预留一次调用的预算，不足时抛出 BudgetExceeded"""
+        ticket = self.governor.admit(model, prompt, EXPECTED_OUTPUT_TOKENS[stage])
+        if ticket is None:
+            raise BudgetExceeded(f"预算已用尽（已用 ${self.governor.spent:.4f}，{self.governor.tokens} tokens）")
+        return ticket
+
+    def close(self):
+        self.attempt_pool.shutdown(wait=True)
+        self.cache.flush()
+        self.governor.close()
+
+
+# ==================== 模型调用 ====================
+
+def openai_request(ctx, stage, prompt, web_search=False, parse=None):
+    """
+    调用 OpenAI（共享并发预算、缓存、429 退避重试、熔断）
+
+    Args:
+        parse: 对返回文本的解析函数，抛出异常时不写缓存
+
+    Returns:
+        解析后的结果（未提供 parse 时为原始文本）
+    """
+    parse = parse or (lambda text: text)
+    key = ResponseCache.make_key(OPENAI_MODEL, "web_search" if web_search else "chat", prompt)
+    cached = ctx.cache.get(key)
+    if cached is not None:
+        return parse(cached)
+
+    client = get_client(OPENAI_API_KEY)
+
+    def call():
+        if web_search:
+            response = client.responses.create(
+                model=OPENAI_MODEL,
+                tools=[{"type": "web_search"}],
+                input=prompt
+            )
+            return response, response.output_text
+        response = client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            response_format={"type": "json_object"}
+        )
+        return response, response.choices[0].message.content
+
+    ticket = ctx.admit(OPENAI_MODEL, prompt, stage)
+    try:
+        for attempt in range(MAX_RETRIES):
+            start_time = time.time()
+            try:
+                with ctx.openai_budget:
+                    response, text = gateway.call(OPENAI_MODEL, call, hedge=False)
+                record_llm_call("openai", OPENAI_MODEL, time.time() - start_time,
+                                usage=response.usage, stage=stage)
+                break
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                will_retry = is_rate_limited(e) and attempt < MAX_RETRIES - 1
+                # 每次尝试各记一条；会被重试的失败尝试计 1 次重试，汇总即为总重试次数
+                record_llm_call("openai", OPENAI_MODEL, time.time() - start_time,
+                                retries=int(will_retry), success=False, stage=stage)
+                if not will_retry:
+                    raise
+                wait_time = BASE_WAIT_TIME * (2 ** attempt) + random.uniform(1, 5)
+                print(f"  ⚠️  触发速率限制 (429)。休眠 {wait_time:.1f}秒后重试 ({attempt+1}/{MAX_RETRIES})...")
+                time.sleep(wait_time)
+    finally:
+        ctx.governor.settle(ticket)
+
+    result = parse(text)
+    ctx.cache.put(key, text)
+    return result
+
+
+def doubao_attempt(ctx, problem_text, attempt_index):
+    """
+    难度测试的单次求解（共享并发预算与缓存，失败时换端点重试）
+
+    缓存键包含求解序号：同一题的 k 次求解互不复用，但中断重跑时已完成的求解不再重复调用
+    """
+    key = ResponseCache.make_key("doubao-solver", SOLVER_SYSTEM_PROMPT, problem_text, attempt_index)
+    cached = ctx.cache.get(key)
+    if cached is not None:
+        return cached
+
+    prompt = "\n".join(m["content"] for m in build_solver_messages(problem_text))
+    ticket = ctx.admit(ctx.doubao_pool.endpoints[0][2], prompt, "difficulty")
+    try:
+        for attempt in range(MAX_RETRIES):
+            endpoint = ctx.doubao_pool.acquire()
+            try:
+                content = solve_problem(problem_text, endpoint[1], endpoint[2])["content"]
+                break
+            except Exception as e:
+                if attempt == MAX_RETRIES - 1:
+                    raise
+                rate_limited = is_rate_limited(e)
+            finally:
+                ctx.doubao_pool.release(endpoint)
+            if rate_limited:
+                time.sleep(BASE_WAIT_TIME * (2 ** attempt) + random.uniform(1, 5))
+    finally:
+        ctx.governor.settle(ticket)
+
+    ctx.cache.put(key, content)
+    return content
+
+
+# ==================== 阶段 ====================
+
+def run_difficulty(ctx, problem, results):
+    """难度测试：k 次求解并与标准答案比对"""
+    ground_truth = problem.get('answer') or problem.get('ground_truth')
+    if not ground_truth:
+        return {"error": "缺少标准答案"}
+
+    futures = [
+        ctx.attempt_pool.submit(doubao_attempt, ctx, problem['problem_text'], i)
+        for i in range(ctx.attempts)
+    ]
+    wait(futures)
+
+    answers = []
+    failed = 0
+    for future in futures:
+        try:
+            answers.append(future.result())
+        except BudgetExceeded:
+            # 只完成部分求解的题不计入结果（已完成的求解在缓存中，预算补足后重跑可复用）
+            raise
+        except Exception:
+            failed += 1
+    if not answers:
+        raise RuntimeError(f"{ctx.attempts} 次求解全部失败")
+
+    # 本地无法判定的答案合并为一次评判调用（ANSWER_JUDGE_ENABLED 开启时）
+    correct_count = sum(grade_answers(problem['problem_text'], str(ground_truth), answers))
+    return {
+        "correct_count": correct_count,
+        "attempts": ctx.attempts,
+        "valid_attempts": len(answers),
+        "failed_attempts": failed,
+        # 失败的求解不计入正确率（与难度测试页面、difficulty_benchmark 一致）
+        "pass_rate": f"{correct_count / len(answers) * 100:.0f}%",
+        "ground_truth": ground_truth,
+        "final_answers": [extract_final_answer(answer) for answer in answers]
+    }
+
+
+def run_quality(ctx, problem, results):
+    """质量审核：只审正确次数 ≤ 阈值的题目（没有难度结果时全部审核）"""
+    difficulty = results.get("difficulty") or {}
+    # 失败的求解不计入，正确次数按 valid_attempts 折算到全部求解次数后再与阈值比较
+    correct_count = scaled_correct_count(difficulty if "correct_count" in difficulty else problem)
+    if not ctx.review_all and correct_count is not None and correct_count > CORRECT_COUNT_THRESHOLD:
+        return {"skipped": f"正确次数 {correct_count:g} > {CORRECT_COUNT_THRESHOLD}"}
+
+    prompt = REVIEW_PROMPT_TEMPLATE.format(
+        problem_text=problem['problem_text'],
+        difficulty=problem.get('difficulty', 'Unknown')
+    )
+    return {"review": openai_request(ctx, "quality", prompt, parse=json.loads)}
+
+
+def run_originality(ctx, problem, results):
+    """原创度检测：联网搜索相似题目"""
+    analysis = openai_request(ctx, "originality", ORIGINALITY_PROMPT + f"\n\n{problem['problem_text']}", web_search=True)
+    return {
+        "is_original_guess": "STATUS: ORIGINAL" in analysis,
+        "gpt_analysis": analysis
+    }
+
+
+STAGE_RUNNERS = {
+    "difficulty": run_difficulty,
+    "quality": run_quality,
+    "originality": run_originality,
+}
+
+
+# ==================== 数据与 journal ====================
+
+def load_dataset(path, answers_path=None):
+    """读取数据集（JSON 数组 / JSONL），可另附标准答案文件（经索引按 id 合并）"""
+    answer_store = ProblemStore(answers_path) if answers_path else None
+
+    problems = []
+    for idx, item in enumerate(iter_records(path)):
+        problem = dict(item)
+        problem['id'] = str(item.get('id', f"unknown_{idx}"))
+        problem['problem_text'] = item.get('problem_text') or item.get('problem') or item.get('question') or ''
+        answer = answer_store.get(problem['id']) if answer_store else None
+        if answer and (answer.get('answer') or answer.get('ground_truth')):
+            problem['answer'] = answer.get('answer') or answer.get('ground_truth')
+        if not problem['problem_text']:
+            print(f"⚠️ 跳过空题目 ID: {problem['id']}")
+            continue
+        problems.append(problem)
+    return problems
+
+
+def load_journal(path):
+    """读取 journal：{题目ID: {阶段: 结果}}"""
+    done = {}
+    for entry in iter_jsonl(path):
+        done.setdefault(entry['id'], {})[entry['stage']] = entry['result']
+    return done
+
+
+def finalize_results(journal_path, output_path, problems=None):
+    """由 journal 生成每题一行的结果文件（results 按阶段存放，同一阶段以最后一条为准，按数据集顺序输出）"""
+    done = load_journal(journal_path)
+    order = [p['id'] for p in problems if p['id'] in done] if problems else list(done)
+    order += [pid for pid in done if pid not in set(order)]
+    meta = {p['id']: p for p in problems or []}
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for pid in order:
+            row = {"id": pid, "difficulty": meta.get(pid, {}).get('difficulty'), "results": done[pid]}
+            f.write(json.dumps(row, ensure_ascii=False) + '\n')
+    print(f"📝 已生成结果文件 {output_path}（{len(order)} 题）")
+
+
+# ==================== 调度 ====================
+
+def run_pipeline(ctx, problems, stages, journal_path, max_in_flight):
+    """
+    按题目 DAG 调度各阶段：依赖满足即提交，同时进行的任务数不超过 max_in_flight
+
+    阶段失败不写 journal（下次运行重试），本次运行中依赖它的阶段也不再执行；
+    预算用尽后不再提交新任务，等进行中的任务结束后退出
+    """
+    done = load_journal(journal_path)
+    todo = [
+        (problem, [s for s in stages if s not in done.get(problem['id'], {})])
+        for problem in problems
+    ]
+    todo = [(problem, remaining) for problem, remaining in todo if remaining]
+    total = sum(len(remaining) for _, remaining in todo)
+    if done:
+        print(f"📖 检测到已有进度：{len(done)} 题已有结果，剩余 {total} 个阶段任务")
+    if not total:
+        return
+
+    progress = Progress(total, ctx.governor)
+    pending_problems = iter(todo)
+    active = {}  # 题目ID -> {"problem", "results", "remaining", "running", "failed"}
+    in_flight = {}
+    halted = False
+
+    def refill():
+        while len(active) < max_in_flight:
+            item = next(pending_problems, None)
+            if item is None:
+                return
+            problem, remaining = item
+            active[problem['id']] = {
+                "problem": problem,
+                "results": dict(done.get(problem['id'], {})),
+                "remaining": list(remaining),
+                "running": set(),
+                "failed": set()
+            }
+
+    with BufferedJsonlWriter(journal_path, flush_every=10) as journal, \
+            ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        while True:
+            if halted:
+                if not in_flight:
+                    break
+            else:
+                refill()
+
+            # 提交依赖已满足的阶段；依赖失败的阶段本次跳过；接近预算上限时降低并发
+            cap = ctx.governor.concurrency(max_in_flight)
+            for pid in list(active) if not halted else []:
+                state = active[pid]
+                for stage in list(state["remaining"]):
+                    if len(in_flight) >= cap:
+                        break
+                    if stage in state["running"]:
+                        continue
+                    deps = [d for d in STAGE_DEPENDENCIES.get(stage, ()) if d in stages]
+                    if any(d in state["failed"] for d in deps):
+                        state["remaining"].remove(stage)
+                        state["failed"].add(stage)
+                        progress.advance(failed=True)
+                        continue
+                    if all(d in state["results"] for d in deps):
+                        future = executor.submit(STAGE_RUNNERS[stage], ctx, state["problem"], dict(state["results"]))
+                        in_flight[future] = (pid, stage)
+                        state["running"].add(stage)
+                if not state["remaining"]:
+                    del active[pid]
+
+            if not in_flight:
+                # refill 之后仍无活跃题目，说明全部调度完毕
+                if not active:
+                    break
+                continue
+
+            finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in finished:
+                pid, stage = in_flight.pop(future)
+                state = active[pid]
+                state["running"].discard(stage)
+                state["remaining"].remove(stage)
+                try:
+                    result = future.result()
+                except BudgetExceeded as e:
+                    if not halted:
+                        print(f"💸 {e}，停止提交新任务，等待进行中的任务结束")
+                        halted = True
+                    continue
+                except Exception as e:
+                    print(f"  ❌ {pid} [{stage}] 失败: {e}")
+                    state["failed"].add(stage)
+                    progress.advance(failed=True)
+                    continue
+                state["results"][stage] = result
+                journal.write({"id": pid, "stage": stage, "result": result, "ts": time.time()})
+                progress.advance()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="对数据集运行 难度测试 / 质量审核 / 原创度检测")
+    parser.add_argument("dataset", help="数据集文件（JSON 数组或 JSONL，支持 .gz）")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"要运行的阶段，逗号分隔（默认: {','.join(STAGES)}）")
+    parser.add_argument("--answers", help="标准答案文件（JSON / JSONL，含 id 和 answer 或 ground_truth）")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help=f"结果文件（默认: {DEFAULT_OUTPUT}）")
+    parser.add_argument("--journal", help="断点续传 journal（默认: <output>.journal.jsonl）")
+    parser.add_argument("--attempts", type=int, default=DEFAULT_ATTEMPTS,
+                        help=f"难度测试每题求解次数（默认 {DEFAULT_ATTEMPTS}）")
+    parser.add_argument("--openai-concurrency", type=int, default=DEFAULT_OPENAI_CONCURRENCY,
+                        help=f"OpenAI 并发预算（默认 {DEFAULT_OPENAI_CONCURRENCY}）")
+    parser.add_argument("--doubao-concurrency", type=int, default=DEFAULT_DOUBAO_CONCURRENCY,
+                        help=f"Doubao 并发预算，所有端点合计（默认 {DEFAULT_DOUBAO_CONCURRENCY}）")
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help=f"同时进行中的阶段任务数（默认 {DEFAULT_MAX_IN_FLIGHT}）")
+    parser.add_argument("--review-all", action="store_true", help="质量审核不按正确次数筛选")
+    parser.add_argument("--no-cache", action="store_true", help="不读写响应缓存")
+    parser.add_argument("--max-cost", type=float, help="费用上限（USD），用尽后停止提交新任务（默认读取 LLM_BUDGET_USD）")
+    parser.add_argument("--max-tokens", type=float, help="token 上限（输入 + 输出，默认读取 LLM_BUDGET_TOKENS）")
+    parser.add_argument("--finalize", action="store_true", help="仅由 journal 重新生成结果文件")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    journal_path = args.journal or os.path.splitext(args.output)[0] + ".journal.jsonl"
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        print(f"❌ 未知阶段: {', '.join(unknown)}（可选: {', '.join(STAGES)}）")
+        return
+
+    problems = load_dataset(args.dataset, args.answers)
+    if args.finalize:
+        finalize_results(journal_path, args.output, problems)
+        return
+
+    if ("quality" in stages or "originality" in stages) and not OPENAI_API_KEY:
+        print("❌ 错误：未找到 OPENAI_API_KEY 环境变量")
+        return
+    if "difficulty" in stages and not doubao_endpoints():
+        print("❌ 错误：未配置任何 DOUBAO_API_KEY（DOUBAO_API_KEY_1 / DOUBAO_API_KEY_2）")
+        return
+
+    start_metrics_server()
+    print("=" * 80)
+    print("🧩 统一批处理任务")
+    print("=" * 80)
+    print(f"数据集: {args.dataset}（{len(problems)} 题）")
+    print(f"阶段: {' → '.join(stages)}")
+    print(f"并发预算: OpenAI {args.openai_concurrency} | Doubao {args.doubao_concurrency} | 任务 {args.max_in_flight}")
+    print(f"Journal: {journal_path}")
+    print("=" * 80)
+
+    ctx = RunContext(args)
+    try:
+        run_pipeline(ctx, problems, stages, journal_path, args.max_in_flight)
+    except KeyboardInterrupt:
+        print("\n⏸️  已中断，已完成的结果保存在 journal 中，重新运行即可继续")
+    finally:
+        ctx.close()
+
+    finalize_results(journal_path, args.output, problems)
+    print(f"💾 缓存命中: {ctx.cache.hits} 次")
+    print(ctx.governor.status_line(len(load_journal(journal_path))))
+    print_summary()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+JSON / JSONL 读写工具 - 流式读取、批量缓冲追加写入
+"""
+import os
+import io
+import gzip
+import json
+import time
+import threading
+from typing import Callable, Dict, Iterator, Optional
+
+# 流式读取时每次读入的字符数
+READ_CHUNK_SIZE = 1 << 16
+
+
+def open_for_append(path: str):
+    """以追加模式打开 JSONL；若上次崩溃留下未换行的半行，先补换行，避免与新记录粘连"""
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b'\n'
+        if needs_newline:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write('\n')
+    return open(path, 'a', encoding='utf-8')
+
+
+class BufferedJsonlWriter:
+    """
+    JSONL 追加写入器：攒够 flush_every 条或超过 flush_interval 秒后一次性写入并落盘
+
+    每次 flush 只写完整的行，进程崩溃最多丢失未 flush 的缓冲记录，
+    已写入的记录可直接用于断点续传
+    """
+
+    def __init__(self, path: str, flush_every: int = 50, flush_interval: float = 5.0):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+        self.written = 0
+
+    def write(self, record: Dict):
+        """追加一条记录（必要时触发 flush）"""
+        with self._lock:
+            self._buffer.append(json.dumps(record, ensure_ascii=False) + '\n')
+            if len(self._buffer) >= self.flush_every or time.time() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.time()
+        if not self._buffer:
+            return
+        with open_for_append(self.path) as f:
+            f.write(''.join(self._buffer))
+            f.flush()
+            os.fsync(f.fileno())
+        self.written += len(self._buffer)
+        self._buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+
+def iter_jsonl(path: str):
+    """逐行读取 JSONL，跳过空行和损坏的行（如崩溃时写了一半的最后一行）"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def read_id_index(path: str) -> set:
+    """读取 ID 索引文件（每行一个 ID）"""
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r', encoding='utf-8') as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+
+def open_text(path: str):
+    """以文本方式打开文件，自动识别 gzip（按 .gz 后缀或文件头）"""
+    with open(path, 'rb') as f:
+        is_gzip = f.read(2) == b'\x1f\x8b'
+    if is_gzip or path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def _iter_json_array(f, buffer: str) -> Iterator:
+    """增量解析顶层 JSON 数组，逐个产出元素（buffer 为已读入、以 '[' 开头的内容）"""
+    decoder = json.JSONDecoder()
+    pos = buffer.index('[') + 1
+    eof = False
+
+    while True:
+        # 跳过空白和分隔逗号
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            chunk = f.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+
+        if pos >= len(buffer):
+            raise json.JSONDecodeError("JSON 数组未结束", buffer, pos)
+        if buffer[pos] == ']':
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+            # 元素恰好在缓冲区末尾时可能被截断（如数字），再多读一些确认
+            if end == len(buffer) and not eof:
+                raise json.JSONDecodeError("需要更多数据", buffer, end)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # 按已缓冲长度成倍读取，超大记录也只需重试对数次
+            chunk = f.read(max(READ_CHUNK_SIZE, len(buffer) - pos))
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        yield item
+        pos = end
+        # 丢弃已解析部分，保持内存占用与单条记录大小相当
+        if pos > READ_CHUNK_SIZE:
+            buffer, pos = buffer[pos:], 0
+
+
+def iter_records(path: str, on_invalid: Optional[Callable[[str, Exception], None]] = None) -> Iterator[Dict]:
+    """
+    流式读取 JSON 数组或 JSONL 文件（支持 gzip），逐条产出记录
+
+    内存占用只与单条记录大小相关，与文件大小无关
+
+    Args:
+        path: 文件路径
+        on_invalid: JSONL 遇到损坏的行时以 (行内容, 异常) 调用并跳过该行；
+            为 None 时直接抛出（JSON 数组格式损坏时总是抛出）
+    """
+    def load(row):
+        try:
+            yield json.loads(row)
+        except json.JSONDecodeError as e:
+            if on_invalid is None:
+                raise
+            on_invalid(row, e)
+
+    with open_text(path) as f:
+        # 找到第一个非空白字符判断格式
+        buffer = ''
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                return
+            buffer += chunk
+            stripped = buffer.lstrip()
+            if stripped:
+                break
+
+        if stripped.startswith('['):
+            yield from _iter_json_array(f, stripped)
+            return
+
+        # JSONL：已读入部分的最后一行可能不完整，与后续第一行拼接
+        rows = buffer.split('\n')
+        pending = rows.pop()
+        for row in rows:
+            if row.strip():
+                yield from load(row)
+        for line in f:
+            row, pending = pending + line, ''
+            if row.strip():
+                yield from load(row)
+        if pending.strip():
+            yield from load(pending)
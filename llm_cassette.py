@@ -0,0 +1,245 @@
+"""
+LLM 录制 / 回放 - 离线压测与性能分析批量脚本和页面
+
+record: 正常调用服务商，同时把每次请求的参数、响应（流式响应逐块记录到达时间）写入 cassette 文件
+replay: 不发出任何网络请求，按请求参数从 cassette 中取出响应，并按录制时的耗时或合成的延迟分布返回
+
+通过 llm_gateway.get_client 取得的客户端自动生效：
+    LLM_CASSETTE_MODE=record python job_runner.py dataset.json
+    LLM_CASSETTE_MODE=replay LLM_CASSETTE_SPEED=0.1 python job_runner.py dataset.json --no-cache
+
+相同参数的请求（如同一道题的 k 次求解）录制多次时，回放按录制顺序轮流返回；
+Batch API（files / batches）等其他接口不录制，直接透传给原客户端
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Dict, Optional
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from openai.types.responses import Response
+
+CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off")  # off / record / replay
+CASSETTE_FILE = os.getenv("LLM_CASSETTE_FILE", "llm_cassette.jsonl")
+# 回放延迟: recorded（录制耗时）/ none / fixed:秒数 / lognormal:中位数秒数,sigma
+CASSETTE_LATENCY = os.getenv("LLM_CASSETTE_LATENCY", "recorded")
+CASSETTE_SPEED = float(os.getenv("LLM_CASSETTE_SPEED", "1.0"))  # 回放延迟倍率，0.1 即按 10 倍速回放
+
+RESPONSE_TYPES = {"chat.completions": ChatCompletion, "responses": Response}
+
+
+class CassetteMissError(Exception):
+    """回放模式下 cassette 中没有该请求的录制"""
+    pass
+
+
+class RecordedError(Exception):
+    """回放录制时服务商返回的错误（保留原错误信息，429 等仍会触发调用方的重试逻辑）"""
+    pass
+
+
+def request_key(base_url: str, endpoint: str, params: Dict) -> str:
+    """请求参数的哈希（与参数顺序无关）"""
+    payload = json.dumps([base_url, endpoint, params], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LatencyModel:
+    """回放延迟：录制耗时或合成分布，再乘以倍率"""
+
+    def __init__(self, spec: str = "recorded", speed: float = 1.0):
+        self.speed = speed
+        self.kind, _, args = spec.partition(":")
+        self.args = [float(x) for x in args.split(",") if x]
+        if self.kind not in ("recorded", "none", "fixed", "lognormal"):
+            raise ValueError(f"无法识别的回放延迟: {spec}（recorded / none / fixed:秒数 / lognormal:中位数,sigma）")
+
+    def sample(self, recorded: float) -> float:
+        if self.kind == "none":
+            return 0.0
+        if self.kind == "fixed":
+            latency = self.args[0]
+        elif self.kind == "lognormal":
+            median, sigma = self.args
+            latency = median * random.lognormvariate(0.0, sigma)
+        else:
+            latency = recorded
+        return latency * self.speed
+
+
+class Cassette:
+    """录制 / 回放存储（JSONL，每行一次调用；线程安全）"""
+
+    def __init__(self, path: str, mode: str, latency: LatencyModel):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"无法识别的 LLM_CASSETTE_MODE: {mode}（off / record / replay）")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._recordings = defaultdict(list)
+        self._cursor = defaultdict(int)
+        self._file = None
+        if mode == "replay":
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._recordings[entry["key"]].append(entry)
+            print(f"📼 回放模式：已加载 {sum(len(v) for v in self._recordings.values())} 条录制（{path}）")
+        else:
+            # 录制是为了离线复现，每条立即落盘，进程被中断也不丢失
+            self._file = open(path, 'a', encoding='utf-8')
+            print(f"📼 录制模式：LLM 调用将追加写入 {path}")
+
+    @classmethod
+    def from_env(cls) -> Optional["Cassette"]:
+        """LLM_CASSETTE_MODE 为 off 时返回 None"""
+        if CASSETTE_MODE == "off":
+            return None
+        return cls(CASSETTE_FILE, CASSETTE_MODE, LatencyModel(CASSETTE_LATENCY, CASSETTE_SPEED))
+
+    def record(self, entry: Dict):
+        line = json.dumps(entry, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def next_recording(self, key: str, endpoint: str, model: str) -> Dict:
+        with self._lock:
+            recordings = self._recordings.get(key)
+            if not recordings:
+                raise CassetteMissError(f"cassette 中没有 {endpoint} / {model} 的该请求录制")
+            index = self._cursor[key] % len(recordings)
+            self._cursor[key] += 1
+            return recordings[index]
+
+    def wrap(self, client, base_url: str) -> "CassetteClient":
+        return CassetteClient(client, self, base_url)
+
+
+class _RecordingStream:
+    """录制流式响应：逐块转发并记录到达时间，流结束或被提前关闭时写入 cassette"""
+
+    def __init__(self, stream, cassette: Cassette, entry: Dict, start_time: float):
+        self._stream = stream
+        self._cassette = cassette
+        self._entry = entry
+        self._start_time = start_time
+        self._chunks = []
+        self._saved = False
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                self._chunks.append([time.time() - self._start_time, chunk.model_dump(mode="json")])
+                yield chunk
+        except Exception as e:
+            self._entry["error"] = str(e)
+            raise
+        finally:
+            self._save()
+
+    def _save(self):
+        if self._saved:
+            return
+        self._saved = True
+        self._entry["latency"] = time.time() - self._start_time
+        self._entry["chunks"] = self._chunks
+        self._cassette.record(self._entry)
+
+    def close(self):
+        self._stream.close()
+        self._save()
+
+
+class _ReplayStream:
+    """回放流式响应：按录制的相对到达时间（按回放延迟缩放）逐块返回"""
+
+    def __init__(self, entry: Dict, latency: float):
+        self._entry = entry
+        self._scale = latency / entry["latency"] if entry["latency"] else 0.0
+
+    def __iter__(self):
+        start_time = time.time()
+        for offset, chunk in self._entry["chunks"]:
+            delay = start_time + offset * self._scale - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            yield ChatCompletionChunk.model_validate(chunk)
+        if self._entry.get("error"):
+            raise RecordedError(self._entry["error"])
+
+    def close(self):
+        pass
+
+
+class _CassetteEndpoint:
+    """包装单个 create 接口"""
+
+    def __init__(self, owner: "CassetteClient", endpoint: str, create):
+        self._owner = owner
+        self._endpoint = endpoint
+        self._create = create
+
+    def create(self, **params):
+        cassette = self._owner.cassette
+        stream = bool(params.get("stream"))
+        if stream and self._endpoint != "chat.completions":
+            # 目前只有 chat.completions 使用流式调用
+            if cassette.mode == "replay":
+                raise CassetteMissError(f"不支持回放 {self._endpoint} 的流式调用")
+            return self._create(**params)
+
+        key = request_key(self._owner.base_url, self._endpoint, params)
+        model = params.get("model", "")
+        if cassette.mode == "replay":
+            return self._replay(cassette.next_recording(key, self._endpoint, model), stream)
+
+        entry = {"key": key, "endpoint": self._endpoint, "model": model, "stream": stream, "ts": time.time()}
+        start_time = time.time()
+        try:
+            response = self._create(**params)
+        except Exception as e:
+            entry.update(latency=time.time() - start_time, error=str(e))
+            cassette.record(entry)
+            raise
+        if stream:
+            return _RecordingStream(response, cassette, entry, start_time)
+        entry.update(latency=time.time() - start_time, response=response.model_dump(mode="json"))
+        cassette.record(entry)
+        return response
+
+    def _replay(self, entry: Dict, stream: bool):
+        latency = self._owner.cassette.latency.sample(entry["latency"])
+        if stream and "chunks" in entry:
+            return _ReplayStream(entry, latency)
+        # 非流式调用，或流式调用在返回第一块之前就报错（如 429）
+        time.sleep(latency)
+        if entry.get("error"):
+            raise RecordedError(entry["error"])
+        return RESPONSE_TYPES[self._endpoint].model_validate(entry["response"])
+
+
+class CassetteClient:
+    """OpenAI 客户端包装：chat.completions.create 与 responses.create 经过录制 / 回放，其余属性透传"""
+
+    def __init__(self, client, cassette: Cassette, base_url: str):
+        self._client = client
+        self.cassette = cassette
+        self.base_url = base_url
+        self.chat = SimpleNamespace(
+            completions=_CassetteEndpoint(self, "chat.completions", client.chat.completions.create)
+        )
+        self.responses = _CassetteEndpoint(self, "responses", client.responses.create)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+# 全局实例（LLM_CASSETTE_MODE=off 时为 None）
+cassette = Cassette.from_env()
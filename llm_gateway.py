@@ -0,0 +1,645 @@
+"""
+LLM 调用网关 - 统一管理各服务商客户端与调用方式
+"""
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, List, Dict, Callable
+from openai import OpenAI
+from llm_telemetry import record_llm_call, provider_for, estimate_tokens, start_metrics_server
+from llm_cassette import cassette
+
+# 服务商接口地址
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+DOUBAO_BASE_URL = "https://ark.cn-beijing.volces.com/api/v3"
+MISTRAL_BASE_URL = "https://api.mistral.ai/v1"
+
+# Doubao 端点
+DOUBAO_MODEL_1 = "ep-m-20251211112628-2r5n6"  # Doubao 一号端点
+DOUBAO_MODEL_2 = "ep-m-20251225141150-hfztd"  # Doubao 二号端点
+
+# 最终答案标记
+ANSWER_MARKER_START = "【答案："
+ANSWER_MARKER_END = "】"
+
+_clients: Dict[tuple, OpenAI] = {}
+_clients_lock = threading.Lock()
+
+# 配置了 METRICS_PORT 时暴露 Prometheus 指标
+start_metrics_server()
+
+
+def get_client(api_key: str, base_url: str = OPENAI_BASE_URL) -> OpenAI:
+    """
+    获取（并复用）指定 API Key + 地址的客户端，避免每次调用重新建立连接
+    开启 LLM_CASSETTE_MODE 时返回录制 / 回放包装
+    """
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAI(api_key=api_key, base_url=base_url)
+            if cassette:
+                client = cassette.wrap(client, base_url)
+            _clients[key] = client
+        return client
+
+
+def answer_marker_closed(text: str) -> bool:
+    """判断文本中【答案：…】标记是否已经完整输出（出现了收尾的 】）"""
+    start = text.find(ANSWER_MARKER_START)
+    if start < 0:
+        return False
+    return text.find(ANSWER_MARKER_END, start + len(ANSWER_MARKER_START)) >= 0
+
+
+def stream_chat_completion(
+    api_key: str,
+    base_url: str,
+    model: str,
+    messages: List[Dict],
+    on_delta: Optional[Callable[[str, str], None]] = None,
+    stop_when: Optional[Callable[[str], bool]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    **params
+) -> Dict:
+    """
+    以流式方式调用 chat.completions，可在满足条件后提前关闭连接
+
+    Args:
+        api_key: API 密钥
+        base_url: 服务商接口地址
+        model: 模型名称 / 端点ID
+        messages: 对话消息
+        on_delta: 每收到一段增量时回调 (kind, text)，kind 为 "reasoning" 或 "content"
+        stop_when: 以当前累计的正文为参数，返回 True 时立即关闭流
+        cancel_event: 被设置后在收到下一段增量时关闭流（推理阶段同样生效），结果标记 cancelled
+        **params: 透传给 chat.completions.create 的其他参数
+
+    Returns:
+        Dict: content / reasoning / ttft / time_to_answer / elapsed_time / stopped_early / cancelled
+    """
+    client = get_client(api_key, base_url)
+    start_time = time.time()
+    ttft = None
+    time_to_answer = None
+    stopped_early = False
+    cancelled = False
+    reasoning_parts = []
+    content = ""
+    usage = None
+
+    try:
+        stream = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **params
+        )
+    except Exception:
+        record_llm_call(provider_for(base_url), model, time.time() - start_time, success=False)
+        raise
+
+    try:
+        for chunk in stream:
+            if cancel_event is not None and cancel_event.is_set():
+                cancelled = stopped_early = True
+                break
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+
+            # Thinking 模型的推理过程在 reasoning_content 中
+            reasoning_piece = getattr(delta, "reasoning_content", None)
+            content_piece = delta.content
+
+            if (reasoning_piece or content_piece) and ttft is None:
+                ttft = time.time() - start_time
+
+            if reasoning_piece:
+                reasoning_parts.append(reasoning_piece)
+                if on_delta:
+                    on_delta("reasoning", reasoning_piece)
+
+            if content_piece:
+                content += content_piece
+                if on_delta:
+                    on_delta("content", content_piece)
+
+                if stop_when and stop_when(content):
+                    time_to_answer = time.time() - start_time
+                    stopped_early = True
+                    break
+    except Exception:
+        record_llm_call(provider_for(base_url), model, time.time() - start_time, success=False)
+        raise
+    finally:
+        # 提前结束时关闭连接，不再消耗后续 token
+        stream.close()
+
+    elapsed_time = time.time() - start_time
+    if time_to_answer is None and stop_when and stop_when(content):
+        time_to_answer = elapsed_time
+
+    # 提前关闭的流拿不到 usage，按已收到的文本估算
+    reasoning = "".join(reasoning_parts)
+    record_llm_call(
+        provider_for(base_url), model, elapsed_time, usage=usage,
+        estimated_usage={
+            "prompt_tokens": sum(estimate_tokens(m.get("content", "")) for m in messages if isinstance(m.get("content"), str)),
+            "completion_tokens": estimate_tokens(reasoning) + estimate_tokens(content),
+            "reasoning_tokens": estimate_tokens(reasoning)
+        },
+        ttft=ttft, stopped_early=stopped_early
+    )
+
+    return {
+        "content": content,
+        "reasoning": reasoning,
+        "ttft": ttft,
+        "time_to_answer": time_to_answer,
+        "elapsed_time": elapsed_time,
+        "stopped_early": stopped_early,
+        "cancelled": cancelled
+    }
+
+
+def stream_chat_completion_n(
+    api_key: str,
+    base_url: str,
+    model: str,
+    messages: List[Dict],
+    n: int,
+    on_delta: Optional[Callable[[int, str, str], None]] = None,
+    stop_when: Optional[Callable[[str], bool]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    **params
+) -> List[Dict]:
+    """
+    一次请求生成 n 个样本的流式调用（chat.completions 的 n 参数），各样本按 choice.index 分别累计
+
+    每个样本满足 stop_when 或收到 finish_reason 即视为结束，全部结束时关闭流；
+    服务端无法单独停止某个样本，先结束的样本在其余样本完成前仍会计费。
+    服务端忽略 n 只返回一个样本时（样本 0 结束前未出现其他样本），样本 0 结束即关闭流
+
+    Args:
+        on_delta: 每收到一段增量时回调 (样本序号, kind, text)
+        其余参数同 stream_chat_completion
+
+    Returns:
+        List[Dict]: 按样本序号排列，格式与 stream_chat_completion 相同（elapsed_time 为该样本结束的时间）；
+            服务端不支持 n 参数时可能只返回一个样本
+    """
+    client = get_client(api_key, base_url)
+    start_time = time.time()
+    samples: Dict[int, Dict] = {}
+    cancelled = False
+    usage = None
+
+    def sample_state(index):
+        return samples.setdefault(index, {
+            "reasoning": [], "content": "", "ttft": None, "time_to_answer": None,
+            "finished_at": None, "stopped_early": False
+        })
+
+    try:
+        stream = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            n=n,
+            stream=True,
+            stream_options={"include_usage": True},
+            **params
+        )
+    except Exception:
+        record_llm_call(provider_for(base_url), model, time.time() - start_time, success=False, samples=n)
+        raise
+
+    try:
+        for chunk in stream:
+            if cancel_event is not None and cancel_event.is_set():
+                cancelled = True
+                break
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            for choice in chunk.choices or []:
+                state = sample_state(choice.index)
+                if state["finished_at"] is not None:
+                    continue
+                delta = choice.delta
+                reasoning_piece = getattr(delta, "reasoning_content", None) if delta else None
+                content_piece = delta.content if delta else None
+
+                if (reasoning_piece or content_piece) and state["ttft"] is None:
+                    state["ttft"] = time.time() - start_time
+                if reasoning_piece:
+                    state["reasoning"].append(reasoning_piece)
+                    if on_delta:
+                        on_delta(choice.index, "reasoning", reasoning_piece)
+                if content_piece:
+                    state["content"] += content_piece
+                    if on_delta:
+                        on_delta(choice.index, "content", content_piece)
+
+                if content_piece and stop_when and stop_when(state["content"]):
+                    state["time_to_answer"] = state["finished_at"] = time.time() - start_time
+                    state["stopped_early"] = True
+                elif getattr(choice, "finish_reason", None):
+                    state["finished_at"] = time.time() - start_time
+            # 各样本的增量交错到达，样本 0 结束时仍只出现过样本 0 说明服务端忽略了 n，
+            # 按单样本处理，同样在答案输出完时关闭流
+            if (len(samples) >= n or list(samples) == [0]) and \
+                    all(state["finished_at"] is not None for state in samples.values()):
+                break
+    except Exception:
+        record_llm_call(provider_for(base_url), model, time.time() - start_time, success=False, samples=n)
+        raise
+    finally:
+        stream.close()
+
+    elapsed_time = time.time() - start_time
+    reasoning_tokens = sum(estimate_tokens("".join(state["reasoning"])) for state in samples.values())
+    record_llm_call(
+        provider_for(base_url), model, elapsed_time, usage=usage,
+        estimated_usage={
+            "prompt_tokens": sum(estimate_tokens(m.get("content", "")) for m in messages if isinstance(m.get("content"), str)),
+            "completion_tokens": reasoning_tokens + sum(estimate_tokens(state["content"]) for state in samples.values()),
+            "reasoning_tokens": reasoning_tokens
+        },
+        ttft=min((state["ttft"] for state in samples.values() if state["ttft"] is not None), default=None),
+        stopped_early=cancelled or any(state["stopped_early"] for state in samples.values()),
+        samples=len(samples)
+    )
+
+    results = []
+    for index in sorted(samples):
+        state = samples[index]
+        if state["time_to_answer"] is None and stop_when and stop_when(state["content"]):
+            state["time_to_answer"] = state["finished_at"] or elapsed_time
+        results.append({
+            "content": state["content"],
+            "reasoning": "".join(state["reasoning"]),
+            "ttft": state["ttft"],
+            "time_to_answer": state["time_to_answer"],
+            "elapsed_time": state["finished_at"] or elapsed_time,
+            "stopped_early": state["stopped_early"],
+            "cancelled": cancelled
+        })
+    return results
+
+
+# ==================== 对冲请求与熔断 ====================
+
+class AnyEvent:
+    """
+    多个取消事件的“或”：任一被设置即视为已设置
+
+    只提供 is_set，可作为 stream_chat_completion 的 cancel_event（如调用方的取消事件 + 对冲副本各自的取消事件）
+    """
+
+    def __init__(self, *events: Optional[threading.Event]):
+        self.events = [event for event in events if event is not None]
+
+    def is_set(self) -> bool:
+        return any(event.is_set() for event in self.events)
+
+
+class CircuitOpenError(Exception):
+    """端点处于熔断冷却期，请求未发送"""
+
+
+class _EndpointState:
+    """单个端点的延迟窗口与熔断状态"""
+
+    def __init__(self, window: int):
+        self.latencies = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.half_open_trial = False
+
+
+class LLMGateway:
+    """
+    LLM 调用网关：对冲请求 + 按端点熔断
+
+    - 对冲：调用耗时超过该端点观测到的 p95 延迟时，再发一个相同请求，先返回者胜出
+    - 熔断：端点连续失败达到阈值后，冷却期内直接拒绝请求；冷却结束后放行一次试探
+    - 预算：对冲请求数不超过总请求数的 hedge_max_ratio，避免额度被对冲消耗
+    """
+
+    def __init__(
+        self,
+        hedge_max_ratio: float = 0.1,
+        hedge_min_samples: int = 20,
+        failure_threshold: int = 5,
+        cooldown_seconds: float = 30.0,
+        latency_window: int = 200,
+        max_workers: int = 32
+    ):
+        self.hedge_max_ratio = hedge_max_ratio
+        self.hedge_min_samples = hedge_min_samples
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.latency_window = latency_window
+
+        self._states: Dict[str, _EndpointState] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-gateway")
+        self.total_calls = 0
+        self.hedged_calls = 0
+
+    def _state(self, endpoint: str) -> _EndpointState:
+        state = self._states.get(endpoint)
+        if state is None:
+            state = _EndpointState(self.latency_window)
+            self._states[endpoint] = state
+        return state
+
+    def p95_latency(self, endpoint: str) -> Optional[float]:
+        """端点最近成功调用的 p95 延迟；样本不足时返回 None"""
+        with self._lock:
+            samples = sorted(self._state(endpoint).latencies)
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def is_open(self, endpoint: str) -> bool:
+        """端点是否处于熔断冷却期"""
+        with self._lock:
+            return time.time() < self._state(endpoint).open_until
+
+    def _before_call(self, endpoint: str):
+        with self._lock:
+            state = self._state(endpoint)
+            if state.consecutive_failures >= self.failure_threshold:
+                if time.time() < state.open_until:
+                    raise CircuitOpenError(f"端点 {endpoint} 熔断中，{state.open_until - time.time():.0f}s 后重试")
+                # 冷却结束：只放行一个试探请求
+                if state.half_open_trial:
+                    raise CircuitOpenError(f"端点 {endpoint} 正在试探恢复")
+                state.half_open_trial = True
+            self.total_calls += 1
+
+    def _record(self, endpoint: str, latency: Optional[float], success: bool):
+        with self._lock:
+            state = self._state(endpoint)
+            state.half_open_trial = False
+            if success:
+                state.latencies.append(latency)
+                state.consecutive_failures = 0
+                state.open_until = 0.0
+            else:
+                state.consecutive_failures += 1
+                if state.consecutive_failures >= self.failure_threshold:
+                    state.open_until = time.time() + self.cooldown_seconds
+
+    def _try_reserve_hedge(self) -> bool:
+        with self._lock:
+            if self.hedged_calls + 1 > self.hedge_max_ratio * self.total_calls:
+                return False
+            self.hedged_calls += 1
+            return True
+
+    def _run(self, endpoint: str, fn: Callable):
+        start = time.time()
+        try:
+            result = fn()
+        except Exception:
+            self._record(endpoint, None, False)
+            raise
+        self._record(endpoint, time.time() - start, True)
+        return result
+
+    def call(self, endpoint: str, fn: Callable, hedge: bool = True, hedge_fn: Optional[Callable] = None,
+             cancellable: bool = False):
+        """
+        通过网关执行一次调用
+
+        Args:
+            endpoint: 端点标识（如模型名/端点ID），熔断和延迟统计按此分组
+            fn: 实际发起请求的无参函数
+            hedge: 是否允许对冲
+            hedge_fn: 对冲副本使用的函数（默认与 fn 相同）
+            cancellable: 为 True 时 fn / hedge_fn 接收各自的取消事件（threading.Event）；
+                一份先成功返回后设置另一份的事件，由其尽快关闭流，避免落后的副本完整计费；
+                主请求在调用方线程中执行，只有对冲副本使用线程池（见 _call_inline）
+
+        Returns:
+            先成功返回的结果；全部失败时抛出最后一个异常
+        """
+        self._before_call(endpoint)
+        delay = self.p95_latency(endpoint) if hedge else None
+        if delay is None:
+            return self._run(endpoint, (lambda: fn(threading.Event())) if cancellable else fn)
+        if cancellable:
+            return self._call_inline(endpoint, fn, hedge_fn or fn, delay)
+
+        # 不可取消的调用：主请求也在线程池中执行，对冲延迟从主请求真正开始执行时计起（排队时间不计）
+        started = threading.Event()
+
+        def primary_fn():
+            started.set()
+            return fn()
+
+        primary = self._executor.submit(self._run, endpoint, primary_fn)
+        started.wait()
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._try_reserve_hedge():
+            return primary.result()
+
+        backup = self._executor.submit(self._run, endpoint, hedge_fn or fn)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _call_inline(self, endpoint: str, fn: Callable, hedge_fn: Callable, delay: float):
+        """
+        可取消的调用：主请求在调用方线程中执行（并发只受调用方限制，不占线程池），
+        超过 delay 仍未返回时由定时器把对冲副本提交到线程池；一份先成功后设置另一份的取消事件
+        """
+        primary_cancel, backup_cancel = threading.Event(), threading.Event()
+        lock = threading.Lock()
+        winner = []
+        backup = []
+
+        def claim(name, loser_cancel):
+            with lock:
+                if winner:
+                    return False
+                winner.append(name)
+            loser_cancel.set()
+            return True
+
+        def run_backup():
+            if backup_cancel.is_set():
+                return None  # 排队期间主请求已成功，不再发起
+            result = self._run(endpoint, lambda: hedge_fn(backup_cancel))
+            claim("backup", primary_cancel)
+            return result
+
+        def launch_backup():
+            with lock:
+                if winner or not self._try_reserve_hedge():
+                    return
+                backup.append(self._executor.submit(run_backup))
+
+        timer = threading.Timer(delay, launch_backup)
+        timer.daemon = True
+        timer.start()
+        try:
+            result = self._run(endpoint, lambda: fn(primary_cancel))
+        except Exception:
+            with lock:
+                future = backup[0] if backup else None
+                if future is None:
+                    winner.append("failed")  # 不再发起对冲
+            if future is None:
+                raise
+            return future.result()
+        finally:
+            timer.cancel()
+
+        if claim("primary", backup_cancel):
+            return result
+        # 对冲副本先成功，主请求已被取消
+        return backup[0].result()
+
+    def stats(self) -> Dict:
+        """各端点状态快照"""
+        now = time.time()
+        with self._lock:
+            return {
+                "total_calls": self.total_calls,
+                "hedged_calls": self.hedged_calls,
+                "endpoints": {
+                    name: {
+                        "samples": len(state.latencies),
+                        "consecutive_failures": state.consecutive_failures,
+                        "circuit_open": now < state.open_until
+                    }
+                    for name, state in self._states.items()
+                }
+            }
+
+
+# 全局网关实例（预算可通过环境变量调整）
+gateway = LLMGateway(
+    hedge_max_ratio=float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1")),
+    hedge_min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+    failure_threshold=int(os.getenv("LLM_CIRCUIT_FAILURES", "5")),
+    cooldown_seconds=float(os.getenv("LLM_CIRCUIT_COOLDOWN", "30")),
+    # 对冲时主请求与副本都在网关线程池中执行，大规模并发求解需相应调大
+    max_workers=int(os.getenv("LLM_GATEWAY_WORKERS", "32"))
+)
+
+
+# ==================== 服务商故障转移 ====================
+
+# 故障转移的各服务商请求使用独立线程池：请求内部经网关调用，
+# 若与网关共用线程池，线程池占满时外层任务会一直等待拿不到线程的内层请求
+_failover_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LLM_FAILOVER_WORKERS", "16")), thread_name_prefix="llm-failover"
+)
+
+
+def call_with_failover(
+    providers: List[Dict],
+    prompt_for: Callable[[Dict], str],
+    latency_slo: float = 45.0,
+    gw: Optional[LLMGateway] = None
+) -> Dict:
+    """
+    按顺序尝试多个服务商：当前服务商报错或超过延迟 SLO 仍未返回时，
+    把同一任务（使用该服务商的 Prompt 变体）发给下一个服务商，先成功者胜出
+
+    Args:
+        providers: 服务商列表，每项包含 name / api_key / base_url / model / json_format
+        prompt_for: 根据服务商返回对应 Prompt 变体
+        latency_slo: 单个服务商的延迟 SLO（秒）
+        gw: 使用的网关实例（默认全局 gateway）
+
+    Returns:
+        Dict: content / provider / latency / failed_over / errors
+              全部失败时 content 为 None，errors 记录各服务商的错误
+    """
+    gw = gw or gateway
+    start_time = time.time()
+    errors: Dict[str, str] = {}
+    running: Dict = {}
+
+    def make_call(provider):
+        client = get_client(provider["api_key"], provider["base_url"])
+        request_params = {
+            "model": provider["model"],
+            "messages": [{"role": "user", "content": prompt_for(provider)}]
+        }
+        if provider.get("json_format", True):
+            request_params["response_format"] = {"type": "json_object"}
+        call_start = time.time()
+        try:
+            response = gw.call(provider["model"], lambda: client.chat.completions.create(**request_params))
+        except Exception:
+            record_llm_call(provider_for(provider["base_url"]), provider["model"], time.time() - call_start, success=False)
+            raise
+        record_llm_call(provider_for(provider["base_url"]), provider["model"], time.time() - call_start, usage=response.usage)
+        return response.choices[0].message.content
+
+    def collect(done):
+        for future in done:
+            provider = running.pop(future)
+            if future.exception() is None:
+                return {
+                    "content": future.result(),
+                    "provider": provider["name"],
+                    "latency": time.time() - start_time,
+                    "failed_over": provider is not providers[0],
+                    "errors": errors
+                }
+            errors[provider["name"]] = str(future.exception())
+        return None
+
+    for provider in providers:
+        if gw.is_open(provider["model"]):
+            errors[provider["name"]] = "熔断中，已跳过"
+            continue
+
+        running[_failover_executor.submit(make_call, provider)] = provider
+
+        # 等待当前服务商（以及仍在进行的上一个）直到 SLO，超时或出错则转移
+        deadline = time.time() + latency_slo
+        while running:
+            done, _ = wait(list(running), timeout=max(0.0, deadline - time.time()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            result = collect(done)
+            if result:
+                return result
+            if provider not in running.values():
+                break
+
+    # 已无后备服务商：等待仍在进行中的请求
+    while running:
+        done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+        result = collect(done)
+        if result:
+            return result
+
+    return {
+        "content": None,
+        "provider": None,
+        "latency": time.time() - start_time,
+        "failed_over": len(providers) > 1,
+        "errors": errors
+    }
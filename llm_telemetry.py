@@ -0,0 +1,280 @@
+"""
+LLM 调用遥测 - 记录每次调用的服务商、模型、延迟、重试、token 用量与费用
+以 Prometheus 指标暴露，同时写入滚动 JSONL 日志供离线分析
+"""
+import os
+import json
+import time
+import logging
+import threading
+from logging.handlers import RotatingFileHandler
+from typing import Optional, Dict, Any, Callable, List
+
+try:
+    from prometheus_client import Counter, Histogram, start_http_server
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# 价格表（USD / 1M tokens）：(输入, 输出)。推理 token 按输出计费，已包含在 completion_tokens 中
+MODEL_PRICES = {
+    "gpt-5.1-chat-latest": (1.25, 10.0),
+    "gpt-5.1": (1.25, 10.0),
+    "deepseek-chat": (0.28, 0.42),
+    "deepseek-reasoner": (0.28, 0.42),
+    "pixtral-large-latest": (2.0, 6.0),
+    "ep-m-20251211112628-2r5n6": (0.11, 1.1),  # Doubao 一号（Seed 1.6 Thinking，¥0.8/¥8）
+    "ep-m-20251225141150-hfztd": (0.11, 1.1),  # Doubao 二号
+}
+
+# 服务商识别（按接口地址）
+PROVIDER_HOSTS = {
+    "api.openai.com": "openai",
+    "api.deepseek.com": "deepseek",
+    "volces.com": "doubao",
+    "api.mistral.ai": "mistral",
+}
+
+LOG_FILE = os.getenv("LLM_LOG_FILE", "logs/llm_calls.jsonl")
+LOG_MAX_BYTES = int(os.getenv("LLM_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LLM_LOG_BACKUP_COUNT", "5"))
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+if PROMETHEUS_AVAILABLE:
+    LLM_LATENCY = Histogram(
+        "llm_call_latency_seconds", "LLM 调用延迟", ["provider", "model"],
+        buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+    )
+    LLM_CALLS = Counter("llm_calls_total", "LLM 调用次数", ["provider", "model", "status"])
+    LLM_RETRIES = Counter("llm_retries_total", "LLM 调用重试次数", ["provider", "model"])
+    LLM_TOKENS = Counter("llm_tokens_total", "LLM token 用量", ["provider", "model", "type"])
+    LLM_COST = Counter("llm_cost_usd_total", "LLM 费用（USD）", ["provider", "model"])
+
+_logger: Optional[logging.Logger] = None
+_lock = threading.Lock()
+_metrics_started = False
+_listeners: List[Callable[[Dict], None]] = []
+_encodings: Dict[str, Any] = {}
+
+# 进程内累计（供脚本结束时打印汇总）
+totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "reasoning_tokens": 0, "cost": 0.0}
+
+
+def provider_for(base_url: Optional[str]) -> str:
+    """根据接口地址识别服务商"""
+    if not base_url:
+        return "openai"
+    for host, name in PROVIDER_HOSTS.items():
+        if host in base_url:
+            return name
+    return "other"
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：CJK 字符按 1 个 token，其余字符按 4 个字符 1 个 token"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if '一' <= ch <= '鿿' or '　' <= ch <= 'ヿ' or '＀' <= ch <= '￯')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_tokens(text: str, model: str = "") -> int:
+    """
+    本地计算 prompt 的 token 数：OpenAI 模型用 tiktoken 精确计数，
+    其他模型（或未安装 tiktoken）退回 estimate_tokens 估算
+    """
+    if not text:
+        return 0
+    if TIKTOKEN_AVAILABLE and model.startswith(("gpt-", "o1", "o3", "o4")):
+        encoding = _encodings.get(model)
+        if encoding is None:
+            try:
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    encoding = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                # 编码表需要首次下载，离线环境下退回估算
+                encoding = False
+            _encodings[model] = encoding
+        if encoding:
+            return len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, multiplier: float = 1.0) -> float:
+    """按价格表计算费用（USD），未知模型返回 0"""
+    price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000 * multiplier
+
+
+def extract_usage(usage: Any) -> Dict[str, int]:
+    """
+    从 response.usage 中提取 token 用量
+    兼容 chat.completions（prompt/completion_tokens）、responses（input/output_tokens）及字典形式
+    """
+    if usage is None:
+        return {}
+
+    def get(obj, name):
+        if obj is None:
+            return None
+        if isinstance(obj, dict):
+            return obj.get(name)
+        return getattr(obj, name, None)
+
+    prompt_tokens = get(usage, "prompt_tokens") or get(usage, "input_tokens") or 0
+    completion_tokens = get(usage, "completion_tokens") or get(usage, "output_tokens") or 0
+    details = get(usage, "completion_tokens_details") or get(usage, "output_tokens_details")
+    reasoning_tokens = get(details, "reasoning_tokens") or 0
+    return {
+        "prompt_tokens": int(prompt_tokens),
+        "completion_tokens": int(completion_tokens),
+        "reasoning_tokens": int(reasoning_tokens)
+    }
+
+
+def add_call_listener(listener: Callable[[Dict], None]):
+    """注册调用监听器：每次 record_llm_call 后以日志记录为参数回调（如预算控制）"""
+    with _lock:
+        _listeners.append(listener)
+
+
+def remove_call_listener(listener: Callable[[Dict], None]):
+    with _lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def _get_logger() -> Optional[logging.Logger]:
+    global _logger
+    if _logger is None:
+        try:
+            log_dir = os.path.dirname(LOG_FILE)
+            if log_dir:
+                os.makedirs(log_dir, exist_ok=True)
+            handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger("llm_telemetry")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            _logger = logger
+        except OSError as e:
+            print(f"⚠️ 无法写入 LLM 调用日志 {LOG_FILE}: {e}")
+            _logger = logging.getLogger("llm_telemetry.disabled")
+            _logger.disabled = True
+    return _logger
+
+
+def record_llm_call(
+    provider: str,
+    model: str,
+    latency: Optional[float],
+    usage: Any = None,
+    retries: int = 0,
+    success: bool = True,
+    estimated_usage: Optional[Dict[str, int]] = None,
+    cost_multiplier: float = 1.0,
+    **extra
+) -> Dict:
+    """
+    记录一次 LLM 调用
+
+    Args:
+        provider: 服务商（openai / deepseek / doubao / mistral）
+        model: 模型名称 / 端点ID
+        latency: 调用耗时（秒），未知时为 None（如 Batch API）
+        usage: response.usage（对象或字典）
+        retries: 本次调用引发的重试次数（每次尝试单独记录时，失败后会重试的那次记 1）
+        success: 是否成功
+        estimated_usage: 服务端未返回 usage 时的估算用量（如流式提前结束）
+        cost_multiplier: 费用系数（如 Batch API 半价为 0.5）
+        **extra: 额外写入日志的字段
+
+    Returns:
+        Dict: 写入日志的记录
+    """
+    tokens = extract_usage(usage)
+    usage_estimated = False
+    if not tokens and estimated_usage:
+        tokens = dict(estimated_usage)
+        usage_estimated = True
+    prompt_tokens = tokens.get("prompt_tokens", 0)
+    completion_tokens = tokens.get("completion_tokens", 0)
+    reasoning_tokens = tokens.get("reasoning_tokens", 0)
+    cost = estimate_cost(model, prompt_tokens, completion_tokens, cost_multiplier)
+
+    record = {
+        "ts": time.time(),
+        "provider": provider,
+        "model": model,
+        "latency": round(latency, 3) if latency is not None else None,
+        "retries": retries,
+        "success": success,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "reasoning_tokens": reasoning_tokens,
+        "usage_estimated": usage_estimated,
+        "cost_usd": round(cost, 6),
+        **extra
+    }
+
+    with _lock:
+        totals["calls"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["completion_tokens"] += completion_tokens
+        totals["reasoning_tokens"] += reasoning_tokens
+        totals["cost"] += cost
+        logger = _get_logger()
+        listeners = list(_listeners)
+
+    if PROMETHEUS_AVAILABLE:
+        LLM_CALLS.labels(provider, model, "success" if success else "error").inc()
+        if success and latency is not None:
+            LLM_LATENCY.labels(provider, model).observe(latency)
+        if retries:
+            LLM_RETRIES.labels(provider, model).inc(retries)
+        LLM_TOKENS.labels(provider, model, "prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(provider, model, "completion").inc(completion_tokens)
+        LLM_TOKENS.labels(provider, model, "reasoning").inc(reasoning_tokens)
+        LLM_COST.labels(provider, model).inc(cost)
+
+    if logger:
+        logger.info(json.dumps(record, ensure_ascii=False))
+
+    for listener in listeners:
+        listener(record)
+
+    return record
+
+
+def start_metrics_server(port: Optional[int] = None) -> bool:
+    """启动 Prometheus 指标 HTTP 服务（每个进程只启动一次）"""
+    global _metrics_started
+    port = port or (int(METRICS_PORT) if METRICS_PORT else None)
+    if not port or not PROMETHEUS_AVAILABLE:
+        return False
+    with _lock:
+        if _metrics_started:
+            return True
+        try:
+            start_http_server(port)
+            _metrics_started = True
+            print(f"📈 Prometheus 指标: http://0.0.0.0:{port}/metrics")
+        except OSError as e:
+            print(f"⚠️ 指标端口 {port} 启动失败: {e}")
+    return _metrics_started
+
+
+def print_summary():
+    """打印本进程累计的调用统计"""
+    print(f"📈 LLM 调用: {totals['calls']} 次 | "
+          f"输入 {totals['prompt_tokens']} / 输出 {totals['completion_tokens']} "
+          f"(推理 {totals['reasoning_tokens']}) tokens | 费用 ~${totals['cost']:.4f} USD")
@@ -8,10 +8,14 @@ import json
 import time
 import os
 import base64
-from openai import OpenAI
 from PIL import Image
 import io
 from dotenv import load_dotenv
+from llm_gateway import (
+    OPENAI_BASE_URL, DEEPSEEK_BASE_URL, DOUBAO_BASE_URL, MISTRAL_BASE_URL, DOUBAO_MODEL_2,
+    get_client, call_with_failover
+)
+from llm_telemetry import record_llm_call
 
 # 加载环境变量
 load_dotenv()
@@ -30,6 +34,8 @@ MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5.1-chat-latest")
 MISTRAL_VISION_MODEL = "pixtral-large-latest"  # Mistral 的视觉模型
 DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+DOUBAO_API_KEY_2 = os.getenv("DOUBAO_API_KEY_2")
+FAILOVER_LATENCY_SLO = float(os.getenv("LLM_FAILOVER_SLO", "45"))  # 主服务商超过该秒数未返回即转移
 
 # 检查配置
 if not OPENAI_API_KEY:
@@ -190,6 +196,40 @@ ORIGINALITY_PROMPT_DEEPSEEK = """你是一名严谨的学术查重专家。你
 **严禁给出解题步骤或答案！**
 """
 
+# Doubao 后备 Prompt 后缀（该端点不支持 response_format，需在 Prompt 中约束输出）
+JSON_ONLY_SUFFIX = """
+
+**只输出一个 JSON 对象，不要输出任何其他文字或代码块标记。**
+"""
+
+# 各服务商使用的 Prompt 变体
+REVIEW_PROMPTS = {
+    "gpt": REVIEW_PROMPT_TEMPLATE,
+    "deepseek": REVIEW_PROMPT_TEMPLATE,
+    "doubao": REVIEW_PROMPT_TEMPLATE + JSON_ONLY_SUFFIX
+}
+ORIGINALITY_PROMPTS = {
+    "gpt": ORIGINALITY_PROMPT_GPT,
+    "deepseek": ORIGINALITY_PROMPT_DEEPSEEK,
+    "doubao": ORIGINALITY_PROMPT_DEEPSEEK + JSON_ONLY_SUFFIX
+}
+
+# 故障转移顺序：GPT-5.1 → DeepSeek → Doubao 二号
+FAILOVER_PROVIDERS = [
+    {"name": f"GPT ({OPENAI_MODEL})", "variant": "gpt", "api_key": OPENAI_API_KEY,
+     "base_url": OPENAI_BASE_URL, "model": OPENAI_MODEL, "json_format": True}
+]
+if DEEPSEEK_API_KEY:
+    FAILOVER_PROVIDERS.append(
+        {"name": f"DeepSeek ({DEEPSEEK_MODEL})", "variant": "deepseek", "api_key": DEEPSEEK_API_KEY,
+         "base_url": DEEPSEEK_BASE_URL, "model": DEEPSEEK_MODEL, "json_format": True}
+    )
+if DOUBAO_API_KEY_2:
+    FAILOVER_PROVIDERS.append(
+        {"name": "Doubao 二号", "variant": "doubao", "api_key": DOUBAO_API_KEY_2,
+         "base_url": DOUBAO_BASE_URL, "model": DOUBAO_MODEL_2, "json_format": False}
+    )
+
 def encode_image_to_base64(image_file):
     """将上传的图片转换为 base64"""
     image = Image.open(image_file)
@@ -201,14 +241,12 @@ def extract_text_from_image(image_file):
     """使用 Mistral Pixtral 从图片中提取数学题目"""
     try:
         # 使用 Mistral API（兼容 OpenAI SDK）
-        client = OpenAI(
-            api_key=MISTRAL_API_KEY,
-            base_url="https://api.mistral.ai/v1"
-        )
+        client = get_client(MISTRAL_API_KEY, MISTRAL_BASE_URL)
         
         # 将图片转换为 base64
         base64_image = encode_image_to_base64(image_file)
         
+        start_time = time.time()
         response = client.chat.completions.create(
             model=MISTRAL_VISION_MODEL,
             messages=[
@@ -241,6 +279,7 @@ Extract the complete mathematical problem from the image:"""
             max_tokens=2000,
             temperature=0.1
         )
+        record_llm_call("mistral", MISTRAL_VISION_MODEL, time.time() - start_time, usage=response.usage)
         
         extracted = response.choices[0].message.content.strip()
         
@@ -268,25 +307,36 @@ Extract the complete mathematical problem from the image:"""
 2. 检查 Mistral API Key 是否正确
 3. 尝试重新上传更清晰的图片"""
 
-def call_openai_api(prompt, api_key, model, base_url="https://api.openai.com/v1", use_json_format=True):
-    """调用 API（支持 OpenAI 和 DeepSeek）"""
-    try:
-        client = OpenAI(api_key=api_key, base_url=base_url)
-        
-        # 构建请求参数
-        request_params = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}]
-        }
-        
-        # 只有在明确要求 JSON 格式时才添加 response_format
-        if use_json_format:
-            request_params["response_format"] = {"type": "json_object"}
-        
-        response = client.chat.completions.create(**request_params)
-        return response.choices[0].message.content
-    except Exception as e:
-        return {"error": str(e)}
+def call_with_provider_failover(prompts, problem_text):
+    """按故障转移顺序调用，返回 (模型原始输出或错误信息, 应答服务商信息)"""
+    outcome = call_with_failover(
+        FAILOVER_PROVIDERS,
+        lambda provider: prompts[provider["variant"]].format(problem_text=problem_text),
+        latency_slo=FAILOVER_LATENCY_SLO
+    )
+    if outcome["content"] is None:
+        return {"error": "；".join(f"{name}: {err}" for name, err in outcome["errors"].items())}, outcome
+    return outcome["content"], outcome
+
+def parse_json_result(text):
+    """解析模型返回的 JSON（兼容 ```json 代码块包裹）"""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.startswith("json"):
+            text = text[4:]
+    start, end = text.find("{"), text.rfind("}")
+    if start >= 0 and end > start:
+        text = text[start:end + 1]
+    return json.loads(text)
+
+def show_provider_caption(outcome):
+    """显示本次由哪个服务商应答"""
+    if outcome.get("provider"):
+        caption = f"🛰️ 应答模型：{outcome['provider']}（{outcome['latency']:.1f}s）"
+        if outcome["failed_over"]:
+            caption += " · 主服务商超时或出错，已自动切换"
+        st.caption(caption)
 
 def get_recommendation_emoji(recommendation):
     """根据推荐结果返回表情符号"""
@@ -421,18 +471,18 @@ with col2:
             st.error("⚠️ 请输入题目内容或上传图片！")
         else:
             with st.spinner("🤔 GPT-5.1 正在分析题目质量..."):
-                prompt = REVIEW_PROMPT_TEMPLATE.format(problem_text=problem_text)
-                result = call_openai_api(prompt, OPENAI_API_KEY, OPENAI_MODEL)
+                result, outcome = call_with_provider_failover(REVIEW_PROMPTS, problem_text)
                 
                 try:
                     if isinstance(result, str):
-                        review_data = json.loads(result)
+                        review_data = parse_json_result(result)
                     else:
                         review_data = result
                     
                     if "error" in review_data:
                         st.error(f"❌ API 调用失败: {review_data['error']}")
                     else:
+                        show_provider_caption(outcome)
                         total_score = review_data.get('total_score', 0)
                         recommendation = review_data.get('recommendation', 'UNKNOWN')
                         
@@ -481,23 +531,21 @@ with col2:
         else:
             st.markdown("### 🔍 原创度检测结果")
             
-            # 使用 GPT-5.1 检测
-            gpt_prompt = ORIGINALITY_PROMPT_GPT.format(problem_text=problem_text)
-            
-            # GPT-5.1 检测
+            # GPT-5.1 检测（超时或出错时自动切换后备服务商）
             with st.spinner("🔍 GPT-5.1 正在检测原创度..."):
-                gpt_result = call_openai_api(gpt_prompt, OPENAI_API_KEY, OPENAI_MODEL)
+                gpt_result, outcome = call_with_provider_failover(ORIGINALITY_PROMPTS, problem_text)
             
             # 显示结果
             st.markdown("---")
             st.markdown("### 📊 原创度检测结果")
             
             try:
-                gpt_data = json.loads(gpt_result) if isinstance(gpt_result, str) else gpt_result
+                gpt_data = parse_json_result(gpt_result) if isinstance(gpt_result, str) else gpt_result
                 
                 if "error" in gpt_data:
                     st.error(f"❌ GPT-5.1 调用失败: {gpt_data['error']}")
                 else:
+                    show_provider_caption(outcome)
                     conclusion = gpt_data.get('originality_conclusion', 'UNKNOWN')
                     st.markdown(f"## {get_originality_emoji(conclusion)} {conclusion}")
                     
@@ -7,13 +7,19 @@
 import streamlit as st
 import json
 import os
+import re
 import base64
 import io
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from openai import OpenAI
 from PIL import Image
 from dotenv import load_dotenv
+from llm_gateway import DOUBAO_MODEL_1, DOUBAO_MODEL_2, MISTRAL_BASE_URL, get_client
+from difficulty_engine import difficulty_bucket, wilson_interval, pass_at_k, pass_at_k_interval
+from difficulty_jobs import ADAPTIVE_WAVE_SIZE, run_difficulty_job, run_queue_job
+from database import db
+from difficulty_results import find_problem_id, find_problem_ids
+from job_manager import job_manager, FINISHED_STATUSES
+from llm_telemetry import record_llm_call
 
 # 加载环境变量
 load_dotenv()
@@ -29,9 +35,15 @@ st.set_page_config(
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
 DOUBAO_API_KEY_1 = os.getenv("DOUBAO_API_KEY_1")  # Doubao 一号
 DOUBAO_API_KEY_2 = os.getenv("DOUBAO_API_KEY_2")  # Doubao 二号
-DOUBAO_MODEL_1 = "ep-m-20251211112628-2r5n6"  # Doubao 一号端点
-DOUBAO_MODEL_2 = "ep-m-20251225141150-hfztd"  # Doubao 二号端点
 MISTRAL_VISION_MODEL = "pixtral-large-latest"
+LIVE_STREAM_LIMIT = 10  # 超过该次数时不显示逐次推理过程，并由所有 API 共同求解
+FAN_OUT_PER_ENDPOINT = int(os.getenv("DOUBAO_PER_ENDPOINT", "16"))  # 大规模测试时每个端点的并发数
+JOB_POLL_INTERVAL = 0.5  # 读取后台任务进度的间隔（秒）
+JOB_KINDS = ["difficulty", "difficulty_queue"]
+JOB_STATUS_LABELS = {
+    "running": "⏳ 运行中", "done": "✅ 已完成", "failed": "❌ 失败", "cancelled": "⏹️ 已停止", "interrupted": "⚠️ 已中断"
+}
+RESULT_COLUMNS = ["测试", "状态", "答案预览", "首字耗时", "出答案耗时", "耗时"]  # 单题测试结果表格的列
 
 # 检查配置
 if not DOUBAO_API_KEY_1 and not DOUBAO_API_KEY_2:
@@ -59,13 +71,11 @@ def extract_text_from_image(image_file):
         return "❌ 未配置 MISTRAL_API_KEY，无法识别图片"
     
     try:
-        client = OpenAI(
-            api_key=MISTRAL_API_KEY,
-            base_url="https://api.mistral.ai/v1"
-        )
+        client = get_client(MISTRAL_API_KEY, MISTRAL_BASE_URL)
         
         base64_image = encode_image_to_base64(image_file)
         
+        start_time = time.time()
         response = client.chat.completions.create(
             model=MISTRAL_VISION_MODEL,
             messages=[
@@ -87,96 +97,610 @@ def extract_text_from_image(image_file):
             ],
             max_tokens=2000
         )
+        record_llm_call("mistral", MISTRAL_VISION_MODEL, time.time() - start_time, usage=response.usage)
         
         return response.choices[0].message.content.strip()
     
     except Exception as e:
         return f"❌ 图片识别失败: {str(e)}"
 
-def solve_problem_with_doubao(problem_text, attempt_number, api_key, model_id):
-    """使用 Doubao Seed 1.6 Thinking 模型求解题目（单次）"""
-    try:
-        client = OpenAI(
-            api_key=api_key,
-            base_url="https://ark.cn-beijing.volces.com/api/v3"
-        )
-        
-        start_time = time.time()
-        
-        response = client.chat.completions.create(
-            model=model_id,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "你是一个专业的数学问题求解助手。请仔细阅读题目，深入思考，给出详细的解题步骤和最终答案。最终答案请用【答案：】标记。"
-                },
-                {
-                    "role": "user",
-                    "content": f"请解答以下数学题目：\n\n{problem_text}"
-                }
-            ],
-            temperature=0.7
-        )
-        
-        elapsed_time = time.time() - start_time
-        
-        return {
-            "attempt": attempt_number,
-            "answer": response.choices[0].message.content,
-            "success": True,
-            "elapsed_time": elapsed_time
-        }
+def result_display_row(r):
+    """一次求解在结果表格中的显示行（答案预览等在结果到达或对错更新时计算一次）"""
+    # 判断结果状态
+    if "❌" in r["answer"] and "求解失败" in r["answer"]:
+        status = "🔴 API错误"
+        answer_preview = r["answer"][:50] + "..."
+    else:
+        if r["correct"] is None:
+            status = "❔ 待评判"
+        else:
+            icon = "✅" if r["correct"] else "❌"
+            status = f"{icon} {'正确' if r['correct'] else '错误'}{'（评判）' if r.get('judged') else ''}"
+        if r.get("reused"):
+            status += " ♻️"
+        # 提取答案预览
+        answer_text = r["answer"]
+        if "【答案：" in answer_text:
+            answer_preview = answer_text.split("【答案：")[1].split("】")[0][:30]
+        elif "答案：" in answer_text:
+            answer_preview = answer_text.split("答案：")[1].strip().split("\n")[0][:30]
+        else:
+            answer_preview = answer_text[:30] + "..."
     
-    except Exception as e:
-        return {
-            "attempt": attempt_number,
-            "answer": f"❌ 求解失败: {str(e)}",
-            "success": False,
-            "elapsed_time": 0
-        }
-
-def compare_answers(model_answer, correct_answer):
-    """判断模型答案是否与标准答案一致"""
+    time_str = f"{r['elapsed_time']:.1f}s" if r['elapsed_time'] > 0 else "-"
+    ttft_str = f"{r['ttft']:.1f}s" if r['ttft'] is not None else "-"
+    tta_str = f"{r['time_to_answer']:.1f}s" if r['time_to_answer'] is not None else "-"
+    
+    return {
+        "测试": f"第 {r['attempt']} 次",
+        "状态": status,
+        "答案预览": answer_preview,
+        "首字耗时": ttft_str,
+        "出答案耗时": tta_str,
+        "耗时": time_str
+    }
+
+def parse_problem_queue(text):
+    """
+    解析批量题目：JSON 数组 / JSONL（problem_text + answer 或 ground_truth，可选 id），
+    或以单独一行 --- 分隔的文本块（块内以“答案：”开头的一行为标准答案，其余为题目）
+    """
+    text = text.strip()
+    if not text:
+        return []
     try:
-        # 检查是否有API错误
-        if "❌" in model_answer and "求解失败" in model_answer:
-            return False
+        records = json.loads(text)
+        if isinstance(records, dict):
+            records = [records]
+    except json.JSONDecodeError:
+        if text.startswith("{"):
+            records = [json.loads(line) for line in text.splitlines() if line.strip()]
+        else:
+            records = []
+            for block in re.split(r"(?m)^\s*-{3,}\s*$", text):
+                if not block.strip():
+                    continue
+                lines = block.strip().splitlines()
+                answer_lines = [line for line in lines if line.strip().startswith("答案：")]
+                records.append({
+                    "problem_text": "\n".join(line for line in lines if line not in answer_lines).strip(),
+                    "answer": answer_lines[-1].strip()[len("答案："):].strip() if answer_lines else ""
+                })
+    
+    problems = []
+    for number, record in enumerate(records, 1):
+        answer = record.get("answer") or record.get("ground_truth")
+        problems.append({
+            "id": str(record.get("id") or f"#{number}"),
+            "problem_text": str(record.get("problem_text") or record.get("problem") or "").strip(),
+            "answer": str(answer).strip() if answer else ""
+        })
+    return problems
+
+def build_queue_rows(problems, stats, test_count):
+    """批量队列的逐题汇总表格"""
+    rows = []
+    for problem, entry in zip(problems, stats):
+        valid = entry["done"] - entry["errors"]
+        accuracy = entry["correct"] / valid if valid else 0
+        if entry["decision"]:
+            status = f"⚡ 已确定（{entry['done']} 次）"
+            difficulty = entry["decision"][0]
+        elif entry["done"] >= test_count:
+            status = "✅ 完成"
+            difficulty = difficulty_bucket(accuracy) if valid else "-"
+        else:
+            status = "⏳ 求解中" if entry["done"] or entry["running"] else "🕒 排队中"
+            difficulty = "-"
+        rows.append({
+            "题目": problem["id"],
+            "题目预览": problem["problem_text"][:30],
+            "进度": f"{entry['done']}/{test_count}",
+            "正确": entry["correct"],
+            "待评判": len(entry["undecided"]),
+            "API错误": entry["errors"],
+            "正确率": f"{accuracy * 100:.0f}%" if valid else "-",
+            "难度": difficulty,
+            "状态": status,
+            "题库": "💾" if entry.get("linked") else "-"
+        })
+    return rows
+
+class DifficultyJobView:
+    """
+    单题测试任务在本会话中的渲染缓存（保存在 session_state，页面重跑时只读取新事件）
+    每个结果的显示行在到达时计算一次，order 记录到达顺序，实时表格只追加新行
+    """
+    
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.last_seq = 0
+        self.results = {}  # 第几次 -> 结果
+        self.display = {}  # 第几次 -> 显示行
+        self.order = []
+        self.correct = 0
+    
+    def apply(self, event):
+        attempt = event["attempt"]
+        if event["type"] == "result":
+            self.results[attempt] = event
+            self.order.append(attempt)
+        else:
+            self.results[attempt].update(correct=event["correct"], judged=event["judged"])
+        self.correct += event["correct"] is True
+        self.display[attempt] = result_display_row(self.results[attempt])
+    
+    def rows_since(self, count):
+        """第 count 个之后到达的显示行"""
+        return [self.display[attempt] for attempt in self.order[count:]]
+    
+    def sorted_results(self):
+        return [self.results[attempt] for attempt in sorted(self.results)]
+    
+    def sorted_rows(self):
+        return [self.display[attempt] for attempt in sorted(self.display)]
+
+class QueueJobView:
+    """批量队列任务的渲染缓存：逐题累计结果（按事件增量更新）"""
+    
+    def __init__(self, job):
+        self.job_id = job["id"]
+        self.last_seq = 0
+        linked = job["params"].get("problem_ids") or {}
+        self.stats = [
+            {"correct": 0, "done": 0, "errors": 0, "running": 0, "undecided": [], "decision": None, "results": [],
+             "linked": str(index) in linked}
+            for index in range(len(job["params"]["problems"]))
+        ]
+    
+    def apply(self, event):
+        entry = self.stats[event["index"]]
+        if event["type"] == "result":
+            entry["done"] += 1
+            if "❌" in event["answer"] and "求解失败" in event["answer"]:
+                entry["errors"] += 1
+            if event["correct"] is None:
+                entry["undecided"].append(event)
+            elif event["correct"]:
+                entry["correct"] += 1
+            entry["results"].append(event)
+        else:
+            for r in entry["undecided"]:
+                if r["attempt"] == event["attempt"]:
+                    r.update(correct=event["correct"], judged=event["judged"])
+                    entry["correct"] += event["correct"]
+            entry["undecided"] = [r for r in entry["undecided"] if r["correct"] is None]
+    
+    def merge_state(self, state):
+        """任务汇总状态中的提前停止结论与进行中的求解数"""
+        running = state.get("running") or [0] * len(self.stats)
+        for index, entry in enumerate(self.stats):
+            entry["decision"] = state.get("decisions", {}).get(str(index))
+            entry["running"] = running[index]
+
+def job_view(job):
+    """当前任务的渲染缓存（切换任务时重建）"""
+    view = st.session_state.get("difficulty_job_view")
+    if view is None or view.job_id != job["id"]:
+        view = QueueJobView(job) if job["kind"] == "difficulty_queue" else DifficultyJobView(job["id"])
+        st.session_state["difficulty_job_view"] = view
+    return view
+
+def sync_job(view):
+    """读取任务状态与新事件（先读状态再读事件：任务已结束时，它的全部事件都已写入）"""
+    job = job_manager.get(view.job_id)
+    for seq, event in job_manager.events(view.job_id, view.last_seq):
+        view.apply(event)
+        view.last_seq = seq
+    return job
+
+def job_status_label(job):
+    return JOB_STATUS_LABELS.get(job["status"], job["status"])
+
+def stop_button(job):
+    # 放在实时区域（fragment）中，点击时只重跑该区域
+    if st.button("⏹️ 停止测试", key=f"stop_{job['id']}"):
+        job_manager.cancel(job["id"])
+        st.caption("⏹️ 正在停止，进行中的求解结束后任务停止")
+
+def show_job_outcome(job):
+    """任务未正常完成时的提示"""
+    if job["status"] == "failed":
+        st.error(f"❌ 后台任务失败: {job['error']}")
+    elif job["status"] == "cancelled":
+        st.warning("⏹️ 任务已停止，以下为停止前完成的求解")
+    elif job["status"] == "interrupted":
+        st.warning("⚠️ 任务在服务重启时中断，以下为中断前完成的求解")
+
+def render_statistics(results, correct_answer, adaptive, confidence):
+    """测试统计、难度分析与详细记录（results 为全部结果行）"""
+    attempted = len(results)
+    correct_count = sum(1 for r in results if r["correct"])
+    
+    # 统计API错误次数
+    api_error_count = sum(1 for r in results if "❌" in r["answer"] and "求解失败" in r["answer"])
+    valid_count = attempted - api_error_count
+    
+    # 计算正确率（只计算有效测试）
+    if valid_count > 0:
+        accuracy = (correct_count / valid_count) * 100
+    else:
+        accuracy = 0
+    
+    # 显示统计结果
+    st.markdown("### 🎯 测试统计")
+    
+    # 显示正确率
+    metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
+    
+    with metric_col1:
+        st.metric("总测试数", f"{attempted} 次")
+    
+    with metric_col2:
+        st.metric("有效测试", f"{valid_count} 次")
+    
+    with metric_col3:
+        st.metric("正确次数", f"{correct_count} 次", 
+                 delta=f"{accuracy:.1f}%")
+    
+    with metric_col4:
+        if api_error_count > 0:
+            st.metric("API错误", f"{api_error_count} 次", delta="需检查", delta_color="off")
+        else:
+            if accuracy >= 80:
+                difficulty = "简单 😊"
+            elif accuracy >= 50:
+                difficulty = "中等 🤔"
+            else:
+                difficulty = "困难 😰"
+            st.metric("难度评估", difficulty)
+    
+    # 显示正确率条
+    st.markdown("#### 📈 正确率")
+    st.progress(accuracy / 100)
+    
+    st.markdown(f"**{accuracy:.1f}%** ({correct_count}/{attempted})")
+    if adaptive and valid_count > 0:
+        low, high = wilson_interval(correct_count, valid_count, confidence)
+        st.caption(f"{confidence:.0%} 置信区间：{low * 100:.1f}% ~ {high * 100:.1f}%")
+    
+    # pass@k（无偏估计）及 95% 置信区间
+    if valid_count > 1:
+        st.markdown("#### 🎲 pass@k")
+        ks = [k for k in (1, 2, 4, 8, 16, 32, 64, 128) if k <= valid_count]
+        pass_rows = []
+        for k in ks:
+            low, high = pass_at_k_interval(correct_count, valid_count, k)
+            pass_rows.append({
+                "k": k,
+                "pass@k": f"{pass_at_k(valid_count, correct_count, k) * 100:.1f}%",
+                "95% 置信区间": f"{low * 100:.1f}% ~ {high * 100:.1f}%"
+            })
+        st.dataframe(pass_rows, use_container_width=True, hide_index=True)
+    
+    st.markdown("---")
+    
+    # 难度分析
+    st.markdown("#### 💡 难度分析")
+    
+    if api_error_count > 0:
+        st.warning(f"""
+        ⚠️ **检测到 {api_error_count} 次API调用失败**
         
-        # 标准化处理
-        model_answer_clean = model_answer.lower().strip()
-        correct_answer_clean = correct_answer.lower().strip()
+        **可能原因**：
+        1. Doubao API 配置错误
+        2. 网络连接问题
+        3. API 配额不足或限流
+        4. 模型端点配置错误
         
-        # 提取【答案：】标记后的内容
-        if "【答案：" in model_answer:
-            model_answer_clean = model_answer.split("【答案：")[1].split("】")[0].strip().lower()
-        elif "答案：" in model_answer:
-            model_answer_clean = model_answer.split("答案：")[1].strip().split("\n")[0].strip().lower()
+        **建议**：
+        - 查看详细测试记录中的错误信息
+        - 检查 DOUBAO_API_KEY 是否正确
+        - 确认模型端点 ID 是否有效
+        - 重新测试或减少并发数
         
-        # 移除空格和特殊字符进行比较
-        import re
-        model_clean = re.sub(r'[\s\$\{\}\\]', '', model_answer_clean)
-        correct_clean = re.sub(r'[\s\$\{\}\\]', '', correct_answer_clean)
+        **有效测试结果**（{valid_count} 次）：
+        - 正确：{correct_count} 次
+        - 正确率：{accuracy:.1f}%
+        """)
+    
+    if valid_count > 0:
+        if accuracy >= 80:
+            st.success(f"""
+            ✅ **题目较为简单**
+            - AI 模型正确率达到 {accuracy:.1f}% ({correct_count}/{valid_count})
+            - 适合作为基础练习题
+            - 大部分学生应该能够掌握
+            """)
+        elif accuracy >= 50:
+            st.warning(f"""
+            ⚠️ **题目难度适中**
+            - AI 模型正确率为 {accuracy:.1f}% ({correct_count}/{valid_count})
+            - 适合作为常规练习题
+            - 需要一定的思考和计算能力
+            """)
+        else:
+            st.error(f"""
+            ❌ **题目较为困难**
+            - AI 模型正确率仅 {accuracy:.1f}% ({correct_count}/{valid_count})
+            - 适合作为挑战题或拔高题
+            - 需要较强的数学能力和解题技巧
+            
+            **建议检查**：
+            - 题目表述是否有歧义
+            - 标准答案格式是否匹配
+            - 查看详细记录了解模型的解答
+            """)
+    else:
+        st.error("❌ 所有测试都失败了，无法评估题目难度。请检查API配置。")
+    
+    st.markdown("---")
+    
+    # 详细结果展示
+    with st.expander("📋 查看详细测试记录", expanded=False):
+        sorted_results = sorted(results, key=lambda x: x["attempt"])
+        for result in sorted_results:
+            # 判断是否是API错误
+            if "❌" in result["answer"] and "求解失败" in result["answer"]:
+                st.error(f"🔴 **第 {result['attempt']} 次测试 - API调用失败**")
+                st.code(result["answer"], language="text")
+            else:
+                icon = "✅" if result["correct"] else "❌"
+                correctness = "正确" if result["correct"] else "错误"
+                st.markdown(f"**{icon} 第 {result['attempt']} 次测试 - {correctness}** (耗时: {result['elapsed_time']:.1f}s)")
+                
+                # 显示模型的完整回答
+                st.text_area(
+                    f"模型解答 {result['attempt']}",
+                    value=result["answer"],
+                    height=200,
+                    key=f"result_{result['attempt']}"
+                )
+                
+                # 提取并高亮显示答案
+                if "【答案：" in result["answer"]:
+                    extracted = result["answer"].split("【答案：")[1].split("】")[0]
+                    st.info(f"📌 提取的答案：{extracted}")
+                elif "答案：" in result["answer"]:
+                    extracted = result["answer"].split("答案：")[1].strip().split("\n")[0]
+                    st.info(f"📌 提取的答案：{extracted}")
+            
+            st.markdown("---")
+    
+    # 标准答案对比
+    st.markdown("#### 📌 标准答案")
+    st.info(correct_answer)
+
+def render_job_header(job):
+    """测试信息与提交时的提示"""
+    params = job["params"]
+    test_count = params["test_count"]
+    adaptive = params["adaptive"]
+    if job["kind"] == "difficulty_queue":
+        st.info(
+            f"🚀 批量队列：{len(params['problems'])} 道题 × {test_count} 次，{len(AVAILABLE_APIS)} 个 API 交错求解"
+            f"（共 {params['per_endpoint'] * len(AVAILABLE_APIS)} 并发{'，自适应采样' if adaptive else ''}）..."
+        )
+    elif params["model"] is None:
+        st.info(
+            f"🚀 大规模测试：{len(AVAILABLE_APIS)} 个 API 共同求解 {test_count} 次"
+            f"（每个端点并发 {params['per_endpoint']}{'，自适应采样' if adaptive else ''}）..."
+        )
+    elif adaptive:
+        st.info(f"🚀 使用 **{params['api_name']}** 自适应采样（每轮 {ADAPTIVE_WAVE_SIZE} 次，最多 {test_count} 次，置信度 {params['confidence']:.0%}）...")
+    else:
+        st.info(f"🚀 使用 **{params['api_name']}** 启动 {test_count} 个并行任务，实时显示结果...")
+    for note in params.get("notes", []):
+        st.caption(note)
+
+@st.fragment
+def live_difficulty_panel(job):
+    """
+    单题测试的实时区域（fragment：刷新只重跑本区域，不重跑整页）
+    每轮只读取新事件，表格用 add_rows 追加新完成的行；任务结束后整页重跑显示统计
+    """
+    view = job_view(job)
+    stop_button(job)
+    reuse_caption = st.empty()
+    status_text = st.empty()
+    progress_bar = st.progress(0)
+    st.markdown("#### 📊 实时测试进度")
+    table = st.dataframe(view.rows_since(0) or {column: [] for column in RESULT_COLUMNS},
+                         use_container_width=True, hide_index=True)
+    shown = len(view.order)
+    
+    # 实时推理过程只在本进程运行的任务中可见（逐次推理过程过多时不显示）
+    live_box = None if job["params"]["model"] is None else st.expander("🧠 实时推理过程", expanded=True)
+    live_placeholders = {}
+    
+    while True:
+        job = sync_job(view)
+        state = job["state"]
+        if state.get("reused"):
+            dispatch = state.get("dispatch", 0)
+            reuse_caption.caption(
+                f"♻️ 样本池中已有 {state['reused']} 次求解，"
+                f"{f'本次只补足 {dispatch} 次' if dispatch else '无需发起新的求解'}"
+            )
+        if len(view.order) > shown:
+            table.add_rows(view.rows_since(shown))
+            shown = len(view.order)
         
-        # 多种比对方式
-        # 1. 完全匹配
-        if model_clean == correct_clean:
-            return True
+        completed = len(view.order)
+        target = max(job["total"], completed, 1)
+        progress_bar.progress(min(completed / target, 1.0))
+        current_accuracy = (view.correct / completed) * 100 if completed > 0 else 0
+        status_text.text(
+            f"✅ 已完成: {completed}/{target} | "
+            f"✓ 正确: {view.correct} | "
+            f"当前正确率: {current_accuracy:.1f}% | "
+            f"进行中: {state.get('running', 0)}"
+        )
+        if state.get("judging"):
+            status_text.text(f"🧑‍⚖️ {state['judging']} 个答案无法自动判定，正在批量评判...")
         
-        # 2. 包含匹配
-        if correct_clean in model_clean or model_clean in correct_clean:
-            return True
+        # 刷新仍在求解中的推理过程
+        if live_box is not None:
+            for attempt, text in job_manager.live(job["id"]).items():
+                if attempt not in live_placeholders:
+                    with live_box:
+                        live_placeholders[attempt] = st.empty()
+                if attempt in view.results:
+                    live_placeholders[attempt].text(f"第 {attempt} 次 ✔️ 已完成")
+                elif text:
+                    live_placeholders[attempt].text(f"第 {attempt} 次 ⏳ …{text[-200:]}")
         
-        # 3. 数值匹配（提取数字）
-        model_numbers = re.findall(r'-?\d+\.?\d*', model_answer_clean)
-        correct_numbers = re.findall(r'-?\d+\.?\d*', correct_answer_clean)
-        if model_numbers and correct_numbers:
-            if model_numbers[0] == correct_numbers[0]:
-                return True
+        if job["status"] in FINISHED_STATUSES:
+            break
+        time.sleep(JOB_POLL_INTERVAL)
+    st.rerun()
+
+def render_difficulty_job(job):
+    """单题测试：运行中显示实时区域，结束后显示结果表格与统计"""
+    params = job["params"]
+    render_job_header(job)
+    if job["status"] not in FINISHED_STATUSES:
+        live_difficulty_panel(job)
+        return
+    
+    view = job_view(job)
+    job = sync_job(view)
+    state = job["state"]
+    if state.get("reused"):
+        st.caption(f"♻️ 样本池中已有 {state['reused']} 次求解，本次补足 {state.get('dispatch', 0)} 次")
+    st.markdown("#### 📊 测试结果")
+    st.dataframe(view.sorted_rows(), use_container_width=True, hide_index=True)
+    show_job_outcome(job)
+    
+    bank = state.get("bank")
+    if bank:
+        if bank["ok"]:
+            st.caption(f"💾 已写入题库（题目 {bank['problem_id']}，{bank['attempts']} 次求解）")
+        else:
+            st.warning("⚠️ 写入题库失败，请检查数据库连接")
+    show_request_strategies(state)
+    
+    results = view.sorted_results()
+    if not results:
+        return
+    
+    # 显示完成信息
+    test_count = params["test_count"]
+    attempted = len(results)
+    total_time = state.get("total_time", 0)
+    stop_decision = state.get("stop_decision")
+    reused_note = f"（其中 {state['reused']} 次来自样本池）" if state.get("reused") else ""
+    if stop_decision:
+        st.success(
+            f"🎉 自适应采样完成：{attempted} 次求解{reused_note}即确定难度为「{stop_decision[0]}」（{stop_decision[1]}），"
+            f"{f'节省 {test_count - attempted} 次调用。' if test_count > attempted else ''}总耗时: {total_time:.1f} 秒"
+        )
+    elif job["status"] == "done":
+        st.success(f"🎉 全部测试完成！共 {attempted} 次求解{reused_note}，总耗时: {total_time:.1f} 秒")
+    
+    render_statistics(results, params["correct_answer"], params["adaptive"], params["confidence"])
+
+def show_request_strategies(state):
+    """各生成方式的请求数：一次请求生成多个样本（n=4 ...）或逐次请求（single）"""
+    requests = state.get("requests")
+    if not requests:
+        return
+    parts = []
+    for strategy, (count, samples) in sorted(requests.items()):
+        label = "逐次请求" if strategy == "single" else f"每次请求 {strategy.removeprefix('n=')} 个样本"
+        parts.append(f"{label}：{count} 次请求 / {samples} 个样本")
+    st.caption("📦 生成方式 · " + "；".join(parts))
+
+@st.fragment
+def live_queue_panel(job):
+    """批量队列的实时区域（fragment）：逐题汇总表格只有题目数行，每轮有新事件时刷新"""
+    view = job_view(job)
+    params = job["params"]
+    problems = params["problems"]
+    test_count = params["test_count"]
+    stop_button(job)
+    reuse_caption = st.empty()
+    status_text = st.empty()
+    progress_bar = st.progress(0)
+    grid_placeholder = st.empty()
+    rendered_seq = None
+    
+    while True:
+        job = sync_job(view)
+        state = job["state"]
+        view.merge_state(state)
+        if sum(state.get("reused", [])):
+            reuse_caption.caption(f"♻️ 样本池中已有 {sum(state['reused'])} 次求解，只补足差额")
+        total = job["total"]
+        running = sum(state.get("running") or [])
+        progress_bar.progress(min(job["done"] / total, 1.0) if total else 0.0)
+        elapsed = max(time.time() - job["created_at"], 1e-6)
+        status_text.text(
+            f"✅ 已完成: {job['done']}/{total} 次 | "
+            f"题目: {sum(1 for e in view.stats if e['decision'] or e['done'] >= test_count)}/{len(problems)} | "
+            f"进行中: {running} | {job['done'] / elapsed:.1f} 次/秒"
+        )
+        if state.get("judging"):
+            status_text.text(f"🧑‍⚖️ {state['judging']} 个答案无法自动判定，正在批量评判...")
+        if (view.last_seq, job["updated_at"]) != rendered_seq:
+            rendered_seq = (view.last_seq, job["updated_at"])
+            with grid_placeholder:
+                st.dataframe(build_queue_rows(problems, view.stats, test_count), use_container_width=True, hide_index=True)
         
-        return False
+        if job["status"] in FINISHED_STATUSES:
+            break
+        time.sleep(JOB_POLL_INTERVAL)
+    st.rerun()
+
+def render_queue_job(job):
+    """批量队列：运行中显示实时区域，结束后显示逐题汇总与下载"""
+    params = job["params"]
+    problems = params["problems"]
+    test_count = params["test_count"]
+    render_job_header(job)
+    if job["status"] not in FINISHED_STATUSES:
+        live_queue_panel(job)
+        return
     
-    except Exception as e:
-        return False
+    view = job_view(job)
+    job = sync_job(view)
+    state = job["state"]
+    view.merge_state(state)
+    show_job_outcome(job)
+    if state.get("failed_writes"):
+        st.warning(f"⚠️ {state['failed_writes']} 道题写入题库失败，请检查数据库连接")
+    show_request_strategies(state)
+    
+    rows = build_queue_rows(problems, view.stats, test_count)
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+    
+    attempted = sum(entry["done"] for entry in view.stats)
+    reused_count = sum(state.get("reused", []))
+    saved = test_count * len(problems) - attempted
+    if job["status"] == "done":
+        st.success(
+            f"🎉 批量测试完成：{len(problems)} 道题共求解 {attempted} 次"
+            f"{f'（其中 {reused_count} 次来自样本池）' if reused_count else ''}"
+            f"{f'（自适应采样节省 {saved} 次）' if params['adaptive'] and saved > 0 else ''}，总耗时 {state.get('total_time', 0):.1f} 秒"
+        )
+    
+    export = [
+        {**row, "problem_text": problem["problem_text"], "answer": problem["answer"],
+         "final_answers": [r["answer"] for r in sorted(entry["results"], key=lambda x: x["attempt"])]}
+        for row, problem, entry in zip(rows, problems, view.stats)
+    ]
+    st.download_button(
+        "📥 下载结果（JSONL）",
+        data="\n".join(json.dumps(item, ensure_ascii=False) for item in export),
+        file_name="difficulty_queue_results.jsonl",
+        mime="application/json",
+        use_container_width=True
+    )
+
+def attach_job(job_id):
+    """页面显示指定的后台任务（写入地址栏，刷新后仍可接上）"""
+    st.session_state["difficulty_job_id"] = job_id
+    st.query_params["job"] = job_id
 
 # 主界面
 st.title("🎯 数学题目难度测试")
@@ -231,14 +755,14 @@ with st.sidebar:
     
     ### 🚀 技术特性
     - **并行计算**: 多个任务同时执行，大幅节省时间
-    - **流式显示**: 每完成一次立即显示，实时反馈
+    - **流式显示**: 实时显示推理过程，答案输出完即结束本次求解
     - **容错机制**: 单次失败不影响整体测试
     - **智能思考**: Seed 1.6 Thinking 深度推理
     
     ### 🔧 使用步骤
     1. 输入或上传题目
     2. 输入官方标准答案
-    3. 选择测试次数（3-10次）
+    3. 选择测试次数（3-10次），可开启自适应采样
     4. 点击"开始测试"
     5. 实时查看每次求解结果
     6. 查看最终统计分析
@@ -247,9 +771,23 @@ with st.sidebar:
     - 测试次数越多，结果越准确
     - 标准答案要简洁明确
     - 适合客观题测试
-    - 并行计算最多8个任务同时运行
+    - 10 次以内最多 8 个任务同时运行；16-128 次时所有 API 共同求解，并发受各端点配额限制
+    - 自适应采样：每轮 3 次，难度档位确定后停止并取消其余求解
+    - 批量队列：一次提交多道题，所有题目的求解在各 API 间交错进行，逐题汇总结果
+    - 后台运行：测试在后台执行，刷新页面或操作其他控件不会中断，可在“后台任务”中重新查看
     """)
 
+# 后台任务：测试在后台运行，页面刷新或切换后可从这里重新查看
+with st.sidebar:
+    recent_jobs = job_manager.list_jobs(kinds=JOB_KINDS, limit=8)
+    if recent_jobs:
+        st.markdown("---")
+        st.header("🗂️ 后台任务")
+        for recent in recent_jobs:
+            label = f"{job_status_label(recent)} {recent['title']}"
+            if st.button(label, key=f"attach_{recent['id']}", use_container_width=True):
+                attach_job(recent["id"])
+
 # 主内容区
 col1, col2 = st.columns([1, 1])
 
@@ -259,13 +797,36 @@ with col1:
     # 选择输入方式
     input_method = st.radio(
         "题目输入方式：",
-        ["💬 文字输入", "📷 图片上传"],
+        ["💬 文字输入", "📷 图片上传", "📚 批量队列"],
         horizontal=True
     )
     
     problem_text = ""
+    queue_problems = []
     
-    if input_method == "💬 文字输入":
+    if input_method == "📚 批量队列":
+        st.markdown("#### 📚 批量题目（含标准答案）")
+        queue_file = st.file_uploader(
+            "上传题目文件",
+            type=["json", "jsonl"],
+            help="JSON 数组或 JSONL，每道题包含 problem_text 和 answer（或 ground_truth），可选 id"
+        )
+        queue_text = st.text_area(
+            "或直接粘贴",
+            height=250,
+            placeholder="每道题之间用单独一行 --- 分隔，标准答案单独一行以“答案：”开头\n\n"
+                        "解方程：2x + 5 = 13\n答案：x = 4\n---\n求 1 + 2 + ... + 100\n答案：5050",
+            key="queue_input"
+        )
+        raw_queue = queue_file.getvalue().decode("utf-8") if queue_file is not None else queue_text
+        try:
+            queue_problems = parse_problem_queue(raw_queue)
+        except (json.JSONDecodeError, AttributeError) as e:
+            st.error(f"⚠️ 题目解析失败: {str(e)}")
+        if queue_problems:
+            st.caption(f"已解析 {len(queue_problems)} 道题")
+    
+    elif input_method == "💬 文字输入":
         problem_text = st.text_area(
             "题目内容",
             height=250,
@@ -301,22 +862,59 @@ with col1:
     
     st.markdown("---")
     
-    # 标准答案输入
-    correct_answer = st.text_area(
-        "📌 官方标准答案",
-        height=100,
-        placeholder="请输入标准答案...\n\n例如：x = 4",
-        help="答案要简洁明确，便于比对"
-    )
+    # 标准答案输入（批量队列的标准答案随题目提供）
+    correct_answer = ""
+    if input_method != "📚 批量队列":
+        correct_answer = st.text_area(
+            "📌 官方标准答案",
+            height=100,
+            placeholder="请输入标准答案...\n\n例如：x = 4",
+            help="答案要简洁明确，便于比对"
+        )
     
     # 测试次数选择
     test_count = st.select_slider(
         "🔢 测试次数",
-        options=[3, 4, 5, 6, 7, 8, 9, 10],
+        options=[3, 4, 5, 6, 7, 8, 9, 10, 16, 32, 64, 128],
         value=6,
-        help="选择让模型求解的次数，次数越多结果越准确"
+        help="选择让模型求解的次数，次数越多结果越准确（自适应采样时为最多次数）；"
+             f"超过 {LIVE_STREAM_LIMIT} 次时所有 API 共同求解，并发受各端点配额限制"
     )
     
+    # 自适应采样：分轮求解，难度档位确定后提前停止
+    adaptive = st.checkbox(
+        "⚡ 自适应采样（难度确定后提前停止）",
+        value=False,
+        help="每轮发起 3 次求解，正确率的 Wilson 置信区间落在同一难度档位（≥80% / 50-80% / <50%）或剩余次数已无法改变结论时停止"
+    )
+    confidence = 0.9
+    if adaptive:
+        confidence = st.select_slider(
+            "🎚️ 置信度",
+            options=[0.8, 0.9, 0.95, 0.99],
+            value=0.9,
+            format_func=lambda x: f"{x:.0%}"
+        )
+    
+    # 样本池：同一题目 + 标准答案 + 端点的历史求解计入本次结果，只补足差额
+    reuse_samples = st.checkbox(
+        "♻️ 复用历史样本（只补足差额）",
+        value=True,
+        help="同一题目、同一标准答案在同一端点上已有的求解直接计入，只发起不足的次数；正确率按全部样本统计"
+    )
+    
+    # 结果写入题库（按题目内容匹配，也可指定题目ID）
+    save_to_bank = False
+    linked_problem_id = ""
+    if db.enabled:
+        save_to_bank = st.checkbox(
+            "💾 结果写入题库",
+            value=False,
+            help="每完成几次求解即写入题库的 test_result / 正确率 / 难度，中途中断也不会丢失已完成的结果"
+        )
+        if save_to_bank and input_method != "📚 批量队列":
+            linked_problem_id = st.text_input("题库题目ID（可选）", help="留空时按题目内容在题库中匹配").strip()
+    
     st.markdown("---")
     
     # 开始测试按钮
@@ -325,264 +923,87 @@ with col1:
 with col2:
     st.header("📊 测试结果")
     
-    if test_button:
+    if test_button and input_method == "📚 批量队列":
+        missing = [p["id"] for p in queue_problems if not p["problem_text"] or not p["answer"]]
+        if not queue_problems:
+            st.error("⚠️ 请上传或粘贴批量题目！")
+        elif missing:
+            st.error(f"⚠️ 以下题目缺少题目内容或标准答案：{', '.join(missing)}")
+        else:
+            # 结果写入题库：一次查询按题目内容匹配全部题目
+            notes = []
+            problem_ids = {}
+            if save_to_bank:
+                matches = find_problem_ids([problem["problem_text"] for problem in queue_problems])
+                problem_ids = {
+                    str(index): matches[problem["problem_text"]]
+                    for index, problem in enumerate(queue_problems) if problem["problem_text"] in matches
+                }
+                notes.append(f"💾 {len(problem_ids)}/{len(queue_problems)} 道题在题库中，结果将写入题库")
+            attach_job(job_manager.submit(
+                "difficulty_queue",
+                f"批量队列 {len(queue_problems)} 道题 × {test_count}",
+                {
+                    "problems": queue_problems, "test_count": test_count, "adaptive": adaptive,
+                    "confidence": confidence, "per_endpoint": FAN_OUT_PER_ENDPOINT,
+                    "reuse_samples": reuse_samples, "problem_ids": problem_ids, "notes": notes
+                },
+                run_queue_job
+            ))
+    
+    elif test_button:
         if not problem_text or not problem_text.strip():
             st.error("⚠️ 请输入题目内容！")
         elif not correct_answer or not correct_answer.strip():
             st.error("⚠️ 请输入标准答案！")
         else:
-            # 显示测试信息
-            st.info(f"🚀 使用 **{selected_api_name}** 启动 {test_count} 个并行任务，实时显示结果...")
-            
-            # 创建实时结果显示区域
-            results_container = st.container()
-            status_text = st.empty()
-            progress_bar = st.progress(0)
-            
-            # 存储结果
-            results = []
-            correct_count = 0
-            completed_count = 0
-            
-            # 实时结果表格
-            with results_container:
-                st.markdown("#### 📊 实时测试进度")
-                result_placeholder = st.empty()
-            
-            # 使用线程池进行并行计算
-            start_time = time.time()
-            
-            with ThreadPoolExecutor(max_workers=min(test_count, 8)) as executor:
-                # 提交所有任务（使用选择的 API Key 和端点）
-                futures = {
-                    executor.submit(solve_problem_with_doubao, problem_text, i+1, selected_api_key, selected_model): i+1 
-                    for i in range(test_count)
-                }
-                
-                # 实时处理完成的任务
-                for future in as_completed(futures):
-                    try:
-                        result = future.result()
-                        
-                        if result["success"]:
-                            # 判断是否正确
-                            is_correct = compare_answers(result["answer"], correct_answer)
-                            
-                            if is_correct:
-                                correct_count += 1
-                            
-                            results.append({
-                                "attempt": result["attempt"],
-                                "answer": result["answer"],
-                                "correct": is_correct,
-                                "elapsed_time": result["elapsed_time"]
-                            })
-                        else:
-                            # 失败的任务
-                            results.append({
-                                "attempt": result["attempt"],
-                                "answer": result["answer"],
-                                "correct": False,
-                                "elapsed_time": 0
-                            })
-                        
-                        completed_count += 1
-                        
-                        # 更新进度条
-                        progress_bar.progress(completed_count / test_count)
-                        
-                        # 实时显示状态
-                        current_accuracy = (correct_count / completed_count) * 100 if completed_count > 0 else 0
-                        status_text.text(
-                            f"✅ 已完成: {completed_count}/{test_count} | "
-                            f"✓ 正确: {correct_count} | "
-                            f"当前正确率: {current_accuracy:.1f}%"
-                        )
-                        
-                        # 实时更新结果表格
-                        sorted_results = sorted(results, key=lambda x: x["attempt"])
-                        result_data = []
-                        for r in sorted_results:
-                            # 判断结果状态
-                            if "❌" in r["answer"] and "求解失败" in r["answer"]:
-                                status = "🔴 API错误"
-                                answer_preview = r["answer"][:50] + "..."
-                            else:
-                                icon = "✅" if r["correct"] else "❌"
-                                status = f"{icon} {'正确' if r['correct'] else '错误'}"
-                                # 提取答案预览
-                                answer_text = r["answer"]
-                                if "【答案：" in answer_text:
-                                    answer_preview = answer_text.split("【答案：")[1].split("】")[0][:30]
-                                elif "答案：" in answer_text:
-                                    answer_preview = answer_text.split("答案：")[1].strip().split("\n")[0][:30]
-                                else:
-                                    answer_preview = answer_text[:30] + "..."
-                            
-                            time_str = f"{r['elapsed_time']:.1f}s" if r['elapsed_time'] > 0 else "-"
-                            
-                            result_data.append({
-                                "测试": f"第 {r['attempt']} 次",
-                                "状态": status,
-                                "答案预览": answer_preview,
-                                "耗时": time_str
-                            })
-                        
-                        with result_placeholder:
-                            st.dataframe(
-                                result_data,
-                                use_container_width=True,
-                                hide_index=True
-                            )
-                    
-                    except Exception as e:
-                        st.error(f"任务执行出错: {str(e)}")
-            
-            total_time = time.time() - start_time
-            
-            # 清空进度显示
-            status_text.empty()
-            progress_bar.empty()
-            
-            # 显示完成信息
-            st.success(f"🎉 全部测试完成！总耗时: {total_time:.1f} 秒")
-            
-            # 统计API错误次数
-            api_error_count = sum(1 for r in results if "❌" in r["answer"] and "求解失败" in r["answer"])
-            valid_count = test_count - api_error_count
-            
-            # 计算正确率（只计算有效测试）
-            if valid_count > 0:
-                accuracy = (correct_count / valid_count) * 100
-            else:
-                accuracy = 0
-            
-            # 显示统计结果
-            st.markdown("### 🎯 测试统计")
-            
-            # 显示正确率
-            metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
-            
-            with metric_col1:
-                st.metric("总测试数", f"{test_count} 次")
-            
-            with metric_col2:
-                st.metric("有效测试", f"{valid_count} 次")
-            
-            with metric_col3:
-                st.metric("正确次数", f"{correct_count} 次", 
-                         delta=f"{accuracy:.1f}%")
-            
-            with metric_col4:
-                if api_error_count > 0:
-                    st.metric("API错误", f"{api_error_count} 次", delta="需检查", delta_color="off")
+            # 结果写入题库：先找到对应的题目
+            notes = []
+            bank_problem_id = None
+            if save_to_bank:
+                problem_id = linked_problem_id or find_problem_id(problem_text)
+                existing = db.get_problem_by_id(problem_id) if problem_id else None
+                if existing is None:
+                    st.warning("⚠️ 题库中没有找到该题目（可先在题库管理中添加，或填写题目ID），本次结果不会写入题库")
                 else:
-                    if accuracy >= 80:
-                        difficulty = "简单 😊"
-                    elif accuracy >= 50:
-                        difficulty = "中等 🤔"
-                    else:
-                        difficulty = "困难 😰"
-                    st.metric("难度评估", difficulty)
-            
-            # 显示正确率条
-            st.markdown("#### 📈 正确率")
-            st.progress(accuracy / 100)
-            
-            st.markdown(f"**{accuracy:.1f}%** ({correct_count}/{test_count})")
-            
-            st.markdown("---")
-            
-            # 难度分析
-            st.markdown("#### 💡 难度分析")
-            
-            if api_error_count > 0:
-                st.warning(f"""
-                ⚠️ **检测到 {api_error_count} 次API调用失败**
-                
-                **可能原因**：
-                1. Doubao API 配置错误
-                2. 网络连接问题
-                3. API 配额不足或限流
-                4. 模型端点配置错误
-                
-                **建议**：
-                - 查看详细测试记录中的错误信息
-                - 检查 DOUBAO_API_KEY 是否正确
-                - 确认模型端点 ID 是否有效
-                - 重新测试或减少并发数
-                
-                **有效测试结果**（{valid_count} 次）：
-                - 正确：{correct_count} 次
-                - 正确率：{accuracy:.1f}%
-                """)
-            
-            if valid_count > 0:
-                if accuracy >= 80:
-                    st.success(f"""
-                    ✅ **题目较为简单**
-                    - AI 模型正确率达到 {accuracy:.1f}% ({correct_count}/{valid_count})
-                    - 适合作为基础练习题
-                    - 大部分学生应该能够掌握
-                    """)
-                elif accuracy >= 50:
-                    st.warning(f"""
-                    ⚠️ **题目难度适中**
-                    - AI 模型正确率为 {accuracy:.1f}% ({correct_count}/{valid_count})
-                    - 适合作为常规练习题
-                    - 需要一定的思考和计算能力
-                    """)
-                else:
-                    st.error(f"""
-                    ❌ **题目较为困难**
-                    - AI 模型正确率仅 {accuracy:.1f}% ({correct_count}/{valid_count})
-                    - 适合作为挑战题或拔高题
-                    - 需要较强的数学能力和解题技巧
-                    
-                    **建议检查**：
-                    - 题目表述是否有歧义
-                    - 标准答案格式是否匹配
-                    - 查看详细记录了解模型的解答
-                    """)
-            else:
-                st.error("❌ 所有测试都失败了，无法评估题目难度。请检查API配置。")
-            
-            st.markdown("---")
-            
-            # 详细结果展示
-            with st.expander("📋 查看详细测试记录", expanded=False):
-                sorted_results = sorted(results, key=lambda x: x["attempt"])
-                for result in sorted_results:
-                    # 判断是否是API错误
-                    if "❌" in result["answer"] and "求解失败" in result["answer"]:
-                        st.error(f"🔴 **第 {result['attempt']} 次测试 - API调用失败**")
-                        st.code(result["answer"], language="text")
-                    else:
-                        icon = "✅" if result["correct"] else "❌"
-                        correctness = "正确" if result["correct"] else "错误"
-                        st.markdown(f"**{icon} 第 {result['attempt']} 次测试 - {correctness}** (耗时: {result['elapsed_time']:.1f}s)")
-                        
-                        # 显示模型的完整回答
-                        st.text_area(
-                            f"模型解答 {result['attempt']}",
-                            value=result["answer"],
-                            height=200,
-                            key=f"result_{result['attempt']}"
+                    previous = existing.get("test_result") or {}
+                    if previous.get("attempts"):
+                        notes.append(
+                            f"💾 题库中已有上次测试：{previous.get('correct')}/{previous.get('valid')} 次正确"
+                            f"（{existing.get('test_model')}），本次结果将覆盖"
                         )
-                        
-                        # 提取并高亮显示答案
-                        if "【答案：" in result["answer"]:
-                            extracted = result["answer"].split("【答案：")[1].split("】")[0]
-                            st.info(f"📌 提取的答案：{extracted}")
-                        elif "答案：" in result["answer"]:
-                            extracted = result["answer"].split("答案：")[1].strip().split("\n")[0]
-                            st.info(f"📌 提取的答案：{extracted}")
-                    
-                    st.markdown("---")
+                    bank_problem_id = existing["id"]
             
-            # 标准答案对比
-            st.markdown("#### 📌 标准答案")
-            st.info(correct_answer)
+            # 大规模测试：所有 API 组成端点池，并发受各端点配额而非固定线程数限制
+            fan_out = test_count > LIVE_STREAM_LIMIT
+            attach_job(job_manager.submit(
+                "difficulty",
+                f"{problem_text.strip()[:20]} × {test_count}",
+                {
+                    "problem_text": problem_text, "correct_answer": correct_answer, "test_count": test_count,
+                    "adaptive": adaptive, "confidence": confidence, "reuse_samples": reuse_samples,
+                    "model": None if fan_out else selected_model, "api_name": selected_api_name,
+                    "per_endpoint": FAN_OUT_PER_ENDPOINT, "problem_id": bank_problem_id, "notes": notes
+                },
+                run_difficulty_job
+            ))
+    
+    # 显示当前后台任务（新提交的、从任务列表选择的，或地址栏中的任务ID）
+    active_job_id = st.session_state.get("difficulty_job_id") or st.query_params.get("job")
+    active_job = job_manager.get(active_job_id) if active_job_id else None
+    
+    if active_job:
+        job_col, close_col = st.columns([4, 1])
+        job_col.caption(f"🗂️ 后台任务 {active_job['id']} · {job_status_label(active_job)}")
+        if close_col.button("✖️ 关闭", key="close_job"):
+            st.session_state.pop("difficulty_job_id", None)
+            st.query_params.pop("job", None)
+            st.rerun()
+        
+        if active_job["kind"] == "difficulty_queue":
+            render_queue_job(active_job)
+        else:
+            render_difficulty_job(active_job)
     
     else:
         st.info("""
@@ -5,9 +5,13 @@
 import streamlit as st
 import json
 import os
-from openai import OpenAI
+import time
+from llm_gateway import get_client
 from dotenv import load_dotenv
 from database import db
+from llm_telemetry import record_llm_call
+from difficulty_engine import doubao_endpoints
+from difficulty_results import run_and_record
 
 # 加载环境变量（Streamlit 多页面应用中每个页面都需要独立加载）
 load_dotenv()
@@ -43,6 +47,10 @@ tab1, tab2, tab3 = st.tabs(["➕ 添加题目", "📋 浏览题库", "📊 统
 # ==================== 标签页 1：添加题目 ====================
 with tab1:
     st.markdown("### ➕ 添加题目到题库")
+
+    # 上一次添加的结果（添加后 st.rerun() 清空表单，结果保存在 session_state 中到这里再显示）
+    for level, message in st.session_state.pop("add_problem_notices", []):
+        getattr(st, level)(message)
     
     col1, col2 = st.columns([2, 1])
     
@@ -107,7 +115,7 @@ with tab1:
                 
                 for existing_problem in similar_problems[:10]:  # 限制对比数量
                     try:
-                        client = OpenAI(api_key=OPENAI_API_KEY)
+                        client = get_client(OPENAI_API_KEY)
                         
                         prompt = f"""你是一名数学题目查重专家。请判断以下两道题目是否相似。
 
@@ -130,11 +138,13 @@ with tab1:
 - 严格按照 JSON 格式输出
 """
                         
+                        start_time = time.time()
                         response = client.chat.completions.create(
                             model=OPENAI_MODEL,
                             messages=[{"role": "user", "content": prompt}],
                             response_format={"type": "json_object"}
                         )
+                        record_llm_call("openai", OPENAI_MODEL, time.time() - start_time, usage=response.usage)
                         
                         result = json.loads(response.choices[0].message.content)
                         
@@ -188,7 +198,7 @@ with tab1:
                     # 处理标签
                     tags = [tag.strip() for tag in tags_input.split(",")] if tags_input else None
                     
-                    # TODO: 这里可以添加质量审核和难度测试的逻辑
+                    # TODO: 这里可以添加质量审核的逻辑（难度测试在添加成功后进行，结果增量写入该题）
                     test_result = None
                     test_accuracy = None
                     quality_score = None
@@ -211,10 +221,30 @@ with tab1:
                     )
                     
                     if problem_id:
-                        st.success(f"✅ 题目已成功添加到题库！")
-                        st.info(f"题目 ID: {problem_id}")
+                        notices = [("success", "✅ 题目已成功添加到题库！"), ("info", f"题目 ID: {problem_id}")]
+                        
+                        if run_difficulty_test:
+                            if not answer:
+                                notices.append(("warning", "⚠️ 未填写答案，跳过难度测试"))
+                            elif not doubao_endpoints():
+                                notices.append(("warning", "⚠️ 未配置 DOUBAO_API_KEY，跳过难度测试"))
+                            else:
+                                progress_bar = st.progress(0, text="🎯 难度测试中...")
+                                updates = run_and_record(
+                                    problem_id, problem_text, answer, test_times,
+                                    on_progress=lambda done, total: progress_bar.progress(
+                                        done / total, text=f"🎯 难度测试中... {done}/{total}"
+                                    )
+                                )
+                                summary = updates["test_result"]
+                                notices.append((
+                                    "success",
+                                    f"🎯 难度测试完成：{summary['correct']}/{summary['valid']} 次正确"
+                                    f"，难度「{updates.get('difficulty', '未知')}」，已写入题库"
+                                ))
                         
-                        # 清空表单
+                        # 清空表单（结果留到重跑后显示）
+                        st.session_state["add_problem_notices"] = notices
                         st.rerun()
                     else:
                         st.error("❌ 添加失败，请检查数据库连接")
@@ -275,8 +305,14 @@ with tab2:
                     st.markdown(f"**类别**: {problem.get('category', 'N/A')}")
                     st.markdown(f"**难度**: {problem.get('difficulty', 'N/A')}")
                     
-                    if problem.get('test_accuracy'):
+                    if problem.get('test_accuracy') is not None:
                         st.markdown(f"**Doubao正确率**: {problem['test_accuracy']}%")
+                    test_result = problem.get('test_result') or {}
+                    if test_result.get('attempts'):
+                        st.caption(
+                            f"测试 {test_result.get('total')} 次，正确 {test_result.get('correct')}/{test_result.get('valid')}"
+                            f"（{test_result.get('updated_at', '')[:16]}）"
+                        )
                     
                     st.markdown(f"**添加时间**: {problem.get('created_at', 'N/A')[:10]}")
                     
@@ -0,0 +1,86 @@
+"""
+题目索引存储 - 基于 SQLite 按 id 随机访问 JSON / JSONL 数据文件
+
+首次使用时流式导入源文件（内存占用与文件大小无关），之后直接查询索引；
+源文件大小或修改时间变化后自动重建
+"""
+import os
+import json
+import sqlite3
+import threading
+from typing import Dict, Optional
+from jsonl_io import iter_records
+
+INDEX_SUFFIX = ".idx.sqlite"
+INSERT_BATCH_SIZE = 5000
+
+
+class ProblemStore:
+    """按 id 索引的只读记录存储"""
+
+    def __init__(self, source_path: str, index_path: Optional[str] = None):
+        self.source_path = source_path
+        self.index_path = index_path or source_path + INDEX_SUFFIX
+        self._local = threading.local()  # SQLite 连接不能跨线程共享，每个线程各自打开
+        self._ensure_index()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _source_signature(self) -> str:
+        stat = os.stat(self.source_path)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def _ensure_index(self):
+        """索引不存在或源文件已变化时重建（单个事务，中途失败不会留下半个索引）"""
+        signature = self._source_signature()
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("CREATE TABLE IF NOT EXISTS records (id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        row = conn.execute("SELECT value FROM meta WHERE key = 'source_signature'").fetchone()
+        if row and row[0] == signature:
+            return
+
+        print(f"🗂️  正在为 {self.source_path} 建立索引...")
+        count = 0
+        invalid = 0  # 损坏的 JSONL 行（如崩溃时写了一半的最后一行）跳过并计数，不中断建索引
+
+        def skip_invalid(row, error):
+            nonlocal invalid
+            invalid += 1
+
+        with conn:
+            conn.execute("DELETE FROM records")
+            batch = []
+            for item in iter_records(self.source_path, on_invalid=skip_invalid):
+                if 'id' not in item:
+                    continue
+                batch.append((str(item['id']), json.dumps(item, ensure_ascii=False)))
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    conn.executemany("INSERT OR REPLACE INTO records (id, data) VALUES (?, ?)", batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                conn.executemany("INSERT OR REPLACE INTO records (id, data) VALUES (?, ?)", batch)
+                count += len(batch)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('source_signature', ?)", (signature,)
+            )
+        if invalid:
+            print(f"⚠️  跳过 {invalid} 行无法解析的记录")
+        print(f"✅ 索引完成（{count} 条）: {self.index_path}")
+
+    def get(self, record_id) -> Optional[Dict]:
+        row = self._connect().execute("SELECT data FROM records WHERE id = ?", (str(record_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __contains__(self, record_id) -> bool:
+        return self._connect().execute("SELECT 1 FROM records WHERE id = ?", (str(record_id),)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM records").fetchone()[0]
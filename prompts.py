@@ -0,0 +1,66 @@
+"""
+批量任务共用的 Prompt（quality_review_gpt51.py、test.py、job_runner.py、answer_judge.py）
+"""
+
+# 质量审核 Prompt（专注题目质量，不评判答案正确性）
+REVIEW_PROMPT_TEMPLATE = """You are an expert mathematics educator reviewing problem quality.
+
+**IMPORTANT**: Do NOT attempt to solve the problem or verify if the answer is correct. Focus ONLY on evaluating the problem statement itself.
+
+Evaluate this mathematical problem based on these 5 criteria:
+1. **Clarity** (0-2 points): Is the problem statement clear, unambiguous, and easy to understand?
+2. **Mathematical Rigor** (0-2 points): Are mathematical notations, symbols, and expressions used correctly and rigorously?
+3. **Completeness** (0-2 points): Does the problem provide all necessary information? Are conditions sufficient to solve it?
+4. **Solvability** (0-2 points): Does the problem appear to have a well-defined solution (unique or a clear solution set)?
+5. **Educational Value** (0-2 points): Is this a meaningful mathematical problem worth studying?
+
+**Problem to Review:**
+{problem_text}
+
+**Difficulty Level:** {difficulty}
+
+**Your Task:**
+Evaluate the problem based on the 5 criteria above and respond in JSON format:
+
+{{
+  "clarity_score": 0-2,
+  "rigor_score": 0-2,
+  "completeness_score": 0-2,
+  "solvability_score": 0-2,
+  "educational_value_score": 0-2,
+  "total_score": 0-10,
+  "issues": ["list specific issues, if any"],
+  "reasoning": "brief explanation of your evaluation",
+  "recommendation": "ACCEPT (≥7) / BORDERLINE (5-6) / REJECT (<5)"
+}}
+
+**Remember**: Focus on problem quality, NOT answer correctness!
+"""
+
+# 原创度检测 Prompt（联网搜索相似题目，后接题目内容）
+ORIGINALITY_PROMPT = """
+    Don't solve this problem, just search if there are similar problems in the website. 
+    Try to understand the core of the problem and don't just focus on syntax.
+    
+    After searching, please explicitly state:
+    1. "STATUS: DUPLICATE" if you found the same or very similar problem (provide the Source URL).
+    2. "STATUS: ORIGINAL" if you found nothing similar.
+    3. Provide a brief summary of what you found.
+    
+    Here is the problem content:
+    """
+
+# 答案评判 Prompt（本地等价判定无法确定时批量评判，后接按题目分组的待评判答案）
+ANSWER_JUDGE_PROMPT = """You are grading final answers to math problems against the official reference answers.
+
+For each candidate answer below, decide whether it is mathematically equivalent to the reference answer of its problem.
+- Ignore formatting, notation and wording differences; judge only the mathematical content.
+- For proofs or explanations, mark it correct only if it reaches the same conclusion as the reference without a substantive error.
+- A candidate that is incomplete, hedges between several answers, or contradicts the reference is incorrect.
+
+Respond in JSON format with one verdict per candidate id:
+
+{"verdicts": [{"id": 1, "correct": true}, {"id": 2, "correct": false}]}
+
+Candidates to grade:
+"""
@@ -3,12 +3,27 @@
 使用 OpenAI GPT-5.1 对数学题目质量进行审核
 模仿 test.py 的结构，简单稳定
 只评判题目本身的质量，不验证答案正确性
+
+用法:
+    python quality_review_gpt51.py            # 并发审核（--workers 调整并发数，--ordered 保持输出顺序）
+    python quality_review_gpt51.py --batch    # Batch API 模式（本地验证见 batch_stub_server.py）
 """
+import argparse
+import io
+import itertools
 import json
 import os
 import time
 import random
-from openai import OpenAI
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from llm_gateway import get_client
+from jsonl_io import BufferedJsonlWriter, iter_jsonl
+from problem_store import ProblemStore
+from prompts import REVIEW_PROMPT_TEMPLATE
+from llm_telemetry import record_llm_call, start_metrics_server, print_summary, count_tokens, estimate_cost
+from budget_governor import BudgetGovernor
+from difficulty_engine import scaled_correct_count
 
 # ================= 配置区域 =================
 # 1. 配置代理（使用测试成功的代理端口）
@@ -33,44 +48,21 @@ CORRECT_COUNT_THRESHOLD = 4  # 审核正确次数≤4的题目
 INPUT_FILE = "final_benchmark_results.jsonl"
 ORIGINAL_PROBLEMS_FILE = "original_problems_only.json"
 OUTPUT_FILE = "quality_review_results_gpt51.jsonl"
-# ===========================================
-
-client = OpenAI(api_key=api_key)
-
-# 审核Prompt（专注题目质量，不评判答案正确性）
-REVIEW_PROMPT_TEMPLATE = """You are an expert mathematics educator reviewing problem quality.
-
-**IMPORTANT**: Do NOT attempt to solve the problem or verify if the answer is correct. Focus ONLY on evaluating the problem statement itself.
-
-Evaluate this mathematical problem based on these 5 criteria:
-1. **Clarity** (0-2 points): Is the problem statement clear, unambiguous, and easy to understand?
-2. **Mathematical Rigor** (0-2 points): Are mathematical notations, symbols, and expressions used correctly and rigorously?
-3. **Completeness** (0-2 points): Does the problem provide all necessary information? Are conditions sufficient to solve it?
-4. **Solvability** (0-2 points): Does the problem appear to have a well-defined solution (unique or a clear solution set)?
-5. **Educational Value** (0-2 points): Is this a meaningful mathematical problem worth studying?
-
-**Problem to Review:**
-{problem_text}
+BATCH_STATE_FILE = "quality_review_batch_state.json"  # Batch 模式：已提交但未合并的批次
 
-**Difficulty Level:** {difficulty}
+# 6. 并发审核
+DEFAULT_WORKERS = 8  # 默认并发数（受 API 速率限制约束，429 时自动退避重试）
 
-**Your Task:**
-Evaluate the problem based on the 5 criteria above and respond in JSON format:
+# 7. Batch 模式
+BATCH_MAX_REQUESTS = 50000  # 单个批次的请求数上限
+BATCH_POLL_INTERVAL = 60  # 轮询间隔（秒）
 
-{{
-  "clarity_score": 0-2,
-  "rigor_score": 0-2,
-  "completeness_score": 0-2,
-  "solvability_score": 0-2,
-  "educational_value_score": 0-2,
-  "total_score": 0-10,
-  "issues": ["list specific issues, if any"],
-  "reasoning": "brief explanation of your evaluation",
-  "recommendation": "ACCEPT (≥7) / BORDERLINE (5-6) / REJECT (<5)"
-}}
+# 8. 预算控制
+EXPECTED_OUTPUT_TOKENS = 600  # 单题审核输出（含推理）的预估 token 数，用于预留预算
+STATUS_EVERY = 20  # 每写出多少条结果打印一次费用与速率
+# ===========================================
 
-**Remember**: Focus on problem quality, NOT answer correctness!
-"""
+client = get_client(api_key)
 
 def call_gpt_with_retry(prompt, model=MODEL_NAME):
     """
@@ -81,6 +73,7 @@ def call_gpt_with_retry(prompt, model=MODEL_NAME):
     base_wait_time = 10  # 基础等待时间 10秒
 
     for attempt in range(max_retries):
+        start_time = time.time()
         try:
             # 发起请求（使用chat.completions.create，和测试脚本一样）
             response = client.chat.completions.create(
@@ -90,12 +83,17 @@ def call_gpt_with_retry(prompt, model=MODEL_NAME):
                 ],
                 response_format={"type": "json_object"}  # 强制返回JSON
             )
+            record_llm_call("openai", model, time.time() - start_time, usage=response.usage)
             return response.choices[0].message.content
 
         except Exception as e:
             error_str = str(e)
             # 检测是否是速率限制错误 (429)
-            if "429" in error_str or "Rate limit" in error_str:
+            rate_limited = "429" in error_str or "Rate limit" in error_str
+            # 每次尝试各记一条；会被重试的失败尝试计 1 次重试，汇总即为总重试次数
+            record_llm_call("openai", model, time.time() - start_time,
+                            retries=int(rate_limited and attempt < max_retries - 1), success=False)
+            if rate_limited:
                 # 计算等待时间：指数递增 + 随机抖动
                 wait_time = (base_wait_time * (2 ** attempt)) + random.uniform(1, 5)
                 print(f"  ⚠️  触发速率限制 (429)。休眠 {wait_time:.1f}秒后重试 ({attempt+1}/{max_retries})...")
@@ -107,188 +105,448 @@ def call_gpt_with_retry(prompt, model=MODEL_NAME):
     
     return "RATE_LIMIT_EXCEEDED"
 
-def load_original_problems(filepath):
-    """加载原始题目数据"""
+def iter_problems_to_review(filepath):
+    """
+    流式读取需要审核的题目（正确次数 ≤ 阈值，失败的求解按 scaled_correct_count 折算），
+    文件不存在时抛出 FileNotFoundError
+    """
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(filepath)
+    for data in iter_jsonl(filepath):
+        correct_count = scaled_correct_count(data)
+        if correct_count is not None and correct_count <= CORRECT_COUNT_THRESHOLD:
+            yield data
+
+def load_processed_ids(filepath, verbose=True):
+    """断点续传：读取已处理的题目 ID（只保留 ID，不保留结果）"""
+    processed_ids = {item['id'] for item in iter_jsonl(filepath) if 'id' in item}
+    if processed_ids and verbose:
+        print(f"📖 检测到已有进度，已完成 {len(processed_ids)} 题")
+    return processed_ids
+
+def iter_pending(problem_store, processed_ids):
+    """
+    流式 join：逐条读取待审核题目，按 ID 从索引中取题目文本
+    
+    Yields:
+        (problem_data, prompt)
+    """
+    for problem_data in iter_problems_to_review(INPUT_FILE):
+        problem_id = problem_data['id']
+        if problem_id in processed_ids:
+            continue
+        problem_text = (problem_store.get(problem_id) or {}).get('problem_text', '')
+        if not problem_text:
+            print(f"⚠️  题目 {problem_id} 缺少文本，跳过")
+            continue
+        yield problem_data, build_prompt(problem_text, problem_data)
+
+def iter_admitted(pending, governor, cost_multiplier=1.0):
+    """
+    按预算放行待审核题目：本地计数 prompt token 并预留额度，预算不足时停止
+
+    Yields:
+        (problem_data, prompt, ticket)：ticket 在审核结束后交还 governor.settle
+    """
+    for problem_data, prompt in pending:
+        ticket = governor.admit(MODEL_NAME, prompt, EXPECTED_OUTPUT_TOKENS, cost_multiplier)
+        if ticket is None:
+            print(f"💸 预算已用尽，停止提交新任务（已用 ${governor.spent:.4f}，{governor.tokens} tokens）")
+            return
+        yield problem_data, prompt, ticket
+
+def build_prompt(problem_text, problem_data):
+    """构造审核 Prompt"""
+    return REVIEW_PROMPT_TEMPLATE.format(
+        problem_text=problem_text,
+        difficulty=problem_data.get('difficulty', 'Unknown')
+    )
+
+def build_result_entry(problem_data, analysis):
+    """
+    根据模型返回构造结果记录
+
+    Returns:
+        (result_entry, success): success 为 False 表示 API 失败或 JSON 解析失败
+    """
+    problem_id = problem_data['id']
+
+    if analysis == "API_ERROR":
+        # 记录错误但继续
+        return {
+            'id': problem_id,
+            'difficulty': problem_data.get('difficulty', 'Unknown'),
+            'correct_count': problem_data.get('correct_count', 0),
+            'pass_rate': problem_data.get('pass_rate', ''),
+            'ground_truth': problem_data.get('ground_truth', ''),
+            'review': {
+                'total_score': 0,
+                'issues': ['API call failed'],
+                'reasoning': 'System error',
+                'recommendation': 'ERROR'
+            }
+        }, False
+
+    # 解析JSON
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            problems = json.load(f)
-            return {item['id']: item for item in problems}
-    except FileNotFoundError:
-        print(f"❌ 找不到文件: {filepath}")
-        return {}
+        review_result = json.loads(analysis)
+
+        # 打印结果
+        score = review_result.get('total_score', 0)
+        recommendation = review_result.get('recommendation', 'UNKNOWN')
+
+        if 'ACCEPT' in recommendation:
+            status = "✅"
+        elif 'BORDERLINE' in recommendation:
+            status = "⚠️"
+        else:
+            status = "❌"
+
+        print(f"  {status} 评分: {score}/10 | {recommendation}")
+
+        return {
+            'id': problem_id,
+            'difficulty': problem_data.get('difficulty', 'Unknown'),
+            'correct_count': problem_data.get('correct_count', 0),
+            'pass_rate': problem_data.get('pass_rate', ''),
+            'ground_truth': problem_data.get('ground_truth', ''),
+            'review': review_result
+        }, True
+
+    except json.JSONDecodeError:
+        print(f"  ⚠️  JSON解析失败")
+        return {
+            'id': problem_id,
+            'difficulty': problem_data.get('difficulty', 'Unknown'),
+            'correct_count': problem_data.get('correct_count', 0),
+            'review': {
+                'total_score': 0,
+                'issues': ['Failed to parse JSON'],
+                'reasoning': analysis[:200],
+                'recommendation': 'ERROR'
+            }
+        }, False
+
+# ==================== Batch 模式 ====================
+
+def build_batch_request(problem_id, prompt, model=MODEL_NAME):
+    """构造 Batch API 的单行请求（custom_id 即题目 ID）"""
+    return {
+        "custom_id": problem_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "response_format": {"type": "json_object"}
+        }
+    }
+
+def load_batch_state():
+    """读取已提交但尚未合并的批次"""
+    if os.path.exists(BATCH_STATE_FILE):
+        with open(BATCH_STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {"batches": []}
+
+def save_batch_state(state):
+    with open(BATCH_STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+
+def submit_batches(pending, state):
+    """
+    将待审核题目打包为 JSONL 提交到 Batch API
+
+    每提交一个批次就把其 ID 写入 state 并落盘，中途失败时已提交的批次下次运行仍会接续轮询
+
+    Args:
+        pending: (problem_data, prompt, ticket) 的可迭代对象（按批次大小分段读取）
+        state: 批次状态（load_batch_state 的返回值），提交的批次 ID 追加到 state["batches"]
+
+    Returns:
+        Dict[str, list]: 各批次的预算预留凭据（结果合并后交还 governor.settle）
+    """
+    tickets = {}
+    pending = iter(pending)
+    while True:
+        chunk = list(itertools.islice(pending, BATCH_MAX_REQUESTS))
+        if not chunk:
+            break
+        buffer = io.BytesIO()
+        for problem_data, prompt, _ in chunk:
+            line = json.dumps(build_batch_request(problem_data['id'], prompt), ensure_ascii=False)
+            buffer.write((line + '\n').encode('utf-8'))
+
+        input_file = client.files.create(
+            file=("quality_review_batch.jsonl", buffer.getvalue()),
+            purpose="batch"
+        )
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        print(f"📤 已提交批次 {batch.id}（{len(chunk)} 题）")
+        state["batches"].append(batch.id)
+        save_batch_state(state)
+        tickets[batch.id] = [ticket for _, _, ticket in chunk]
+    return tickets
+
+def wait_for_batch(batch_id, poll_interval):
+    """轮询批次直到结束，返回最终的 batch 对象"""
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        progress = f"{counts.completed}/{counts.total}" if counts else "-"
+        print(f"  ⏳ 批次 {batch_id}: {batch.status}（{progress}）")
+        if batch.status in ("completed", "failed", "expired", "cancelled"):
+            return batch
+        time.sleep(poll_interval)
+
+def read_batch_outputs(batch):
+    """读取批次输出，返回 {custom_id: 模型输出或 "API_ERROR"}"""
+    outputs = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = client.files.content(file_id).text
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get('response') or {}
+            if response.get('status_code') == 200 and not record.get('error'):
+                outputs[record['custom_id']] = response['body']['choices'][0]['message']['content']
+                # Batch API 半价计费，单请求延迟未知
+                record_llm_call("openai", response['body'].get('model', MODEL_NAME), None,
+                                usage=response['body'].get('usage'), cost_multiplier=0.5, batch_id=batch.id)
+            else:
+                outputs[record['custom_id']] = "API_ERROR"
+                record_llm_call("openai", MODEL_NAME, None, success=False, batch_id=batch.id)
+    return outputs
+
+def run_batch_mode(pending, benchmark_store, poll_interval, governor):
+    """
+    Batch 模式：提交（或接续已提交的）批次，轮询完成后合并到结果文件
+
+    每个批次的输出记录实际用量后释放该批次的预算预留（接续上次的批次时本次运行没有预留）
+    """
+    state = load_batch_state()
+    tickets = {}
+    if state["batches"]:
+        print(f"📖 检测到 {len(state['batches'])} 个未合并的批次，继续轮询")
+    else:
+        tickets = submit_batches(pending, state)
+
+    success_count = 0
+    error_count = 0
+
+    for batch_id in list(state["batches"]):
+        batch = wait_for_batch(batch_id, poll_interval)
+        outputs = read_batch_outputs(batch) if batch.status == "completed" else {}
+        for ticket in tickets.pop(batch_id, []):
+            governor.settle(ticket)
+        if batch.status != "completed":
+            print(f"🚫 批次 {batch_id} 状态为 {batch.status}，未完成的题目下次运行时会重新提交")
+
+        # 合并结果（与逐题模式相同的追加格式，已处理 ID 不重复写入）
+        processed_ids = load_processed_ids(OUTPUT_FILE, verbose=False)
+        with open(OUTPUT_FILE, 'a', encoding='utf-8') as f:
+            for problem_id, analysis in outputs.items():
+                problem_data = benchmark_store.get(problem_id)
+                if problem_id in processed_ids or problem_data is None:
+                    continue
+                print(f"🔍 题目 ID: {problem_id}")
+                result_entry, ok = build_result_entry(problem_data, analysis)
+                if ok:
+                    success_count += 1
+                else:
+                    error_count += 1
+                f.write(json.dumps(result_entry, ensure_ascii=False) + '\n')
+
+        state["batches"].remove(batch_id)
+        save_batch_state(state)
+
+    if os.path.exists(BATCH_STATE_FILE) and not state["batches"]:
+        os.remove(BATCH_STATE_FILE)
+
+    return success_count, error_count
+
+def run_concurrent_mode(pending, workers, governor, ordered=False, flush_every=50):
+    """
+    并发模式：有界线程池并发审核，结果缓冲后批量追加写入
+
+    Args:
+        pending: (problem_data, prompt, ticket) 的可迭代对象（流式读取，边读边审核）
+        governor: 预算控制（接近上限时降低并发）
+        workers: 并发数
+        ordered: 为 True 时按输入顺序写出结果（输出文件顺序确定）
+        flush_every: 每攒够多少条结果写一次文件
+    """
+    success_count = 0
+    error_count = 0
+    stop_event = threading.Event()
+    window = workers * 4  # 最多提前提交的任务数，限制内存和乱序缓冲
+    pending = iter(pending)
+
+    def review(prompt):
+        if stop_event.is_set():
+            return None
+        analysis = call_gpt_with_retry(prompt)
+        if analysis == "RATE_LIMIT_EXCEEDED":
+            stop_event.set()
+            return None
+        return analysis
+
+    with BufferedJsonlWriter(OUTPUT_FILE, flush_every=flush_every) as writer, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = {}
+        submitted = {}  # 序号 -> (problem_data, ticket)（写出后删除）
+        finished = {}  # 有序模式下等待写出的结果
+        next_submit = 0
+        next_write = 0
+        exhausted = False
+
+        while not exhausted or in_flight:
+            # 补充任务（有序模式下不超过写出位置 + 窗口）
+            # 接近预算上限时按剩余额度降低并发
+            allowed = governor.concurrency(workers)
+            cap = window if allowed == workers else allowed
+            while (not exhausted and len(in_flight) < cap
+                   and (not ordered or next_submit < next_write + window) and not stop_event.is_set()):
+                item = next(pending, None)
+                if item is None:
+                    exhausted = True
+                    break
+                problem_data, prompt, ticket = item
+                future = executor.submit(review, prompt)
+                in_flight[future] = next_submit
+                submitted[next_submit] = (problem_data, ticket)
+                next_submit += 1
+
+            if not in_flight:
+                break
+
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                idx = in_flight.pop(future)
+                finished[idx] = future.result()
+                governor.settle(submitted[idx][1])
+
+            # 写出结果：有序模式只写连续前缀，否则完成即写
+            ready = []
+            if ordered:
+                while next_write in finished:
+                    ready.append(next_write)
+                    next_write += 1
+            else:
+                ready = list(finished)
+            for idx in ready:
+                analysis = finished.pop(idx)
+                problem_data, _ = submitted.pop(idx)
+                if analysis is None:
+                    continue
+                print(f"\n🔍 [{idx+1}] 审核题目 ID: {problem_data['id']}")
+                result_entry, ok = build_result_entry(problem_data, analysis)
+                if ok:
+                    success_count += 1
+                else:
+                    error_count += 1
+                writer.write(result_entry)
+                if (success_count + error_count) % STATUS_EVERY == 0:
+                    print(governor.status_line(success_count + error_count))
+
+            if stop_event.is_set() and not exhausted:
+                print("🚫 多次重试失败，停止提交新任务，等待进行中的任务结束")
+                exhausted = True
+
+    return success_count, error_count
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="使用 OpenAI GPT-5.1 对数学题目质量进行审核")
+    parser.add_argument("--batch", action="store_true",
+                        help="使用 Batch API：打包提交全部待审核题目，轮询完成后合并结果（更便宜，适合大批量离线审核）")
+    parser.add_argument("--poll-interval", type=float, default=BATCH_POLL_INTERVAL,
+                        help=f"Batch 模式轮询间隔秒数（默认 {BATCH_POLL_INTERVAL}）")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"逐题模式的并发数（默认 {DEFAULT_WORKERS}）")
+    parser.add_argument("--ordered", action="store_true", help="按输入顺序写出结果")
+    parser.add_argument("--flush-every", type=int, default=50, help="每攒够多少条结果写一次文件（默认 50）")
+    parser.add_argument("--max-cost", type=float, help="费用上限（USD），用尽后停止提交新任务（默认读取 LLM_BUDGET_USD）")
+    parser.add_argument("--max-tokens", type=float, help="token 上限（输入 + 输出，默认读取 LLM_BUDGET_TOKENS）")
+    parser.add_argument("-y", "--yes", action="store_true", help="跳过确认提示")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    start_metrics_server()
+
     print("=" * 80)
     print("🔍 数学题目质量审核系统 (OpenAI GPT-5.1)")
     print("=" * 80)
     print(f"模型: {MODEL_NAME}")
     print(f"代理: 127.0.0.1:7897")
+    print(f"模式: {'Batch API' if args.batch else f'并发审核（{args.workers} 并发）'}")
     print(f"筛选条件: 正确次数 ≤ {CORRECT_COUNT_THRESHOLD}")
     print(f"评判标准: 只评估题目质量，不验证答案正确性")
     print("=" * 80)
 
-    # 1. 加载原始题目
-    print("\n📂 加载原始题目数据...")
-    original_problems = load_original_problems(ORIGINAL_PROBLEMS_FILE)
-    if not original_problems:
-        return
-    print(f"✅ 已加载 {len(original_problems)} 个原始题目")
-
-    # 2. 加载需要审核的题目（正确次数≤4）
-    print(f"\n📊 筛选需要审核的题目（正确次数 ≤ {CORRECT_COUNT_THRESHOLD}）...")
-    problems_to_review = []
+    # 1. 打开原始题目索引（首次运行或文件变化时流式建立，之后按 ID 随机读取）
+    print("\n📂 打开原始题目索引...")
     try:
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            for line in f:
-                try:
-                    data = json.loads(line)
-                    if data.get('correct_count', 999) <= CORRECT_COUNT_THRESHOLD:
-                        problems_to_review.append(data)
-                except json.JSONDecodeError:
-                    continue
+        problem_store = ProblemStore(ORIGINAL_PROBLEMS_FILE)
     except FileNotFoundError:
+        print(f"❌ 找不到文件: {ORIGINAL_PROBLEMS_FILE}")
+        return
+    if not os.path.exists(INPUT_FILE):
         print(f"❌ 找不到文件: {INPUT_FILE}")
         return
-    
-    print(f"✅ 找到 {len(problems_to_review)} 个需要审核的题目")
 
-    # 3. 断点续传：读取已处理的结果
-    results = []
-    if os.path.exists(OUTPUT_FILE):
-        try:
-            with open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        results.append(json.loads(line))
-                    except json.JSONDecodeError:
-                        continue
-            print(f"📖 检测到已有进度，已完成 {len(results)} 题")
-        except:
-            results = []
-
-    # 获取已处理 ID 集合
-    processed_ids = {item['id'] for item in results if 'id' in item}
-
-    # 4. 确认是否继续
-    remaining = len(problems_to_review) - len(processed_ids)
-    print(f"\n待审核题目: {remaining} 题")
-    
-    if remaining == 0:
+    # 2. 断点续传：读取已处理的 ID
+    processed_ids = load_processed_ids(OUTPUT_FILE)
+
+    # 3. 流式 join 待审核题目（正确次数≤4，跳过已处理和缺少文本的题目）
+    pending = iter_pending(problem_store, processed_ids)
+    first = next(pending, None)
+    if first is None and not (args.batch and load_batch_state()["batches"]):
         print("✅ 所有题目已审核完成！")
         return
-    
-    # 预估成本（GPT-4o: $2.5/1M input + $10/1M output）
-    estimated_cost = remaining * 800 / 1_000_000 * 6.25  # 粗略估计
-    print(f"⚠️  预计成本: ~${estimated_cost:.2f} USD")
-    
-    response = input(f"\n是否继续审核 {remaining} 个题目？(y/n): ")
-    if response.lower() != 'y':
-        print("❌ 已取消")
-        return
+    pending = itertools.chain([first], pending) if first is not None else iter(())
+    governor = BudgetGovernor.from_env(args.max_cost, args.max_tokens)
+
+    # 4. 确认是否继续（统计 prompt token 需要额外扫描一遍，-y 时跳过，直接开始）
+    cost_multiplier = 0.5 if args.batch else 1.0  # Batch API 半价
+    if not args.yes:
+        remaining = 0
+        prompt_tokens = 0
+        for _, prompt in iter_pending(problem_store, processed_ids):
+            remaining += 1
+            prompt_tokens += count_tokens(prompt, MODEL_NAME)
+        output_tokens = remaining * EXPECTED_OUTPUT_TOKENS
+        estimated_cost = estimate_cost(MODEL_NAME, prompt_tokens, output_tokens, cost_multiplier)
+        print(f"\n待审核题目: {remaining} 题")
+        print(f"⚠️  预计成本: ~${estimated_cost:.2f} USD"
+              f"（输入 {prompt_tokens} tokens 本地计数 + 输出约 {output_tokens} tokens）")
+        if governor.max_cost is not None and estimated_cost > governor.max_cost:
+            affordable = int(remaining * governor.max_cost / estimated_cost)
+            print(f"⚠️  预算 ${governor.max_cost:.2f} 预计只够审核约 {affordable} 题，用尽后自动停止")
+
+        response = input(f"\n是否继续审核 {remaining} 个题目？(y/n): ")
+        if response.lower() != 'y':
+            print("❌ 已取消")
+            return
 
     # 5. 开始审核
     print(f"\n🚀 开始审核...")
     print("=" * 80)
 
-    success_count = 0
-    error_count = 0
-
-    for idx, problem_data in enumerate(problems_to_review):
-        problem_id = problem_data['id']
-        
-        # 跳过已处理的
-        if problem_id in processed_ids:
-            continue
-
-        # 获取原始题目文本
-        original = original_problems.get(problem_id, {})
-        problem_text = original.get('problem_text', '')
-        
-        if not problem_text:
-            print(f"⚠️  [{idx+1}/{len(problems_to_review)}] 题目 {problem_id} 缺少文本，跳过")
-            continue
-
-        print(f"\n🔍 [{idx+1}/{len(problems_to_review)}] 审核题目 ID: {problem_id}")
-        
-        # 构造 Prompt
-        prompt = REVIEW_PROMPT_TEMPLATE.format(
-            problem_text=problem_text,
-            difficulty=problem_data.get('difficulty', 'Unknown')
-        )
-        
-        # 调用 API
-        analysis = call_gpt_with_retry(prompt)
-        
-        # 处理失败情况
-        if analysis == "RATE_LIMIT_EXCEEDED":
-            print("🚫 多次重试失败，程序停止")
-            break
-        
-        if analysis == "API_ERROR":
-            error_count += 1
-            # 记录错误但继续
-            result_entry = {
-                'id': problem_id,
-                'difficulty': problem_data.get('difficulty', 'Unknown'),
-                'correct_count': problem_data.get('correct_count', 0),
-                'pass_rate': problem_data.get('pass_rate', ''),
-                'ground_truth': problem_data.get('ground_truth', ''),
-                'review': {
-                    'total_score': 0,
-                    'issues': ['API call failed'],
-                    'reasoning': 'System error',
-                    'recommendation': 'ERROR'
-                }
-            }
-        else:
-            # 解析JSON
-            try:
-                review_result = json.loads(analysis)
-                success_count += 1
-                
-                # 打印结果
-                score = review_result.get('total_score', 0)
-                recommendation = review_result.get('recommendation', 'UNKNOWN')
-                
-                if 'ACCEPT' in recommendation:
-                    status = "✅"
-                elif 'BORDERLINE' in recommendation:
-                    status = "⚠️"
-                else:
-                    status = "❌"
-                
-                print(f"  {status} 评分: {score}/10 | {recommendation}")
-                
-                result_entry = {
-                    'id': problem_id,
-                    'difficulty': problem_data.get('difficulty', 'Unknown'),
-                    'correct_count': problem_data.get('correct_count', 0),
-                    'pass_rate': problem_data.get('pass_rate', ''),
-                    'ground_truth': problem_data.get('ground_truth', ''),
-                    'review': review_result
-                }
-                
-            except json.JSONDecodeError:
-                error_count += 1
-                print(f"  ⚠️  JSON解析失败")
-                result_entry = {
-                    'id': problem_id,
-                    'difficulty': problem_data.get('difficulty', 'Unknown'),
-                    'correct_count': problem_data.get('correct_count', 0),
-                    'review': {
-                        'total_score': 0,
-                        'issues': ['Failed to parse JSON'],
-                        'reasoning': analysis[:200],
-                        'recommendation': 'ERROR'
-                    }
-                }
-        
-        # 实时保存（追加到文件）
-        with open(OUTPUT_FILE, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(result_entry, ensure_ascii=False) + '\n')
-        
-        # 主动休眠，避免频繁调用
-        time.sleep(2)
+    if args.batch:
+        benchmark_store = ProblemStore(INPUT_FILE)
+        admitted = iter_admitted(pending, governor, cost_multiplier)
+        success_count, error_count = run_batch_mode(admitted, benchmark_store, args.poll_interval, governor)
+    else:
+        admitted = iter_admitted(pending, governor)
+        success_count, error_count = run_concurrent_mode(admitted, args.workers, governor, args.ordered, args.flush_every)
 
     # 6. 完成统计
     print("\n" + "=" * 80)
@@ -297,9 +555,10 @@ def main():
     print(f"✅ 成功: {success_count} 题")
     print(f"❌ 失败: {error_count} 题")
     print(f"💾 结果已保存至: {OUTPUT_FILE}")
+    print(governor.status_line(success_count + error_count))
+    print_summary()
     print("=" * 80)
     print("\n🎯 下一步: python3 analyze_review_gemini3.py")
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,119 @@
+"""
+求解样本池 - 同一题目、同一标准答案、同一端点的历次求解结果累积保存，再次测试时只补足差额
+
+键为 (规范化题目哈希, 规范化标准答案哈希, 端点ID)：题目的空白 / 全角差异、答案的 LaTeX 写法差异不影响复用；
+每条样本保存最终答案、对错（评判前为 NULL）与耗时，API 错误和被取消的求解不入池
+
+    SAMPLE_POOL_FILE=sample_pool.db    # SQLite 文件，默认位于当前目录
+"""
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, List, Optional
+from answer_equivalence import extract_answer, normalize_answer
+
+SAMPLE_POOL_FILE = os.getenv("SAMPLE_POOL_FILE", "sample_pool.db")
+FINAL_ANSWER_CHARS = 2000  # 每条样本保存的最终答案字符数
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS samples (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        problem_key TEXT NOT NULL,
+        answer_key TEXT NOT NULL,
+        model TEXT NOT NULL,
+        final_answer TEXT NOT NULL,
+        correct INTEGER,
+        elapsed_time REAL,
+        created_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_samples_key ON samples (problem_key, answer_key, model)",
+]
+
+
+def canonical_problem(problem_text: str) -> str:
+    """题目规范形式：全角转半角、合并空白"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", problem_text)).strip()
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def pool_keys(problem_text: str, correct_answer: str):
+    """(题目键, 标准答案键)"""
+    return _digest(canonical_problem(problem_text)), _digest(normalize_answer(extract_answer(correct_answer)))
+
+
+class SamplePool:
+    """SQLite 样本池（线程安全）"""
+
+    def __init__(self, path: str = SAMPLE_POOL_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+
+    def samples(self, problem_text: str, correct_answer: str, models: List[str]) -> List[Dict]:
+        """某题目 + 标准答案在指定端点上的全部样本（按入池顺序）"""
+        if not models:
+            return []
+        problem_key, answer_key = pool_keys(problem_text, correct_answer)
+        placeholders = ",".join("?" * len(models))
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT id, model, final_answer, correct, elapsed_time, created_at FROM samples
+                WHERE problem_key = ? AND answer_key = ? AND model IN ({placeholders})
+                ORDER BY id
+                """,
+                [problem_key, answer_key, *models]
+            ).fetchall()
+        return [
+            {
+                "id": row[0],
+                "model": row[1],
+                "final_answer": row[2],
+                "correct": None if row[3] is None else bool(row[3]),
+                "elapsed_time": row[4] or 0,
+                "created_at": row[5]
+            }
+            for row in rows
+        ]
+
+    def add(self, problem_text: str, correct_answer: str, model: str, model_answer: str,
+            correct: Optional[bool], elapsed_time: float = 0) -> int:
+        """加入一条样本，返回样本ID"""
+        problem_key, answer_key = pool_keys(problem_text, correct_answer)
+        final_answer = extract_answer(model_answer)[-FINAL_ANSWER_CHARS:]
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                """
+                INSERT INTO samples (problem_key, answer_key, model, final_answer, correct, elapsed_time, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (problem_key, answer_key, model, final_answer, None if correct is None else int(correct),
+                 elapsed_time, time.time())
+            )
+            return cursor.lastrowid
+
+    def set_verdict(self, sample_id: int, correct: bool):
+        """补充样本的对错（如 LLM 评判结果）"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE samples SET correct = ? WHERE id = ?", (int(correct), sample_id))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# 全局实例
+sample_pool = SamplePool()
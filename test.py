@@ -1,8 +1,12 @@
 import json
 import os
 import time
+import sys
 import random
-from openai import OpenAI
+from llm_gateway import get_client
+from jsonl_io import iter_jsonl, read_id_index, open_for_append
+from llm_telemetry import record_llm_call, print_summary
+from prompts import ORIGINALITY_PROMPT
 
 # ================= 配置区域 =================
 # 1. 配置代理
@@ -18,10 +22,12 @@ if not api_key:
 
 # 3. 文件路径
 input_file = "dataset_fixed.json"      # 你的源数据文件
-output_file = "originality_report.json" # 结果保存文件
+output_file = "originality_report.json" # 结果保存文件（最终报告，结束时统一生成）
+journal_file = "originality_report.journal.jsonl"  # 逐条追加的检测记录
+index_file = "originality_report.ids"  # 已处理 ID 索引（断点续传只读这个文件）
 # ===========================================
 
-client = OpenAI(api_key=api_key)
+client = get_client(api_key)
 
 def load_json_data(filepath):
     """
@@ -62,6 +68,7 @@ def call_gpt_with_retry(prompt, model="gpt-5.1-chat-latest"):
     base_wait_time = 10  # 基础等待时间 10秒
 
     for attempt in range(max_retries):
+        start_time = time.time()
         try:
             # 发起请求
             response = client.responses.create(
@@ -69,12 +76,17 @@ def call_gpt_with_retry(prompt, model="gpt-5.1-chat-latest"):
                 tools=[{"type": "web_search"}],
                 input=prompt
             )
+            record_llm_call("openai", model, time.time() - start_time, usage=response.usage)
             return response.output_text
 
         except Exception as e:
             error_str = str(e)
             # 检测是否是速率限制错误 (429)
-            if "429" in error_str or "Rate limit" in error_str:
+            rate_limited = "429" in error_str or "Rate limit" in error_str
+            # 每次尝试各记一条；会被重试的失败尝试计 1 次重试，汇总即为总重试次数
+            record_llm_call("openai", model, time.time() - start_time,
+                            retries=int(rate_limited and attempt < max_retries - 1), success=False)
+            if rate_limited:
                 # 计算等待时间：指数递增 (10s -> 20s -> 40s...) + 随机抖动防止并发冲突
                 wait_time = (base_wait_time * (2 ** attempt)) + random.uniform(1, 5)
                 print(f"\n⚠️ 触发速率限制 (429)。正在休眠 {wait_time:.1f} 秒后重试 (尝试 {attempt+1}/{max_retries})...")
@@ -86,7 +98,37 @@ def call_gpt_with_retry(prompt, model="gpt-5.1-chat-latest"):
     
     return "RATE_LIMIT_EXCEEDED"
 
+def migrate_legacy_report():
+    """旧版本只有 originality_report.json：首次运行时导入到 journal 和索引"""
+    if os.path.exists(journal_file) or not os.path.exists(output_file):
+        return
+    try:
+        with open(output_file, 'r', encoding='utf-8') as f:
+            results = json.load(f)
+    except:
+        return
+    with open(journal_file, 'a', encoding='utf-8') as jf, open(index_file, 'a', encoding='utf-8') as xf:
+        for item in results:
+            jf.write(json.dumps(item, ensure_ascii=False) + '\n')
+            if 'id' in item:
+                xf.write(f"{item['id']}\n")
+    print(f"📦 已将旧报告中的 {len(results)} 条记录导入 {journal_file}")
+
+def finalize_report():
+    """由 journal 一次性生成格式化的最终报告（同一 ID 以最后一条为准）"""
+    results = {}
+    for item in iter_jsonl(journal_file):
+        results[item.get('id')] = item
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(list(results.values()), f, ensure_ascii=False, indent=4)
+    print(f"📝 已生成最终报告 {output_file}（{len(results)} 条）")
+
 def main():
+    # 仅重新生成最终报告
+    if len(sys.argv) > 1 and sys.argv[1] == "finalize":
+        finalize_report()
+        return
+
     # 1. 读取题目
     problems = load_json_data(input_file)
     if not problems:
@@ -94,39 +136,22 @@ def main():
 
     print(f"✅ 成功加载 {len(problems)} 道题目。")
 
-    # 2. 断点续传：读取已处理的结果
-    results = []
-    if os.path.exists(output_file):
-        try:
-            with open(output_file, 'r', encoding='utf-8') as f:
-                results = json.load(f)
-                print(f"📖 检测到已有进度，已跳过前 {len(results)} 条记录。")
-        except:
-            results = []
-
-    # 获取已处理 ID 集合，防止重复跑
-    processed_ids = {item['id'] for item in results if 'id' in item}
-
-    # 3. 基础 Prompt
-    base_prompt = """
-    Don't solve this problem, just search if there are similar problems in the website. 
-    Try to understand the core of the problem and don't just focus on syntax.
-    
-    After searching, please explicitly state:
-    1. "STATUS: DUPLICATE" if you found the same or very similar problem (provide the Source URL).
-    2. "STATUS: ORIGINAL" if you found nothing similar.
-    3. Provide a brief summary of what you found.
-    
-    Here is the problem content:
-    """
+    # 2. 断点续传：只读取 ID 索引，不解析历史结果
+    migrate_legacy_report()
+    processed_ids = read_id_index(index_file)
+    if processed_ids:
+        print(f"📖 检测到已有进度，已跳过 {len(processed_ids)} 条记录。")
+
+    # 4. 循环处理（journal 与索引保持打开，逐条追加）
+    journal = open_for_append(journal_file)
+    index = open_for_append(index_file)
 
-    # 4. 循环处理
     for idx, item in enumerate(problems):
         # 获取 ID，如果没有 ID 则用索引代替
         p_id = item.get('id', f"unknown_{idx}")
         
-        # 跳过已处理的
-        if p_id in processed_ids:
+        # 跳过已处理的（索引中的 ID 均为字符串）
+        if str(p_id) in processed_ids:
             continue
 
         p_text = item.get('problem_text', '')
@@ -137,7 +162,7 @@ def main():
         print(f"🔍 [{idx+1}/{len(problems)}] 正在搜索题目 ID: {p_id} ...")
         
         # 构造完整 Query
-        full_query = base_prompt + f"\n\n{p_text}"
+        full_query = ORIGINALITY_PROMPT + f"\n\n{p_text}"
         
         # === 调用 API (含重试机制) ===
         analysis = call_gpt_with_retry(full_query)
@@ -157,16 +182,24 @@ def main():
             "is_original_guess": is_original,
             "gpt_analysis": analysis
         }
-        results.append(result_entry)
 
-        # 5. 实时保存 (每做完一条就存一次，防止程序中断数据丢失)
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=4)
+        # 5. 实时保存：追加一行到 journal，再登记 ID（先写记录，保证索引中的 ID 一定有结果）
+        journal.write(json.dumps(result_entry, ensure_ascii=False) + '\n')
+        journal.flush()
+        index.write(f"{p_id}\n")
+        index.flush()
         
         # 6. 主动休眠：虽然有重试机制，但平时也稍微慢一点，建议 3~5 秒
         time.sleep(3) 
 
+    journal.close()
+    index.close()
+
+    # 6. 统一生成最终报告
+    finalize_report()
+
     print(f"\n🎉 任务结束！结果已保存至 {output_file}")
+    print_summary()
 
 if __name__ == "__main__":
     main()
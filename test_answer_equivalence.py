@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+测试答案等价判定（answer_equivalence）：ln / Unicode 负号写法、小数近似、超大指数不卡住
+"""
+import time
+from answer_equivalence import check_answer
+
+
+def test_ln_forms():
+    """ln 与 \\ln 都按自然对数处理"""
+    assert check_answer("ln2", r"\ln 2") is True
+    assert check_answer("ln x", r"\ln x") is True
+    assert check_answer("2ln2", r"\ln 4") is True
+
+
+def test_unicode_minus():
+    """U+2212 负号与 ASCII 减号等价"""
+    assert check_answer("−1", "-1") is True
+
+
+def test_decimal_approximation():
+    """精确答案的小数近似在相对误差内判为等价，误差过大仍判为错误"""
+    assert check_answer("1.5707963", r"\pi/2") is True
+    assert check_answer("1e3", "1000") is True
+    assert check_answer("1.58", r"\pi/2") is False
+
+
+def test_exact_values_compared_exactly():
+    """两边都是精确写法时不套用相对误差：大整数差 1、x 加极小常数都判为错误"""
+    assert check_answer("最终答案：1000001", "1000000") is False
+    assert check_answer("x+10^{-7}", "x") is False
+    assert check_answer("1000000", "1000000") is True
+    assert check_answer("1000000.0", "1000000") is True
+
+
+def test_huge_exponent_is_undecided():
+    """超大或嵌套的指数直接视为无法判定，不做长时间计算"""
+    for answer in (r"10^{10^{8}}", r"9^{9^{99}}", r"2^{2^{30}}"):
+        start = time.time()
+        assert check_answer(f"【答案：{answer}】", "5") is None
+        assert time.time() - start < 1
+
+
+if __name__ == "__main__":
+    for test in (test_ln_forms, test_unicode_minus, test_decimal_approximation, test_exact_values_compared_exactly,
+                 test_huge_exponent_is_undecided):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+测试难度测试引擎（difficulty_engine）的统计与调度：提前停止判定、Wilson 区间、pass@k、求解交错调度
+"""
+import math
+from itertools import combinations
+from difficulty_engine import AttemptScheduler, decided_bucket, pass_at_k, pass_at_k_interval, wilson_interval
+
+
+def test_decided_by_exact_bounds():
+    """剩余求解无论对错都不会改变档位时立即停止，不需要最少样本数"""
+    assert decided_bucket(2, 2, 0) == ("简单", "剩余求解已无法改变结论")
+    assert decided_bucket(5, 5, 1) == ("简单", "剩余求解已无法改变结论")
+    # 4/6 与 5/6 分属不同档位，且样本太少、置信区间太宽
+    assert decided_bucket(4, 5, 1) is None
+    # 恰好落在档位下界（0.8）算作该档位
+    assert decided_bucket(4, 5, 0)[0] == "简单"
+    assert decided_bucket(0, 0, 10) is None
+
+
+def test_decided_by_wilson_interval():
+    """置信区间落在同一档位时提前停止；有效次数不足 min_samples 时不使用置信区间"""
+    bucket, reason = decided_bucket(0, 20, 100)
+    assert bucket == "困难"
+    assert "置信区间" in reason
+    assert decided_bucket(0, 2, 100) is None
+    assert decided_bucket(10, 20, 100) is None
+
+
+def test_wilson_interval():
+    """区间包含样本正确率、随样本数收窄，total 为 0 时为 (0, 1)"""
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+    for correct, total in ((0, 10), (3, 10), (10, 10)):
+        low, high = wilson_interval(correct, total)
+        assert 0.0 <= low <= correct / total <= high <= 1.0
+    narrow, wide = wilson_interval(50, 100), wilson_interval(5, 10)
+    assert narrow[1] - narrow[0] < wide[1] - wide[0]
+    assert wilson_interval(5, 10, confidence=0.99)[0] < wilson_interval(5, 10, confidence=0.9)[0]
+
+
+def brute_force_pass_at_k(n, c, k):
+    """枚举所有 k 次组合，统计至少一次正确的比例"""
+    samples = [True] * c + [False] * (n - c)
+    picks = list(combinations(samples, k))
+    return sum(any(pick) for pick in picks) / len(picks)
+
+
+def test_pass_at_k():
+    """与枚举结果一致；k = n 以及 k > n - c 的边界"""
+    for n in range(1, 7):
+        for c in range(n + 1):
+            for k in range(1, n + 1):
+                assert math.isclose(pass_at_k(n, c, k), brute_force_pass_at_k(n, c, k))
+    assert pass_at_k(5, 0, 5) == 0.0
+    assert pass_at_k(5, 1, 5) == 1.0
+    assert pass_at_k(5, 3, 3) == 1.0
+    assert math.isclose(pass_at_k(10, 3, 1), 0.3)
+
+
+def test_pass_at_k_interval():
+    """k = 1 时即 Wilson 区间，k 越大区间越靠近 1"""
+    for bound, expected in zip(pass_at_k_interval(3, 10, 1), wilson_interval(3, 10, 0.95)):
+        assert math.isclose(bound, expected)
+    low1, high1 = pass_at_k_interval(3, 10, 1)
+    low5, high5 = pass_at_k_interval(3, 10, 5)
+    assert low1 < low5 and high1 <= high5 <= 1.0
+
+
+def test_scheduler_round_robin():
+    """各题轮流发放，每道题的第几次从 1 递增，发完返回 None"""
+    scheduler = AttemptScheduler([2, 1, 3])
+    assert scheduler.remaining == 6
+    issued = []
+    while (scheduled := scheduler.next()) is not None:
+        issued.append(scheduled)
+    assert issued == [(0, 1), (1, 1), (2, 1), (0, 2), (2, 2), (2, 3)]
+    assert scheduler.remaining == 0
+
+
+def test_scheduler_retire():
+    """retire 之后的题目不再发放，也不计入剩余次数"""
+    scheduler = AttemptScheduler([3, 3])
+    assert scheduler.next() == (0, 1)
+    assert scheduler.next() == (1, 1)
+    scheduler.retire(0)
+    assert scheduler.remaining == 2
+    assert [scheduler.next(), scheduler.next(), scheduler.next()] == [(1, 2), (1, 3), None]
+
+
+def test_scheduler_next_batch():
+    """同一道题一次发放最多 size 次，最后一批只发剩余次数，题目之间仍轮流"""
+    scheduler = AttemptScheduler([5, 2])
+    assert scheduler.next_batch(4) == (0, [1, 2, 3, 4])
+    assert scheduler.next_batch(4) == (1, [1, 2])
+    assert scheduler.remaining == 1
+    assert scheduler.next_batch(4) == (0, [5])
+    assert scheduler.next_batch(4) is None
+
+
+if __name__ == "__main__":
+    for test in (test_decided_by_exact_bounds, test_decided_by_wilson_interval, test_wilson_interval,
+                 test_pass_at_k, test_pass_at_k_interval, test_scheduler_round_robin, test_scheduler_retire,
+                 test_scheduler_next_batch):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+测试 LLM 录制 / 回放（llm_cassette）：流式响应与流式调用报错的录制 → 回放往返
+"""
+import os
+import tempfile
+from types import SimpleNamespace
+from openai.types.chat import ChatCompletionChunk
+from llm_cassette import Cassette, LatencyModel, RecordedError
+
+MESSAGES = [{"role": "user", "content": "1+1=?"}]
+
+
+def make_chunk(content):
+    return ChatCompletionChunk.model_validate({
+        "id": "chunk", "object": "chat.completion.chunk", "created": 0, "model": "m",
+        "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]
+    })
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        pass
+
+
+def fake_client(create):
+    return SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create)),
+        responses=SimpleNamespace(create=create)
+    )
+
+
+def record_then_replay(create):
+    """用 create 录制一次流式调用，再回放同一请求，返回 (录制时的结果或异常, 回放客户端)"""
+    path = os.path.join(tempfile.mkdtemp(), "cassette.jsonl")
+    recorder = Cassette(path, "record", LatencyModel("none")).wrap(fake_client(create), "https://example.com")
+    try:
+        recorded = "".join(c.choices[0].delta.content for c in recorder.chat.completions.create(
+            model="m", messages=MESSAGES, stream=True))
+    except Exception as e:
+        recorded = e
+    player = Cassette(path, "replay", LatencyModel("none")).wrap(fake_client(None), "https://example.com")
+    return recorded, player
+
+
+def test_stream_round_trip():
+    """流式响应逐块录制，回放得到相同内容"""
+    recorded, player = record_then_replay(lambda **params: FakeStream([make_chunk("【答案："), make_chunk("2】")]))
+    assert recorded == "【答案：2】"
+    replayed = player.chat.completions.create(model="m", messages=MESSAGES, stream=True)
+    assert "".join(c.choices[0].delta.content for c in replayed) == recorded
+
+
+def test_stream_error_before_first_chunk():
+    """流式调用在返回第一块之前报错（如 429）：回放抛出 RecordedError，保留原错误信息供调用方重试"""
+    def rate_limited(**params):
+        raise RuntimeError("Error code: 429 - Rate limit exceeded")
+
+    recorded, player = record_then_replay(rate_limited)
+    assert isinstance(recorded, RuntimeError)
+    try:
+        player.chat.completions.create(model="m", messages=MESSAGES, stream=True)
+    except RecordedError as e:
+        assert "429" in str(e)
+    else:
+        raise AssertionError("回放应抛出 RecordedError")
+
+
+if __name__ == "__main__":
+    for test in (test_stream_round_trip, test_stream_error_before_first_chunk):
+        test()
+        print(f"✅ {test.__name__}")
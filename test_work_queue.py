@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+测试分布式任务队列（work_queue）：租约过期后重新领取、领取次数上限、阶段依赖、归还不计次数
+"""
+import os
+import time
+import tempfile
+from work_queue import WorkQueue
+
+STAGES = ["solve", "review"]
+
+
+def make_queue(max_attempts=3):
+    """临时目录中的 SQLite 队列"""
+    return WorkQueue(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'queue.db')}", max_attempts=max_attempts)
+
+
+def test_lease_expiry():
+    """租约过期的任务可被其他 worker 领取，原 worker 心跳时得知已失去租约"""
+    queue = make_queue()
+    queue.enqueue([({"id": 1}, "solve", None)])
+    [task] = queue.claim("a", STAGES, 10, lease_seconds=0.05)
+    assert task["attempts"] == 1
+    assert queue.claim("b", STAGES, 10) == []
+
+    time.sleep(0.1)
+    [task] = queue.claim("b", STAGES, 10)
+    assert task["attempts"] == 2
+    assert queue.heartbeat("a", [("1", "solve")]) == [("1", "solve")]
+    assert queue.heartbeat("b", [("1", "solve")]) == []
+
+
+def test_max_attempts():
+    """执行失败回到 pending，领取次数用完后标记为 failed"""
+    queue = make_queue(max_attempts=2)
+    queue.enqueue([({"id": 1}, "solve", None)])
+    for attempt in (1, 2):
+        [task] = queue.claim("a", STAGES, 10)
+        assert task["attempts"] == attempt
+        queue.fail("a", "1", "solve", "boom")
+    assert queue.claim("a", STAGES, 10) == []
+    assert queue.counts() == {"solve": {"failed": 1}}
+    assert queue.remaining(STAGES) == 0
+
+
+def test_final_attempt_counted_until_lease_expires():
+    """最后一次领取仍在执行时计入 remaining，租约过期后由 claim 标记为 failed"""
+    queue = make_queue(max_attempts=1)
+    queue.enqueue([({"id": 1}, "solve", None)])
+    queue.claim("a", STAGES, 10, lease_seconds=0.05)
+    assert queue.remaining(STAGES) == 1
+
+    time.sleep(0.1)
+    assert queue.claim("b", STAGES, 10) == []
+    assert queue.counts() == {"solve": {"failed": 1}}
+    assert queue.remaining(STAGES) == 0
+
+
+def test_dependency_gating():
+    """依赖阶段完成后才能领取；依赖最终失败的任务计为 blocked，不计入 remaining"""
+    queue = make_queue(max_attempts=1)
+    queue.enqueue([({"id": 1}, "solve", None), ({"id": 1}, "review", "solve"),
+                   ({"id": 2}, "solve", None), ({"id": 2}, "review", "solve")])
+    claimed = queue.claim("a", STAGES, 10)
+    assert sorted((task["problem_id"], task["stage"]) for task in claimed) == [("1", "solve"), ("2", "solve")]
+    assert queue.remaining(STAGES) == 4
+
+    queue.complete("1", "solve", {"answer": 42})
+    queue.fail("a", "2", "solve", "boom")
+    [task] = queue.claim("a", STAGES, 10)
+    assert (task["problem_id"], task["stage"]) == ("1", "review")
+    assert queue.counts()["review"] == {"leased": 1, "blocked": 1}
+    assert queue.remaining(STAGES) == 1
+
+
+def test_release_does_not_count_attempt():
+    """归还的任务回到 pending，领取次数不增加"""
+    queue = make_queue(max_attempts=1)
+    queue.enqueue([({"id": 1}, "solve", None)])
+    for _ in range(3):
+        [task] = queue.claim("a", STAGES, 10)
+        assert task["attempts"] == 1
+        queue.release("a", "1", "solve")
+    assert queue.remaining(STAGES) == 1
+    assert queue.counts() == {"solve": {"pending": 1}}
+
+
+if __name__ == "__main__":
+    for test in (test_lease_expiry, test_max_attempts, test_final_attempt_counted_until_lease_expires,
+                 test_dependency_gating, test_release_does_not_count_attempt):
+        test()
+        print(f"✅ {test.__name__}")